@@ -0,0 +1,223 @@
+# benchmarks/bench_hot_paths.py
+"""
+Бенчмарк горячих путей бота на локальной замене Bot API (без доступа к сети).
+
+Измеряет:
+- пропускную способность send_template (сообщений в секунду) при рассылке в много чатов;
+- задержку обработчиков диалогов /schedule и /add_template (p50/p95/p99);
+- опоздание срабатывания массовых задач планировщика и время доставки всех отправок.
+
+С --fsm-cache-size 0 диалоги проходят без кеша состояний FSM (как у нескольких экземпляров).
+
+Запуск из корня проекта:
+    python benchmarks/bench_hot_paths.py [--chats 500] [--jobs 1000] [--latency 0.005]
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import prepare_environment, latency_summary, print_report, dump_json
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=500, help="количество чатов в рассылке send_template")
+    parser.add_argument("--rounds", type=int, default=3, help="количество повторов рассылки")
+    parser.add_argument("--flows", type=int, default=100, help="количество прогонов диалогов /schedule и /add_template")
+    parser.add_argument("--jobs", type=int, default=1000, help="количество одновременно срабатывающих задач планировщика")
+    parser.add_argument("--latency", type=float, default=0.005, help="задержка ответа Bot API, с")
+    parser.add_argument("--jitter", type=float, default=0.0, help="случайная добавка к задержке, с")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--fsm-cache-size", type=int, help="размер кеша состояний FSM (по умолчанию FSM_CACHE_SIZE, 0 — без кеша)")
+    parser.add_argument("--respect-limits", action="store_true", help="не снимать лимиты Telegram в ограничителе")
+    parser.add_argument("--json", help="сохранить результаты в JSON-файл")
+    return parser.parse_args()
+
+_update_ids = itertools.count(1)
+
+def make_message_update(text=None, photo=None, user_id=1) -> dict:
+    message = {
+        "message_id": next(_update_ids),
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": "admin"},
+    }
+    if text is not None:
+        message["text"] = text
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    if photo is not None:
+        message["photo"] = photo
+    return {"update_id": next(_update_ids), "message": message}
+
+def make_callback_update(data: str, user_id=1) -> dict:
+    message = {
+        "message_id": next(_update_ids),
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": 42, "is_bot": True, "first_name": "Fake"},
+        "text": "Выберите шаблон:",
+    }
+    callback_query = {
+        "id": str(next(_update_ids)),
+        "from": {"id": user_id, "is_bot": False, "first_name": "admin"},
+        "chat_instance": "bench",
+        "message": message,
+        "data": data,
+    }
+    return {"update_id": next(_update_ids), "callback_query": callback_query}
+
+async def process(dp, data: dict) -> float:
+    """Обработка одного обновления в отдельной задаче, как при опросе. Возвращает длительность."""
+    from aiogram import types
+    started = time.perf_counter()
+    await asyncio.create_task(dp.process_update(types.Update(**data)))
+    return time.perf_counter() - started
+
+async def bench_send_template(bot, fake, chats: int, rounds: int) -> dict:
+    from models.repository import create_template, add_template_chats
+    from utils.send_message import send_template
+
+    with open("images/bench.jpg", "wb") as f:
+        f.write(os.urandom(200_000))
+    text_template = await create_template(name="bench_text", text="Текст рассылки", button_text="Открыть", button_url="https://example.com")
+    photo_template = await create_template(name="bench_photo", text="Подпись", image_path="images/bench.jpg")
+    chat_ids = [-1000000 - i for i in range(chats)]
+    await add_template_chats(text_template.id, chat_ids)
+    await add_template_chats(photo_template.id, chat_ids)
+
+    results = {}
+    for template in (text_template, photo_template):
+        rates = []
+        for _ in range(rounds):
+            fake.reset()
+            result = await send_template(bot, template.id)
+            rates.append(result.rate)
+        results[f"send_template {template.name}"] = {
+            "chats": chats,
+            "msg_per_s_first": rates[0],
+            "msg_per_s_best": max(rates),
+            "uploads_last_round": fake.uploads,
+        }
+    return results
+
+async def bench_flows(dp, fake, flows: int) -> dict:
+    from models.repository import create_template, get_template_by_name
+    from utils.keyboards import template_select_cb
+    flow_template = await create_template(name="flow_template", text="Текст")
+    select_data = template_select_cb.new(action="schedule", id=flow_template.id)
+    steps = {"/schedule": [], "выбор шаблона": [], "выбор расписания": [],
+             "/add_template (все шаги)": [], "приём фото (getFile + скачивание)": []}
+    photo = [{"file_id": "admin-photo", "file_unique_id": "adminphoto", "width": 1280, "height": 720}]
+    for i in range(flows):
+        steps["/schedule"].append(await process(dp, make_message_update("/schedule")))
+        steps["выбор шаблона"].append(await process(dp, make_callback_update(select_data)))
+        steps["выбор расписания"].append(await process(dp, make_message_update("Каждые 12 часов")))
+
+        started = time.perf_counter()
+        await process(dp, make_message_update("/add_template"))
+        await process(dp, make_message_update(f"flow_{i}"))
+        await process(dp, make_message_update("Текст шаблона"))
+        steps["приём фото (getFile + скачивание)"].append(await process(dp, make_message_update(photo=photo)))
+        await process(dp, make_message_update("нет"))
+        steps["/add_template (все шаги)"].append(time.perf_counter() - started)
+        # Ошибка хранилища FSM не видна в задержках: обработчик падает и диалог обрывается
+        if await get_template_by_name(f"flow_{i}") is None:
+            raise RuntimeError(f"Диалог /add_template не завершился: шаблон flow_{i} не создан.")
+    return {f"задержка {name}": latency_summary(values) for name, values in steps.items()}
+
+async def bench_scheduled_jobs(scheduler, fake, jobs: int) -> dict:
+    from apscheduler.events import EVENT_JOB_SUBMITTED
+    from apscheduler.triggers.date import DateTrigger
+    from models.repository import create_template
+    from handlers.timers import send_scheduled_template
+
+    template = await create_template(name="job_template", text="По расписанию")
+    lateness = []
+
+    def on_submitted(event):
+        if event.job_id.startswith("bench_"):
+            now = datetime.now(event.scheduled_run_times[0].tzinfo)
+            lateness.append((now - event.scheduled_run_times[0]).total_seconds())
+
+    scheduler.add_listener(on_submitted, EVENT_JOB_SUBMITTED)
+    run_date = datetime.now().astimezone() + timedelta(seconds=2)
+    for i in range(jobs):
+        scheduler.add_job(send_scheduled_template, DateTrigger(run_date=run_date), args=[template.id], id=f"bench_{i}")
+    fake.reset()
+    fire_time = time.monotonic() + (run_date - datetime.now().astimezone()).total_seconds()
+    while fake.calls["sendMessage"] < jobs:
+        await asyncio.sleep(0.01)
+    completed = time.monotonic() - fire_time
+    scheduler.remove_listener(on_submitted)
+    return {
+        "опоздание срабатывания задач": latency_summary(lateness),
+        "задач": jobs,
+        "доставка всех отправок, с": completed,
+        "отправок в секунду": jobs / completed if completed > 0 else float("nan"),
+    }
+
+async def main(args):
+    from aiogram import Bot, Dispatcher
+    from aiogram.bot.api import TelegramAPIServer
+    from fake_bot_api import FakeBotAPI
+    from models.migrations import migrate_database
+    from config import BOT_TOKEN
+    from handlers.admin import register_handlers_admin
+    from handlers.templates import register_handlers_templates
+    from handlers.chats import register_handlers_chats
+    from handlers.timers import register_handlers_timers, start_scheduler, scheduler, scheduler_leader
+    from utils.fsm_storage import SQLiteStorage
+    from utils.send_message import send_queue
+
+    fake = FakeBotAPI(latency=args.latency, jitter=args.jitter, flood_rate=args.flood_rate)
+    base_url = await fake.start()
+    os.makedirs("images", exist_ok=True)
+    migrate_database()
+
+    bot = Bot(token=BOT_TOKEN, server=TelegramAPIServer.from_base(base_url))
+    storage = SQLiteStorage() if args.fsm_cache_size is None else SQLiteStorage(cache_size=args.fsm_cache_size)
+    dp = Dispatcher(bot, storage=storage)
+    Bot.set_current(bot)
+    Dispatcher.set_current(dp)
+    register_handlers_admin(dp)
+    register_handlers_templates(dp)
+    register_handlers_chats(dp)
+    register_handlers_timers(dp, bot, scheduler)
+    # Как при запуске бота: планировщик запускает задачи после получения аренды
+    start_scheduler()
+    if scheduler_leader is not None:
+        await scheduler_leader.start()
+
+    results = {}
+    results.update(await bench_send_template(bot, fake, args.chats, args.rounds))
+    print_report("send_template", results)
+    flow_results = await bench_flows(dp, fake, args.flows)
+    print_report("Обработчики диалогов", flow_results)
+    job_results = await bench_scheduled_jobs(scheduler, fake, args.jobs)
+    print_report("Массовые задачи планировщика", job_results)
+    results.update(flow_results)
+    results.update(job_results)
+
+    if scheduler_leader is not None:
+        await scheduler_leader.stop()
+    scheduler.shutdown(wait=False)
+    await send_queue.stop()
+    await dp.storage.close()
+    await (await bot.get_session()).close()
+    await fake.stop()
+    if args.json:
+        dump_json(args.json, results)
+
+if __name__ == '__main__':
+    args = parse_args()
+    json_path = os.path.abspath(args.json) if args.json else None
+    workdir = prepare_environment(respect_limits=args.respect_limits)
+    args.json = json_path
+    print(f"Рабочий каталог бенчмарка: {workdir}")
+    asyncio.run(main(args))
@@ -0,0 +1,171 @@
+# benchmarks/bench_scheduler.py
+"""
+Сравнение движков планировщика (SCHEDULER_ENGINE=apscheduler и heap) на большом
+количестве повторяющихся задач. Каждый прогон выполняется в отдельном процессе
+со своей базой данных.
+
+Измеряет:
+- скорость добавления задач (add_job в секунду) и время до записи всех задач в базу;
+- время запуска планировщика с уже сохранёнными задачами (как после перезапуска бота);
+- опоздание срабатывания задач, сроки которых наступают в одном окне, и время до запуска последней;
+- процессорное время и максимальную задержку цикла событий за время срабатывания.
+
+Запуск из корня проекта:
+    python benchmarks/bench_scheduler.py [--jobs 10000,100000] [--window 2]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import prepare_environment, latency_summary, print_report, dump_json
+
+ENGINES = ("apscheduler", "heap")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", default="10000,100000", help="количества задач через запятую")
+    parser.add_argument("--engines", default=",".join(ENGINES), help="движки через запятую")
+    parser.add_argument("--window", type=float, default=2.0, help="окно, в котором наступают сроки всех задач, с")
+    parser.add_argument("--json", help="сохранить результаты в JSON-файл")
+    parser.add_argument("--child", nargs=2, metavar=("ENGINE", "JOBS"), help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+fired = 0
+
+async def bench_job(index: int):
+    """Задача бенчмарка: только учёт срабатывания."""
+    global fired
+    fired += 1
+
+async def wait_until(predicate, timeout: float):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        await asyncio.sleep(0.05)
+    return True
+
+async def measure_loop_lag(stop: asyncio.Event, lags: list):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.01)
+        lags.append(time.perf_counter() - started - 0.01)
+
+async def run_child(engine_name: str, jobs: int, window: float) -> dict:
+    from apscheduler.events import EVENT_JOB_SUBMITTED, EVENT_JOB_MISSED
+    from apscheduler.triggers.interval import IntervalTrigger
+    from database import engine
+    from models.migrations import migrate_database
+    migrate_database()
+    import handlers.timers as timers
+
+    scheduler = timers.scheduler
+    scheduler.start()
+    results = {}
+
+    # Оценка скорости добавления на небольшой пачке, чтобы выбрать момент срабатывания
+    started = time.perf_counter()
+    probe = min(200, jobs)
+    far = datetime.now(timezone.utc) + timedelta(days=1)
+    for i in range(probe):
+        scheduler.add_job(bench_job, IntervalTrigger(hours=1, start_date=far), args=[i], id=f"probe_{i}", next_run_time=far)
+    per_job = (time.perf_counter() - started) / probe
+    for i in range(probe):
+        scheduler.remove_job(f"probe_{i}")
+
+    lead = per_job * jobs * 1.5 + 5
+    fire_at = datetime.now(timezone.utc) + timedelta(seconds=lead)
+    started = time.perf_counter()
+    for i in range(jobs):
+        run_time = fire_at + timedelta(seconds=window * i / jobs)
+        scheduler.add_job(bench_job, IntervalTrigger(hours=1, start_date=run_time), args=[i],
+                          id=f"template_{i}", replace_existing=True, next_run_time=run_time)
+    added = time.perf_counter() - started
+    if engine_name == "heap":
+        await wait_until(lambda: not (scheduler._added or scheduler._moved or scheduler._removed), 600)
+    persisted = time.perf_counter() - started
+    results["add_job в секунду"] = jobs / added
+    results["запись всех задач в базу, с"] = persisted
+
+    lateness = []
+    scheduler.add_listener(
+        lambda event: lateness.append((datetime.now(timezone.utc) - event.scheduled_run_times[-1]).total_seconds()),
+        EVENT_JOB_SUBMITTED,
+    )
+    missed = []
+    scheduler.add_listener(lambda event: missed.append(event.job_id), EVENT_JOB_MISSED)
+    remaining = (fire_at - datetime.now(timezone.utc)).total_seconds()
+    if remaining < 0:
+        results["предупреждение"] = f"добавление задач заняло больше запаса на {-remaining:.1f} с"
+
+    # Измерения начинаются до окна: APScheduler может заблокировать цикл событий
+    # на всё время срабатывания, и ожидание окна проснётся только после него
+    lags = []
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_loop_lag(stop, lags))
+    cpu_started = time.process_time()
+    await wait_until(lambda: fired + len(missed) >= jobs, window + 3600)
+    last_fired = (datetime.now(timezone.utc) - fire_at).total_seconds()
+    cpu = time.process_time() - cpu_started
+    stop.set()
+    await lag_task
+
+    results["опоздание срабатывания"] = latency_summary(lateness)
+    results["пропущено из-за опоздания (misfire)"] = len(missed)
+    results["запуск последней задачи от начала окна, с"] = last_fired
+    results["процессорное время на срабатывание, с"] = cpu
+    results["макс. задержка цикла событий, мс"] = max(lags) * 1000 if lags else 0.0
+    scheduler.shutdown(wait=False)
+    await asyncio.sleep(0)
+
+    # Повторный запуск с сохранёнными задачами
+    if engine_name == "heap":
+        restarted = timers.HeapScheduler()
+    else:
+        from apscheduler.schedulers.asyncio import AsyncIOScheduler
+        from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+        restarted = AsyncIOScheduler(jobstores={'default': SQLAlchemyJobStore(engine=engine)})
+    started = time.perf_counter()
+    restarted.start()
+    await asyncio.sleep(0)
+    results["запуск с сохранёнными задачами, с"] = time.perf_counter() - started
+    restarted.shutdown(wait=False)
+    results["пиковая память процесса, МБ"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return results
+
+def run_parent(args):
+    all_results = {}
+    for jobs in (int(value) for value in args.jobs.split(",")):
+        for engine_name in args.engines.split(","):
+            title = f"{engine_name}, {jobs} задач"
+            print(f"\nПрогон: {title}...", flush=True)
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--window", str(args.window), "--child", engine_name, str(jobs)],
+                check=True, stdout=subprocess.PIPE, text=True,
+            ).stdout
+            results = json.loads(output.strip().splitlines()[-1])
+            print_report(title, results)
+            all_results[title] = results
+    if args.json:
+        dump_json(args.json, all_results)
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.child:
+        engine_name, jobs = args.child
+        os.environ["SCHEDULER_ENGINE"] = engine_name
+        prepare_environment()
+        import logging
+        logging.basicConfig(level=logging.ERROR)
+        results = asyncio.run(run_child(engine_name, int(jobs), args.window))
+        print(json.dumps(results, ensure_ascii=False))
+    else:
+        run_parent(args)
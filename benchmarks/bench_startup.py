@@ -0,0 +1,142 @@
+# benchmarks/bench_startup.py
+"""
+Бенчмарк перезапуска бота: время от запуска процесса до ответа на первое
+обновление. Бот запускается в отдельном процессе в режиме опроса против
+локальной замены Bot API (без доступа к сети); обновление /start отдаётся
+первым же getUpdates после пропуска накопившихся обновлений.
+
+Измеряет:
+- время от запуска процесса до ответа на /start (снаружи процесса);
+- длительность этапов запуска по отчёту самого бота (utils/startup.py);
+- количество запросов к Bot API до начала опроса.
+
+Запуск из корня проекта:
+    python benchmarks/bench_startup.py [--runs 5] [--jobs 10000] [--engine heap] [--latency 0.05]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import prepare_environment, print_report, dump_json
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="количество запусков бота")
+    parser.add_argument("--jobs", type=int, default=10000, help="количество сохранённых задач планировщика")
+    parser.add_argument("--engine", default="apscheduler", choices=("apscheduler", "heap"), help="движок планировщика")
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка ответа Bot API, с")
+    parser.add_argument("--json", help="сохранить результаты в JSON-файл")
+    parser.add_argument("--child", nargs="+", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+def start_update(user_id: int) -> dict:
+    return {"update_id": 1, "message": {
+        "message_id": 1,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": "admin"},
+        "text": "/start",
+        "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+    }}
+
+async def seed_jobs(jobs: int):
+    """Создание шаблона и задач планировщика, которые бот загружает при запуске."""
+    from apscheduler.triggers.interval import IntervalTrigger
+    from models.migrations import migrate_database
+    from models.repository import create_template
+    migrate_database()
+    import handlers.timers as timers
+    template = await create_template(name="startup_template", text="По расписанию")
+    timers.scheduler.start(paused=True)
+    for i in range(jobs):
+        timers.scheduler.add_job(timers.send_scheduled_template, IntervalTrigger(hours=12), args=[template.id],
+                                 id=f"template_{i}", replace_existing=True)
+    await asyncio.sleep(0.1)
+    timers.scheduler.shutdown(wait=False)
+
+def run_bot(api_url: str):
+    """Запуск бота как bot.py, но с адресом локальной замены Bot API. Отчёт о запуске — в stdout."""
+    os.environ["BOT_API_URL"] = api_url
+    import bot
+    from aiogram.utils.executor import start_polling
+    start_polling(bot.dp, reset_webhook=False, on_startup=bot.on_startup, on_shutdown=bot.on_shutdown)
+    print(json.dumps({"phases": bot.startup_timer.phases, "first_update": bot.startup_timer.first_update}, ensure_ascii=False))
+
+async def measure_run(args, workdir: str) -> dict:
+    from fake_bot_api import FakeBotAPI
+    admin_id = int(os.environ["ADMIN_ID"])
+    fake = FakeBotAPI(latency=args.latency)
+    api_url = await fake.start()
+    started = time.monotonic()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.abspath(__file__), "--child", "run", api_url,
+        cwd=workdir, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+    )
+    replied_at = None
+    deadline = started + 120
+    while replied_at is None and time.monotonic() < deadline and process.returncode is None:
+        # Обновление приходит, когда бот уже может его получить: накопившиеся до этого пропускаются
+        if fake.calls["deleteWebhook"] and not fake.calls["getUpdates"] and not fake.updates:
+            fake.updates.append(start_update(admin_id))
+        if admin_id in fake.sent_to:
+            replied_at = fake.sent_at[fake.sent_to.index(admin_id)]
+        await asyncio.sleep(0.002)
+    if process.returncode is None:
+        process.send_signal(signal.SIGINT)
+    output, _ = await process.communicate()
+    await fake.stop()
+    if replied_at is None:
+        raise RuntimeError("бот не ответил на /start")
+    report = json.loads(output.decode().strip().splitlines()[-1])
+    results = {"до ответа на первое обновление, мс": (replied_at - started) * 1000}
+    for phase, seconds in report["phases"]:
+        results[f"этап: {phase}, мс"] = seconds * 1000
+    results["запросов к Bot API до getUpdates"] = sum(
+        count for method, count in fake.calls.items() if method not in ("getUpdates", "sendMessage")
+    )
+    return results
+
+def summarize(runs: list) -> dict:
+    summary = {}
+    for name in runs[0]:
+        values = [run[name] for run in runs if name in run]
+        summary[name] = {"медиана": statistics.median(values), "макс.": max(values)}
+    return summary
+
+async def run_parent(args):
+    print(f"Рабочий каталог бенчмарка: {os.getcwd()}, движок: {args.engine}, задач: {args.jobs}")
+    subprocess.run([sys.executable, os.path.abspath(__file__), "--child", "seed", str(args.jobs)], check=True)
+    runs = []
+    for index in range(args.runs):
+        results = await measure_run(args, os.getcwd())
+        print_report(f"Запуск {index + 1}", results)
+        runs.append(results)
+    summary = summarize(runs)
+    print_report(f"Итого по {len(runs)} запускам", summary)
+    if args.json:
+        dump_json(args.json, {"запуски": runs, "итого": summary})
+
+if __name__ == '__main__':
+    args = parse_args()
+    os.environ["SCHEDULER_ENGINE"] = args.engine
+    if args.child:
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        if args.child[0] == "seed":
+            import logging
+            logging.basicConfig(level=logging.ERROR)
+            asyncio.get_event_loop().run_until_complete(seed_jobs(int(args.child[1])))
+        else:
+            run_bot(args.child[1])
+    else:
+        json_path = os.path.abspath(args.json) if args.json else None
+        prepare_environment()
+        args.json = json_path
+        asyncio.get_event_loop().run_until_complete(run_parent(args))
@@ -0,0 +1,126 @@
+# benchmarks/bench_transport.py
+"""
+Бенчмарк HTTP-транспорта Bot API (TransportBot) на локальной замене Bot API.
+
+Сравнивает:
+- последовательные отправки sendMessage с новым соединением на каждый запрос
+  (BOT_API_KEEPALIVE=0) и с keep-alive;
+- параллельные отправки через пул соединений (как у воркеров очереди отправки);
+- sendPhoto с загрузкой файла и со ссылкой file:// (локальный сервер Bot API, BOT_API_LOCAL).
+
+Для каждого сценария выводятся сообщения в секунду, задержка запроса (p50/p95/p99)
+и количество TCP-соединений, открытых к серверу. Замена Bot API работает без TLS,
+поэтому выигрыш keep-alive здесь меньше, чем с api.telegram.org, где каждое новое
+соединение — это ещё и TLS-рукопожатие.
+
+Запуск из корня проекта:
+    python benchmarks/bench_transport.py [--requests 500] [--latency 0.005] [--concurrency 8]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import prepare_environment, latency_summary, print_report, dump_json
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500, help="количество запросов sendMessage в сценарии")
+    parser.add_argument("--photos", type=int, default=50, help="количество запросов sendPhoto в сценарии")
+    parser.add_argument("--photo-kb", type=int, default=500, help="размер отправляемого изображения, КБ")
+    parser.add_argument("--latency", type=float, default=0.005, help="задержка ответа Bot API, с")
+    parser.add_argument("--concurrency", type=int, help="параллельных запросов в сценарии с пулом (по умолчанию SEND_QUEUE_WORKERS)")
+    parser.add_argument("--connections", type=int, help="размер пула соединений (по умолчанию BOT_API_CONNECTIONS)")
+    parser.add_argument("--json", help="сохранить результаты в JSON-файл")
+    return parser.parse_args()
+
+async def run_requests(fake, make_request, count: int, concurrency: int = 1) -> dict:
+    """Выполнение count запросов не более чем по concurrency одновременно."""
+    fake.reset()
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(index: int):
+        async with semaphore:
+            started = time.perf_counter()
+            await make_request(index)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(count)))
+    elapsed = time.perf_counter() - started
+    summary = latency_summary(latencies)
+    return {
+        "msgs_per_s": count / elapsed,
+        "p50_ms": summary["p50_ms"],
+        "p95_ms": summary["p95_ms"],
+        "p99_ms": summary["p99_ms"],
+        "tcp_connections": len(fake.connections),
+    }
+
+async def bench_messages(fake, base_url: str, requests: int, concurrency: int, connections: int) -> dict:
+    from utils.transport import TransportBot
+    from config import BOT_TOKEN
+    scenarios = [
+        ("последовательно, соединение на запрос", dict(keepalive=0), 1),
+        ("последовательно, keep-alive", dict(), 1),
+        (f"пул {connections}, параллельно {concurrency}", dict(), concurrency),
+    ]
+    results = {}
+    for name, options, parallel in scenarios:
+        bot = TransportBot(token=BOT_TOKEN, api_url=base_url, connections=connections, **options)
+        # Прогрев: getMe открывает первое соединение и сессию
+        await bot.get_me()
+        results[name] = await run_requests(
+            fake, lambda index: bot.send_message(chat_id=-1000 - index, text="Бенчмарк транспорта"),
+            requests, parallel,
+        )
+        await (await bot.get_session()).close()
+    return results
+
+async def bench_photos(fake, base_url: str, photos: int, photo_kb: int) -> dict:
+    from utils.transport import TransportBot, upload_source
+    from config import BOT_TOKEN
+    path = os.path.abspath("bench_photo.jpg")
+    with open(path, "wb") as f:
+        f.write(os.urandom(photo_kb * 1024))
+    results = {}
+    for name, local_files in (("sendPhoto, загрузка файла", False), ("sendPhoto, file:// (локальный сервер)", True)):
+        bot = TransportBot(token=BOT_TOKEN, api_url=base_url, local_files=local_files)
+        await bot.get_me()
+        results[name] = await run_requests(
+            fake, lambda index: bot.send_photo(chat_id=-1000 - index, photo=upload_source(bot, path)), photos,
+        )
+        results[name]["uploads"] = fake.uploads
+        await (await bot.get_session()).close()
+    return results
+
+async def main(args):
+    from fake_bot_api import FakeBotAPI
+    from config import BOT_API_CONNECTIONS, SEND_QUEUE_WORKERS
+
+    fake = FakeBotAPI(latency=args.latency)
+    base_url = await fake.start()
+    concurrency = args.concurrency or SEND_QUEUE_WORKERS
+    connections = args.connections or BOT_API_CONNECTIONS
+
+    results = await bench_messages(fake, base_url, args.requests, concurrency, connections)
+    print_report("sendMessage", results)
+    photo_results = await bench_photos(fake, base_url, args.photos, args.photo_kb)
+    print_report("sendPhoto", photo_results)
+    results.update(photo_results)
+
+    await fake.stop()
+    if args.json:
+        dump_json(args.json, results)
+
+if __name__ == '__main__':
+    args = parse_args()
+    json_path = os.path.abspath(args.json) if args.json else None
+    workdir = prepare_environment()
+    args.json = json_path
+    print(f"Рабочий каталог бенчмарка: {workdir}")
+    asyncio.run(main(args))
@@ -0,0 +1,64 @@
+# benchmarks/common.py
+"""
+Общие функции бенчмарков: изолированное окружение и статистика.
+"""
+
+import json
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def prepare_environment(respect_limits: bool = False) -> str:
+    """
+    Подготовка окружения до импорта модулей бота: тестовые переменные .env,
+    временный рабочий каталог (база данных и images/ создаются в нём).
+    Без respect_limits лимиты Telegram снимаются, чтобы измерять сам код.
+    Возвращает путь к временному каталогу.
+    """
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault("BOT_TOKEN", "123456:BENCHMARK-TOKEN")
+    os.environ.setdefault("GROUP_ID", "-100")
+    os.environ.setdefault("ADMIN_ID", "1")
+    os.environ.setdefault("BROADCAST_REPORT_TO_ADMIN", "false")
+    if not respect_limits:
+        os.environ.setdefault("RATE_LIMIT_GLOBAL_PER_SECOND", "1000000")
+        os.environ.setdefault("RATE_LIMIT_CHAT_PER_MINUTE", "60000000")
+    workdir = tempfile.mkdtemp(prefix="bot_bench_")
+    os.chdir(workdir)
+    return workdir
+
+def percentile(values, p: float) -> float:
+    """Перцентиль p (0..100) методом ближайшего ранга."""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+def latency_summary(values) -> dict:
+    """Сводка задержек в миллисекундах."""
+    return {
+        "count": len(values),
+        "p50_ms": percentile(values, 50) * 1000,
+        "p95_ms": percentile(values, 95) * 1000,
+        "p99_ms": percentile(values, 99) * 1000,
+        "max_ms": max(values) * 1000 if values else float("nan"),
+    }
+
+def print_report(title: str, results: dict):
+    """Вывод результатов бенчмарка в виде таблицы."""
+    print(f"\n== {title} ==")
+    for name, value in results.items():
+        if isinstance(value, dict):
+            stats = ", ".join(f"{key} {val:.2f}" if isinstance(val, float) else f"{key} {val}" for key, val in value.items())
+            print(f"  {name:<44} {stats}")
+        elif isinstance(value, float):
+            print(f"  {name:<44} {value:.2f}")
+        else:
+            print(f"  {name:<44} {value}")
+
+def dump_json(path: str, results: dict):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
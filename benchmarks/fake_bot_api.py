@@ -0,0 +1,143 @@
+# benchmarks/fake_bot_api.py
+"""
+Локальная замена Telegram Bot API для бенчмарков.
+
+Поддерживает sendMessage, sendPhoto и getFile (плюс скачивание файла),
+остальные методы отвечают успехом. Можно задать искусственную задержку
+ответа и долю ответов 429 Too Many Requests.
+"""
+
+import asyncio
+import itertools
+import random
+import time
+from collections import Counter
+from aiohttp import web
+
+class FakeBotAPI:
+    """
+    Сервер aiohttp, имитирующий Bot API.
+
+    :param latency: задержка ответа в секундах
+    :param jitter: случайная добавка к задержке (0..jitter секунд)
+    :param flood_rate: доля запросов, на которые сервер отвечает 429
+    :param retry_after: значение retry_after в ответах 429
+    :param file_size: размер файла, отдаваемого при скачивании, в байтах
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, flood_rate: float = 0.0,
+                 retry_after: int = 1, file_size: int = 100_000):
+        self.latency = latency
+        self.jitter = jitter
+        self.flood_rate = flood_rate
+        self.retry_after = retry_after
+        self.file_bytes = b"\xff" * file_size
+        self.calls = Counter()       # Успешные вызовы по методам
+        self.floods = Counter()      # Ответы 429 по методам
+        self.uploads = 0             # Загрузки файлов в sendPhoto
+        self.connections = set()     # Адреса клиентов, с которых пришли запросы (одно TCP-соединение — один адрес)
+        self.sent_at = []            # Моменты успешной отправки сообщений (time.monotonic)
+        self.sent_to = []            # Чаты, в которые отправлены сообщения (в порядке sent_at)
+        self.updates = []            # Обновления, которые вернёт следующий getUpdates
+        self._ids = itertools.count(1)
+        self._runner = None
+        self.base_url = None
+
+    def _app(self) -> web.Application:
+        app = web.Application(client_max_size=50 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self._handle_method)
+        app.router.add_get("/file/bot{token}/{path:.+}", self._handle_file)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._runner = web.AppRunner(self._app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+        return self.base_url
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    def reset(self):
+        self.calls.clear()
+        self.floods.clear()
+        self.uploads = 0
+        self.connections.clear()
+        self.sent_at.clear()
+        self.sent_to.clear()
+
+    def _message(self, chat_id, **extra) -> dict:
+        message = {
+            "message_id": next(self._ids),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id or 0), "type": "group"},
+        }
+        message.update(extra)
+        return message
+
+    async def _handle_method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.connections.add(request.transport.get_extra_info("peername"))
+        data = await request.post()
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            await asyncio.sleep(delay)
+        if method in ("sendMessage", "sendPhoto") and self.flood_rate and random.random() < self.flood_rate:
+            self.floods[method] += 1
+            return web.json_response({
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }, status=429)
+
+        self.calls[method] += 1
+        if method == "getMe":
+            result = {"id": 42, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}
+        elif method == "sendMessage":
+            self.sent_at.append(time.monotonic())
+            self.sent_to.append(int(data.get("chat_id", 0)))
+            result = self._message(data.get("chat_id"), text=data.get("text", ""))
+        elif method == "sendPhoto":
+            self.sent_at.append(time.monotonic())
+            photo = data.get("photo")
+            if isinstance(photo, web.FileField):
+                self.uploads += 1
+                file_id = f"fake-photo-{next(self._ids)}"
+            else:
+                file_id = photo
+            result = self._message(data.get("chat_id"), photo=[
+                {"file_id": file_id, "file_unique_id": file_id[-16:], "width": 1280, "height": 720},
+            ])
+            if data.get("caption"):
+                result["caption"] = data["caption"]
+        elif method == "getFile":
+            file_id = data.get("file_id", "file")
+            result = {
+                "file_id": file_id,
+                "file_unique_id": file_id[-16:],
+                "file_size": len(self.file_bytes),
+                "file_path": f"photos/{file_id}.jpg",
+            }
+        elif method == "getUpdates":
+            if not self.updates:
+                # Долгий опрос без обновлений: ответ с задержкой, чтобы клиент не опрашивал сервер непрерывно
+                await asyncio.sleep(min(float(data.get("timeout", 0) or 0), 0.2))
+            result, self.updates = self.updates, []
+        elif method == "getWebhookInfo":
+            result = {"url": "", "has_custom_certificate": False, "pending_update_count": len(self.updates)}
+        elif method == "deleteWebhook":
+            if data.get("drop_pending_updates") in ("true", "True", "1"):
+                self.updates.clear()
+            result = True
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def _handle_file(self, request: web.Request) -> web.Response:
+        self.calls["downloadFile"] += 1
+        return web.Response(body=self.file_bytes, content_type="image/jpeg")
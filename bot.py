@@ -1,16 +1,29 @@
 # bot.py
 
+import time
+
+# Отсчёт этапов запуска начинается до импорта модулей бота
+_imports_started = time.perf_counter()
+
+import asyncio
 import logging
-from aiogram import Bot, Dispatcher
-from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram import Dispatcher
 from aiogram.utils.executor import start_polling
-from config import BOT_TOKEN
+from config import BOT_TOKEN, BOT_MODE, STARTUP_TEST_MESSAGE, SHUTDOWN_TIMEOUT, UNFINISHED_SEND_MAX_AGE
 from database import engine
-from models.models import Base
+from models.migrations import migrate_database
+from models.repository import record_clean_shutdown, take_clean_shutdown
 from handlers.admin import register_handlers_admin
 from handlers.templates import register_handlers_templates
-from handlers.timers import register_handlers_timers, scheduler
-import asyncio
+from handlers.chats import register_handlers_chats
+from handlers.transfer import register_handlers_transfer
+from handlers.timers import register_handlers_timers, start_scheduler, scheduler, scheduler_leader
+from utils.fsm_storage import SQLiteStorage
+from utils.image_store import start_image_gc, stop_image_gc
+from utils.instrumentation import InstrumentedBot, setup_instrumentation, start_monitoring, stop_monitoring
+from utils.send_message import send_queue, pending_broadcasts
+from utils.shutdown import UpdateGate, wait_drained, stop_loop_on_sigterm
+from utils.startup import StartupTimer, FirstUpdateMiddleware
 
 # Инициализация логирования
 logging.basicConfig(
@@ -20,39 +33,136 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-# Инициализация хранилища для FSM
-storage = MemoryStorage()
+startup_timer = StartupTimer(_imports_started)
+
+# Инициализация хранилища для FSM (состояния диалогов сохраняются между перезапусками)
+storage = SQLiteStorage()
 
 # Инициализация бота и диспетчера
-bot = Bot(token=BOT_TOKEN)
+bot = InstrumentedBot(token=BOT_TOKEN)
 dp = Dispatcher(bot, storage=storage)
+startup_timer.mark("создание бота")
 
-# Инициализация базы данных
-Base.metadata.create_all(bind=engine)
+# Инициализация базы данных: применение новых миграций схемы
+migrate_database()
 logger.info("База данных инициализирована.")
+startup_timer.mark("миграции")
 
 # Регистрация обработчиков
 register_handlers_admin(dp)
 register_handlers_templates(dp)
+register_handlers_chats(dp)
+register_handlers_transfer(dp)
 register_handlers_timers(dp, bot, scheduler)
 
+# Учёт обрабатываемых обновлений для штатной остановки
+update_gate = UpdateGate()
+dp.middleware.setup(update_gate)
+
+# Сбор метрик
+setup_instrumentation(dp, scheduler)
+dp.middleware.setup(FirstUpdateMiddleware(startup_timer))
+startup_timer.mark("регистрация обработчиков")
+
+async def reset_pending_updates(dispatcher: Dispatcher):
+    """
+    Удаление вебхука и накопившихся обновлений одним запросом
+    (вместо проверки вебхука и пропуска обновлений отдельными запросами).
+    После штатной остановки не раньше чем UNFINISHED_SEND_MAX_AGE секунд назад
+    (перезапуск) обновления не пропускаются: их не подтвердила остановка бота.
+    """
+    stopped_at = await take_clean_shutdown()
+    restarted = stopped_at is not None and (not UNFINISHED_SEND_MAX_AGE or time.time() - stopped_at <= UNFINISHED_SEND_MAX_AGE)
+    await dispatcher.bot.delete_webhook(drop_pending_updates=not restarted)
+    if restarted:
+        logger.info("Бот перезапущен: обновления, полученные во время перезапуска, будут обработаны.")
+    else:
+        logger.info("Накопившиеся обновления пропущены.")
+
 async def on_startup(dispatcher: Dispatcher):
     """
     Действия при запуске бота.
     """
-    # Отправка тестового сообщения
-    from utils.send_message import send_test_message
-    await send_test_message(bot)
-    logger.info("Тестовое сообщение отправлено при запуске.")
+    startup_timer.mark("подключение к Telegram")
+    if BOT_MODE == 'polling':
+        stop_loop_on_sigterm()
+    await start_monitoring()
+    start_scheduler()
+    startup_tasks = [scheduler_leader.start()] if scheduler_leader is not None else []
+    if BOT_MODE == 'polling':
+        startup_tasks.append(reset_pending_updates(dispatcher))
+    # Запросы к базе и к Telegram выполняются одновременно
+    await asyncio.gather(*startup_tasks)
+    start_image_gc()
+    startup_timer.mark("планировщик и фоновые задачи")
+    # Тестовое сообщение отправляется в фоне и не задерживает приём обновлений
+    if STARTUP_TEST_MESSAGE:
+        from utils.send_message import send_test_message
+        send_queue.spawn(send_test_message(bot))
+    logger.info(f"Бот готов к приёму обновлений: {startup_timer.report()}.")
 
 async def on_shutdown(dispatcher: Dispatcher):
     """
-    Действия при остановке бота.
+    Штатная остановка бота, по порядку:
+    1. новые обновления и запуски задач не принимаются; аренда ведущего больше
+       не возобновляет задачи, но удерживается до шага 3;
+    2. не дольше SHUTDOWN_TIMEOUT секунд дорабатывают обработчики обновлений,
+       рассылки и очередь отправки, затем оставшиеся отправки прерываются;
+    3. недоставленные рассылки записываются в базу и повторяются при следующем
+       запуске (при выборе ведущего — экземпляром, получившим аренду);
+    4. в базу записываются буферы: задачи планировщика, журнал доставок, состояния FSM;
+    5. закрываются сессия Telegram и соединения с базой данных.
     """
-    await bot.close()
+    from utils.delivery_journal import delivery_journal
+    started = time.monotonic()
+    dispatcher.stop_polling()
+    update_gate.close()
+    # Продление аренды останавливается до паузы: иначе оно может снова запустить задачи
+    if scheduler_leader is not None:
+        await scheduler_leader.hold()
+    scheduler.pause()
+
+    drained = await wait_drained(
+        lambda: not update_gate.active and send_queue.idle() and not pending_broadcasts, SHUTDOWN_TIMEOUT,
+    )
+    if not drained:
+        logger.warning(f"За {SHUTDOWN_TIMEOUT:g} с не завершены: обновлений {update_gate.active}, "
+                       f"рассылок {len(pending_broadcasts)}, запросов в очереди {send_queue.qsize()}. Они прерываются.")
+    await send_queue.stop()
+    try:
+        unfinished = await pending_broadcasts.save()
+        if unfinished:
+            logger.warning(f"Незавершённых рассылок записано для повтора при запуске: {unfinished}.")
+    except Exception as e:
+        logger.error(f"Ошибка при записи незавершённых рассылок: {e}")
+
+    if BOT_MODE == 'polling':
+        try:
+            await record_clean_shutdown(time.time())
+        except Exception as e:
+            logger.error(f"Ошибка при записи отметки остановки: {e}")
+
+    # Аренда освобождается после записи рассылок: новый ведущий сразу их повторит
+    if scheduler_leader is not None:
+        await scheduler_leader.stop()
     scheduler.shutdown(wait=False)
-    logger.info("Бот успешно остановлен.")
+    await delivery_journal.close()
+    await dispatcher.storage.close()
+    await stop_monitoring()
+    await stop_image_gc()
+
+    # Сессию закрывает и aiogram после on_shutdown; метод Bot API close здесь
+    # не нужен — он выводит бота с сервера Telegram на 10 минут
+    session = await bot.get_session()
+    await session.close()
+    engine.dispose()
+    logger.info(f"Бот успешно остановлен за {time.monotonic() - started:.2f} с.")
 
 if __name__ == '__main__':
     # Запуск бота
-    start_polling(dp, skip_updates=True, on_startup=on_startup, on_shutdown=on_shutdown)
+    if BOT_MODE == 'webhook':
+        from utils.webhook import start_webhook_mode
+        start_webhook_mode(dp, on_startup=on_startup, on_shutdown=on_shutdown)
+    else:
+        # Ранее установленный вебхук и накопившиеся обновления удаляются в on_startup
+        start_polling(dp, reset_webhook=False, on_startup=on_startup, on_shutdown=on_shutdown)
@@ -11,6 +11,183 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 GROUP_ID = int(os.getenv("GROUP_ID")) if os.getenv("GROUP_ID") else None
 ADMIN_ID = int(os.getenv("ADMIN_ID")) if os.getenv("ADMIN_ID") else None
 
+# Количество потоков (и одновременных соединений) для запросов к базе данных
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+
+# Настройки соединений SQLite: объём файла, отображаемого в память (байт),
+# размер кеша страниц на соединение (КиБ) и сколько миллисекунд ждать
+# освобождения блокировки записи, прежде чем вернуть ошибку
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+# Максимальное количество подготовленных шаблонов в кеше
+TEMPLATE_CACHE_SIZE = int(os.getenv("TEMPLATE_CACHE_SIZE", "1000"))
+
+# Политика пропущенных запусков планировщика: сколько секунд после плановой
+# отправки она ещё допустима и объединять ли накопившиеся запуски в один
+SCHEDULER_MISFIRE_GRACE_TIME = int(os.getenv("SCHEDULER_MISFIRE_GRACE_TIME", "60"))
+SCHEDULER_COALESCE = os.getenv("SCHEDULER_COALESCE", "true").lower() in ("1", "true", "yes")
+
+# Движок планировщика: "apscheduler" (по умолчанию) или "heap" — все задачи
+# в одной куче с общим таймером, рассчитан на десятки тысяч расписаний.
+# SCHEDULER_TICK — точность таймера кучи в секундах: задачи, срок которых
+# наступает в пределах одного тика, запускаются одним пробуждением
+SCHEDULER_ENGINE = os.getenv("SCHEDULER_ENGINE", "apscheduler").lower()
+SCHEDULER_TICK = float(os.getenv("SCHEDULER_TICK", "0.5"))
+
+# Выбор ведущего экземпляра: при запуске нескольких копий бота с общей базой
+# рассылки по расписанию выполняет только держатель аренды. Аренда продлевается
+# каждые LEADER_RENEW_INTERVAL секунд и истекает через LEADER_LEASE_TTL секунд,
+# после чего её забирает резервный экземпляр. 0 — без выбора ведущего
+LEADER_LEASE_TTL = float(os.getenv("LEADER_LEASE_TTL", "10"))
+LEADER_RENEW_INTERVAL = float(os.getenv("LEADER_RENEW_INTERVAL", "3"))
+
+# Окно распределения нагрузки в секундах: каждый шаблон получает постоянный
+# сдвиг внутри окна (по его ID), чтобы расписания "Ежедневно в 12:00" разных
+# шаблонов не срабатывали в одну секунду. 0 — без сдвига
+SCHEDULE_SPREAD_SECONDS = int(os.getenv("SCHEDULE_SPREAD_SECONDS", "0"))
+
+# Лимиты Telegram Bot API: сообщений в секунду на бота и в минуту на один чат
+RATE_LIMIT_GLOBAL_PER_SECOND = float(os.getenv("RATE_LIMIT_GLOBAL_PER_SECOND", "30"))
+RATE_LIMIT_CHAT_PER_MINUTE = float(os.getenv("RATE_LIMIT_CHAT_PER_MINUTE", "20"))
+
+# Очередь отправки: число обработчиков, максимальный размер очереди
+# и число повторов при временных сетевых ошибках
+SEND_QUEUE_WORKERS = int(os.getenv("SEND_QUEUE_WORKERS", "16"))
+SEND_QUEUE_MAX_SIZE = int(os.getenv("SEND_QUEUE_MAX_SIZE", "10000"))
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "5"))
+
+# Отправлять ли администратору отчёт о рассылках по расписанию в несколько чатов
+BROADCAST_REPORT_TO_ADMIN = os.getenv("BROADCAST_REPORT_TO_ADMIN", "true").lower() in ("1", "true", "yes")
+
+# HTTP-сервер метрик Prometheus (METRICS_PORT=0 — сервер не запускается)
+# и период измерения задержки цикла событий, в секундах
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.5"))
+
+# Сторож цикла событий: если цикл не отвечает дольше STALL_THRESHOLD секунд,
+# в лог пишется стек блокирующего кода (0 — сторож не запускается).
+# Профилировщик /profile: период снимков стека и максимальная длительность, в секундах
+STALL_THRESHOLD = float(os.getenv("STALL_THRESHOLD", "0.5"))
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+PROFILE_MAX_SECONDS = int(os.getenv("PROFILE_MAX_SECONDS", "300"))
+
+# Хранилище изображений: перекодирование в JPEG под ограничения Telegram
+# (нужен Pillow), максимальная сторона, качество, число процессов,
+# а также период сборки неиспользуемых файлов в секундах (0 — не запускать)
+IMAGE_RECOMPRESS = os.getenv("IMAGE_RECOMPRESS", "true").lower() in ("1", "true", "yes")
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "2560"))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "1"))
+IMAGE_GC_INTERVAL = int(os.getenv("IMAGE_GC_INTERVAL", "3600"))
+
+# Хранилище состояний FSM: размер кеша в памяти, время жизни неактивного
+# состояния в секундах, период и размер пакета записи в базу данных
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", "1000"))
+FSM_STATE_TTL = int(os.getenv("FSM_STATE_TTL", "86400"))
+FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", "1.0"))
+FSM_FLUSH_BATCH = int(os.getenv("FSM_FLUSH_BATCH", "100"))
+
+# Журнал доставок: период и размер пакета записи в базу данных и сколько
+# дней хранить записи (0 — хранить всегда)
+DELIVERY_FLUSH_INTERVAL = float(os.getenv("DELIVERY_FLUSH_INTERVAL", "2.0"))
+DELIVERY_FLUSH_BATCH = int(os.getenv("DELIVERY_FLUSH_BATCH", "500"))
+DELIVERY_RETENTION_DAYS = int(os.getenv("DELIVERY_RETENTION_DAYS", "30"))
+
+# Количество шаблонов на одной странице списков выбора
+TEMPLATES_PAGE_SIZE = int(os.getenv("TEMPLATES_PAGE_SIZE", "10"))
+
+# Импорт и экспорт шаблонов: сколько шаблонов читается и записывается
+# в базу данных одной транзакцией
+TEMPLATE_IO_BATCH_SIZE = int(os.getenv("TEMPLATE_IO_BATCH_SIZE", "500"))
+
+# Поиск шаблонов через inline-режим: сколько секунд хранить результаты
+# одного запроса и сколько результатов возвращать
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "30"))
+SEARCH_RESULTS_LIMIT = int(os.getenv("SEARCH_RESULTS_LIMIT", "20"))
+
+# Сервер Bot API: пусто — api.telegram.org, иначе адрес собственного сервера
+# telegram-bot-api (например, http://127.0.0.1:8081). BOT_API_LOCAL — сервер запущен
+# с --local на той же машине: изображения передаются ему путём file:// без загрузки,
+# а полученные файлы читаются с диска
+BOT_API_URL = os.getenv("BOT_API_URL", "").rstrip("/")
+BOT_API_LOCAL = os.getenv("BOT_API_LOCAL", "false").lower() in ("1", "true", "yes")
+
+# HTTP-транспорт Bot API: предел одновременных соединений (0 — без предела), сколько
+# секунд держать простаивающее соединение открытым (0 — новое соединение на каждый
+# запрос) и сколько секунд кешировать адрес сервера из DNS (0 — не кешировать)
+BOT_API_CONNECTIONS = int(os.getenv("BOT_API_CONNECTIONS", "32"))
+BOT_API_KEEPALIVE = float(os.getenv("BOT_API_KEEPALIVE", "30"))
+BOT_API_DNS_TTL = int(os.getenv("BOT_API_DNS_TTL", "300"))
+
+# Таймаут запроса к Bot API в секундах (0 — таймаут aiohttp по умолчанию, 5 минут)
+# и отдельные таймауты методов в виде "метод=секунды,метод=секунды"
+BOT_API_TIMEOUT = float(os.getenv("BOT_API_TIMEOUT", "30"))
+
+def _parse_method_timeouts(value: str) -> dict:
+    timeouts = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        method, _, seconds = item.partition("=")
+        try:
+            timeouts[method.strip()] = float(seconds)
+        except ValueError:
+            raise ValueError(f"Ошибка: неверный таймаут '{item}' в BOT_API_METHOD_TIMEOUTS, ожидается метод=секунды.")
+    return timeouts
+
+BOT_API_METHOD_TIMEOUTS = _parse_method_timeouts(os.getenv("BOT_API_METHOD_TIMEOUTS", "sendPhoto=120,sendDocument=120"))
+
+# Режим получения обновлений: "polling" (долгий опрос) или "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+
+# Настройки вебхука: внешний адрес за обратным прокси, путь, секретный токен
+# и адрес, на котором слушает встроенный сервер aiohttp
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "").rstrip("/")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_URL = f"{WEBHOOK_HOST}{WEBHOOK_PATH}"
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "127.0.0.1")
+WEBAPP_PORT = int(os.getenv("WEBAPP_PORT", "8080"))
+
+# Отправлять ли тестовое сообщение в группу при запуске (отправка идёт в фоне
+# и не задерживает начало приёма обновлений)
+STARTUP_TEST_MESSAGE = os.getenv("STARTUP_TEST_MESSAGE", "true").lower() in ("1", "true", "yes")
+
+# Остановка бота: сколько секунд ждать завершения обрабатываемых обновлений и рассылок
+# (менеджер процессов должен ждать дольше, например stop_grace_period в Docker).
+# Недоставленные за это время рассылки повторяются при следующем запуске,
+# (а в режиме polling обрабатываются обновления, пришедшие во время перезапуска),
+# если бот запущен не позже UNFINISHED_SEND_MAX_AGE секунд после остановки (0 — без ограничения)
+SHUTDOWN_TIMEOUT = float(os.getenv("SHUTDOWN_TIMEOUT", "20"))
+UNFINISHED_SEND_MAX_AGE = int(os.getenv("UNFINISHED_SEND_MAX_AGE", "600"))
+
 # Проверка переменных
 if not BOT_TOKEN or not GROUP_ID or not ADMIN_ID:
     raise ValueError("Ошибка: Проверь файл .env — переменные BOT_TOKEN, GROUP_ID или ADMIN_ID отсутствуют.")
+if SCHEDULER_ENGINE not in ("apscheduler", "heap"):
+    raise ValueError("Ошибка: SCHEDULER_ENGINE должен быть 'apscheduler' или 'heap'.")
+if LEADER_LEASE_TTL and LEADER_RENEW_INTERVAL * 2 > LEADER_LEASE_TTL:
+    raise ValueError("Ошибка: LEADER_RENEW_INTERVAL должен быть не больше половины LEADER_LEASE_TTL.")
+if STALL_THRESHOLD < 0:
+    raise ValueError("Ошибка: STALL_THRESHOLD не может быть отрицательным.")
+if PROFILE_SAMPLE_INTERVAL <= 0:
+    raise ValueError("Ошибка: PROFILE_SAMPLE_INTERVAL должен быть больше нуля.")
+if TEMPLATE_IO_BATCH_SIZE <= 0:
+    raise ValueError("Ошибка: TEMPLATE_IO_BATCH_SIZE должен быть больше нуля.")
+if SCHEDULE_SPREAD_SECONDS < 0:
+    raise ValueError("Ошибка: SCHEDULE_SPREAD_SECONDS не может быть отрицательным.")
+if SHUTDOWN_TIMEOUT < 0:
+    raise ValueError("Ошибка: SHUTDOWN_TIMEOUT не может быть отрицательным.")
+if UNFINISHED_SEND_MAX_AGE < 0:
+    raise ValueError("Ошибка: UNFINISHED_SEND_MAX_AGE не может быть отрицательным.")
+if BOT_API_LOCAL and not BOT_API_URL:
+    raise ValueError("Ошибка: BOT_API_LOCAL требует адреса собственного сервера в BOT_API_URL.")
+if min(BOT_API_CONNECTIONS, BOT_API_KEEPALIVE, BOT_API_DNS_TTL, BOT_API_TIMEOUT) < 0:
+    raise ValueError("Ошибка: BOT_API_CONNECTIONS, BOT_API_KEEPALIVE, BOT_API_DNS_TTL и BOT_API_TIMEOUT не могут быть отрицательными.")
+if any(seconds <= 0 for seconds in BOT_API_METHOD_TIMEOUTS.values()):
+    raise ValueError("Ошибка: таймауты в BOT_API_METHOD_TIMEOUTS должны быть больше нуля.")
+if BOT_MODE not in ("polling", "webhook"):
+    raise ValueError("Ошибка: BOT_MODE должен быть 'polling' или 'webhook'.")
+if BOT_MODE == "webhook" and not WEBHOOK_HOST:
+    raise ValueError("Ошибка: для режима webhook укажите WEBHOOK_HOST.")
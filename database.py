@@ -1,17 +1,92 @@
 # database.py
 
-from sqlalchemy import create_engine
+import asyncio
+import contextvars
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+from config import DB_POOL_SIZE, SQLITE_MMAP_SIZE, SQLITE_CACHE_SIZE_KB, SQLITE_BUSY_TIMEOUT_MS
+
+logger = logging.getLogger(__name__)
 
 # URL для подключения к базе данных SQLite
 DATABASE_URL = "sqlite:///bot_database.db"
 
-# Создание двигателя SQLAlchemy
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# Создание двигателя SQLAlchemy. Для файловой базы SQLAlchemy по умолчанию
+# открывает новое соединение на каждый запрос (NullPool); пул соединений
+# сохраняет настроенные соединения и их кеш страниц между запросами.
+# Соединений в пуле на одно больше, чем потоков БД: одно нужно потоку
+# цикла событий (хранилище задач APScheduler, миграции при запуске)
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+    poolclass=QueuePool,
+    pool_size=DB_POOL_SIZE + 1,
+    max_overflow=DB_POOL_SIZE,
+)
+
+@event.listens_for(engine, "connect")
+def _configure_connection(dbapi_connection, connection_record):
+    """
+    Настройка каждого нового соединения SQLite.
+    В режиме WAL чтение не блокируется записью, а synchronous=NORMAL
+    синхронизирует журнал с диском только при контрольных точках.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.close()
 
 # Создание сессии для взаимодействия с базой данных
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 # Базовый класс для моделей
 Base = declarative_base()
+
+# Пул потоков для запросов к базе данных: синхронные запросы SQLAlchemy
+# выполняются здесь, а не в потоке цикла событий
+db_executor = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix="db")
+
+async def run_in_db(func, *args, **kwargs):
+    """
+    Выполнение синхронной функции работы с базой данных в пуле потоков БД.
+    """
+    loop = asyncio.get_running_loop()
+    # Контекст копируется, чтобы метрики запросов относились к вызвавшему обработчику
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(db_executor, functools.partial(context.run, func, *args, **kwargs))
+
+def get_schema_version(connection) -> int:
+    """Номер последней применённой миграции (PRAGMA user_version)."""
+    return connection.execute(text("PRAGMA user_version")).scalar()
+
+def has_column(connection, table: str, column: str) -> bool:
+    """Проверка наличия столбца в таблице (для миграций, добавляющих столбцы)."""
+    return any(row[1] == column for row in connection.execute(text(f"PRAGMA table_info({table})")))
+
+def apply_migrations(migrations) -> int:
+    """
+    Применение версионированных миграций схемы.
+    migrations — список (номер, описание, функция(connection)) по возрастанию номеров.
+    Номер последней применённой миграции хранится в PRAGMA user_version базы,
+    поэтому при каждом запуске выполняются только новые миграции.
+    Возвращает текущую версию схемы.
+    """
+    with engine.connect() as connection:
+        version = get_schema_version(connection)
+    for number, description, migrate in migrations:
+        if number <= version:
+            continue
+        with engine.begin() as connection:
+            migrate(connection)
+            connection.execute(text(f"PRAGMA user_version = {int(number)}"))
+        version = number
+        logger.info(f"Применена миграция {number}: {description}.")
+    return version
@@ -1,8 +1,15 @@
 # handlers/admin.py
 
+import io
+import time
+from datetime import datetime
 from aiogram import types
 from aiogram.dispatcher import Dispatcher
-from config import ADMIN_ID
+from config import ADMIN_ID, PROFILE_MAX_SECONDS
+from utils.delivery_journal import get_delivery_stats
+from utils.instrumentation import loop_profiler
+from utils.profiling import format_profile
+from utils.template_cache import get_prepared_template_by_name
 import logging
 
 logger = logging.getLogger(__name__)
@@ -19,8 +26,99 @@ async def send_welcome(message: types.Message):
     await message.reply("Добро пожаловать! Я готов к работе.")
     logger.info(f"Администратор с ID {message.from_user.id} запустил бота.")
 
+def format_delivery_stats(stats, hours: int, template_name: str = None) -> str:
+    """Текст ответа на /stats."""
+    scope = f"шаблона '{template_name}'" if template_name else "всех шаблонов"
+    if not stats.total:
+        return f"За последние {hours} ч доставок {scope} не было."
+    lines = [
+        f"Доставки {scope} за последние {hours} ч: {stats.total}, "
+        f"ошибок {stats.failed} ({stats.failed / stats.total:.1%}).",
+        f"Задержка от планового времени: средняя {stats.avg_latency:.2f} с, "
+        f"p95 {stats.p95_latency:.2f} с, максимальная {stats.max_latency:.2f} с.",
+    ]
+    if not template_name:
+        lines.append("\nБольше всего доставок:")
+        for template_id, name, total, failed, avg_latency in stats.by_template:
+            lines.append(f"• {name or f'ID {template_id} (удалён)'}: {total}, ошибок {failed}, "
+                         f"средняя задержка {avg_latency:.2f} с")
+    if stats.recent_errors:
+        lines.append("\nПоследние ошибки:")
+        for template_id, name, chat_id, sent_at, error in stats.recent_errors:
+            lines.append(f"• {datetime.fromtimestamp(sent_at):%d.%m %H:%M:%S} "
+                         f"{name or f'ID {template_id}'} → {chat_id}: {error}")
+    return "\n".join(lines)
+
+async def delivery_stats(message: types.Message):
+    """
+    Команда /stats [часы] [шаблон] — сводка журнала доставок
+    (по умолчанию за последние 24 часа по всем шаблонам).
+    """
+    if message.from_user.id != ADMIN_ID:
+        await message.reply("У вас нет доступа к этому боту.")
+        logger.warning(f"Пользователь с ID {message.from_user.id} попытался использовать /stats без доступа.")
+        return
+    try:
+        args = message.get_args().strip()
+        hours = 24
+        first, _, rest = args.partition(" ")
+        if first.isdigit():
+            hours, args = int(first), rest.strip()
+        template = None
+        if args:
+            template = await get_prepared_template_by_name(args)
+            if not template:
+                await message.reply("Шаблон не найден.")
+                return
+        stats = await get_delivery_stats(time.time() - hours * 3600, template.id if template else None)
+        await message.reply(format_delivery_stats(stats, hours, template.name if template else None))
+        logger.info(f"Администратор запросил статистику доставок за {hours} ч.")
+    except Exception as e:
+        logger.error(f"Ошибка в обработчике /stats: {e}")
+        await message.reply("Произошла ошибка при обработке команды.")
+
+async def profile_loop(message: types.Message):
+    """
+    Команда /profile [секунды] — статистический профиль цикла событий
+    (по умолчанию за 30 секунд). Отчёт отправляется файлом.
+    """
+    if message.from_user.id != ADMIN_ID:
+        await message.reply("У вас нет доступа к этому боту.")
+        logger.warning(f"Пользователь с ID {message.from_user.id} попытался использовать /profile без доступа.")
+        return
+    args = message.get_args().strip()
+    if args and not args.isdigit():
+        await message.reply("Использование: /profile [секунды], например /profile 30")
+        return
+    seconds = int(args) if args else 30
+    if not 1 <= seconds <= PROFILE_MAX_SECONDS:
+        await message.reply(f"Длительность профилирования — от 1 до {PROFILE_MAX_SECONDS} секунд.")
+        return
+    if loop_profiler.running:
+        await message.reply("Профилирование уже выполняется, дождитесь отчёта.")
+        return
+    try:
+        await message.reply(f"Профилирование цикла событий запущено на {seconds} с.")
+        logger.info(f"Администратор запустил профилирование на {seconds} с.")
+        result = await loop_profiler.profile(seconds)
+        busy = result.samples - result.idle
+        caption = f"Профиль за {result.seconds:.0f} с: цикл событий занят {busy / max(result.samples, 1):.1%} времени."
+        hottest = result.own.most_common(1)
+        if hottest:
+            caption += f"\nБольше всего времени: {hottest[0][0]}"
+        report = io.BytesIO(format_profile(result).encode("utf-8"))
+        await message.answer_document(
+            types.InputFile(report, filename=f"profile_{datetime.now():%Y%m%d_%H%M%S}.txt"),
+            caption=caption[:1024],
+        )
+    except Exception as e:
+        logger.error(f"Ошибка в обработчике /profile: {e}")
+        await message.reply("Произошла ошибка при обработке команды.")
+
 def register_handlers_admin(dp: Dispatcher):
     """
     Регистрация обработчиков административных команд.
     """
     dp.register_message_handler(send_welcome, commands=['start'], state="*")
+    dp.register_message_handler(delivery_stats, commands=['stats'], state="*")
+    dp.register_message_handler(profile_loop, commands=['profile'], state="*")
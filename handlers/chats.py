@@ -0,0 +1,120 @@
+# handlers/chats.py
+
+import logging
+from aiogram import types
+from aiogram.dispatcher import Dispatcher
+from config import ADMIN_ID, GROUP_ID
+from models.repository import add_template_chats, remove_template_chat
+from utils.send_message import send_template
+from utils.template_cache import template_cache, get_prepared_template_by_name
+
+logger = logging.getLogger(__name__)
+
+def parse_chats_args(args: str):
+    """
+    Разбор аргументов вида "<chat_id>[,<chat_id>...] <название шаблона>".
+    Возвращает (список ID чатов, название шаблона) или (None, None) при ошибке.
+    """
+    parts = args.strip().split(maxsplit=1)
+    if len(parts) != 2:
+        return (None, None)
+    try:
+        chat_ids = [int(chat_id) for chat_id in parts[0].split(",") if chat_id]
+    except ValueError:
+        return (None, None)
+    return (chat_ids, parts[1].strip()) if chat_ids else (None, None)
+
+async def list_chats(message: types.Message):
+    """
+    Команда /chats шаблон — список чатов рассылки шаблона.
+    """
+    if message.from_user.id != ADMIN_ID:
+        await message.reply("У вас нет доступа к этому боту.")
+        logger.warning(f"Пользователь с ID {message.from_user.id} попытался использовать /chats без доступа.")
+        return
+    template_name = message.get_args().strip()
+    if not template_name:
+        await message.reply("Пожалуйста, укажите название шаблона. Пример: /chats шаблон1")
+        return
+    template = await get_prepared_template_by_name(template_name)
+    if not template:
+        await message.reply("Шаблон не найден.")
+        return
+    if not template.chat_ids:
+        await message.reply(f"У шаблона '{template_name}' нет своих чатов, он отправляется в группу {GROUP_ID}.")
+        return
+    chats = "\n".join(f"- {chat_id}" for chat_id in template.chat_ids)
+    await message.reply(f"Чаты рассылки шаблона '{template_name}' ({len(template.chat_ids)}):\n{chats}")
+
+async def add_chat(message: types.Message):
+    """
+    Команда /add_chat chat_id[,chat_id...] шаблон — добавление чатов в рассылку шаблона.
+    """
+    if message.from_user.id != ADMIN_ID:
+        await message.reply("У вас нет доступа к этому боту.")
+        logger.warning(f"Пользователь с ID {message.from_user.id} попытался использовать /add_chat без доступа.")
+        return
+    chat_ids, template_name = parse_chats_args(message.get_args())
+    if not chat_ids:
+        await message.reply("Пример: /add_chat -100123456789,-100987654321 шаблон1")
+        return
+    template = await get_prepared_template_by_name(template_name)
+    if not template:
+        await message.reply("Шаблон не найден.")
+        return
+    added = await add_template_chats(template.id, chat_ids)
+    template_cache.invalidate(template.id)
+    await message.reply(f"В рассылку шаблона '{template_name}' добавлено чатов: {added}.")
+    logger.info(f"В рассылку шаблона ID {template.id} добавлено чатов: {added}.")
+
+async def remove_chat(message: types.Message):
+    """
+    Команда /remove_chat chat_id шаблон — удаление чата из рассылки шаблона.
+    """
+    if message.from_user.id != ADMIN_ID:
+        await message.reply("У вас нет доступа к этому боту.")
+        logger.warning(f"Пользователь с ID {message.from_user.id} попытался использовать /remove_chat без доступа.")
+        return
+    chat_ids, template_name = parse_chats_args(message.get_args())
+    if not chat_ids or len(chat_ids) != 1:
+        await message.reply("Пример: /remove_chat -100123456789 шаблон1")
+        return
+    template = await get_prepared_template_by_name(template_name)
+    if not template:
+        await message.reply("Шаблон не найден.")
+        return
+    if not await remove_template_chat(template.id, chat_ids[0]):
+        await message.reply(f"Чат {chat_ids[0]} не входит в рассылку шаблона '{template_name}'.")
+        return
+    template_cache.invalidate(template.id)
+    await message.reply(f"Чат {chat_ids[0]} удалён из рассылки шаблона '{template_name}'.")
+    logger.info(f"Чат {chat_ids[0]} удалён из рассылки шаблона ID {template.id}.")
+
+async def broadcast(message: types.Message):
+    """
+    Команда /broadcast шаблон — немедленная рассылка шаблона с отчётом о скорости.
+    """
+    if message.from_user.id != ADMIN_ID:
+        await message.reply("У вас нет доступа к этому боту.")
+        logger.warning(f"Пользователь с ID {message.from_user.id} попытался использовать /broadcast без доступа.")
+        return
+    template_name = message.get_args().strip()
+    if not template_name:
+        await message.reply("Пожалуйста, укажите название шаблона. Пример: /broadcast шаблон1")
+        return
+    template = await get_prepared_template_by_name(template_name)
+    if not template:
+        await message.reply("Шаблон не найден.")
+        return
+    await message.reply(f"Рассылка шаблона '{template_name}' запущена.")
+    result = await send_template(message.bot, template.id)
+    await message.reply(result.summary() if result else "Шаблон не найден.")
+
+def register_handlers_chats(dp: Dispatcher):
+    """
+    Регистрация обработчиков для управления чатами рассылки.
+    """
+    dp.register_message_handler(list_chats, commands=['chats'], state="*")
+    dp.register_message_handler(add_chat, commands=['add_chat'], state="*")
+    dp.register_message_handler(remove_chat, commands=['remove_chat'], state="*")
+    dp.register_message_handler(broadcast, commands=['broadcast'], state="*")
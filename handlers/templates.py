@@ -1,14 +1,25 @@
 # handlers/templates.py
 
-import os
 import logging
 from aiogram import types
 from aiogram.dispatcher import FSMContext, Dispatcher
 from aiogram.dispatcher.filters.state import State, StatesGroup
-from sqlalchemy.orm import Session
-from database import SessionLocal
-from models.models import Template
+from models.repository import (
+    get_template, get_template_by_name, get_template_chat_ids,
+    create_template, update_template, delete_template,
+    get_variables, set_variable, delete_variable,
+)
 from config import ADMIN_ID
+from utils.media_cache import save_file_id
+from utils.image_store import store_photo, release_image
+from utils.placeholders import (
+    BUILTIN_PLACEHOLDERS, VARIABLE_NAME, compiled_cache, unknown_placeholders, describe_placeholders,
+)
+from utils.keyboards import (
+    build_templates_keyboard, template_actions_keyboard, close_selection, template_select_cb, template_page_cb,
+)
+from models.search import search_templates, search_cache
+from utils.template_cache import template_cache
 
 logger = logging.getLogger(__name__)
 
@@ -22,14 +33,25 @@ class TemplateStates(StatesGroup):
 
 class EditTemplateStates(StatesGroup):
     """Состояния для процесса редактирования шаблона."""
-    waiting_for_template_selection = State()
     waiting_for_field_selection = State()
     waiting_for_new_value = State()
     waiting_for_new_button_url = State()
 
-class DeleteTemplateStates(StatesGroup):
-    """Состояния для процесса удаления шаблона."""
-    waiting_for_template_selection = State()
+async def check_placeholders(message: types.Message, text: str) -> bool:
+    """
+    Проверка подстановок в тексте шаблона при сохранении (а не при каждой отправке).
+    Если есть неизвестные подстановки, администратору отправляется подсказка.
+    """
+    unknown = unknown_placeholders(text, await get_variables())
+    if not unknown:
+        return True
+    await message.reply(
+        "Неизвестные подстановки: " + ", ".join(f"{{{name}}}" for name in unknown) + ".\n"
+        "Задайте переменные командой /set_var или исправьте текст и отправьте его снова.\n\n"
+        "Доступные подстановки:\n" + describe_placeholders()
+    )
+    logger.warning(f"Текст шаблона содержит неизвестные подстановки: {unknown}.")
+    return False
 
 # Функции для добавления шаблона
 
@@ -46,18 +68,19 @@ async def add_template(message: types.Message):
 async def template_name_received(message: types.Message, state: FSMContext):
     """Получение названия шаблона."""
     name = message.text.strip()
-    with SessionLocal() as session:
-        if session.query(Template).filter(Template.name == name).first():
-            await message.reply("Шаблон с таким названием уже существует. Пожалуйста, выберите другое название.")
-            logger.warning(f"Попытка добавить шаблон с существующим названием: '{name}'.")
-            return
-        await state.update_data(name=name)
-    await message.reply("Введите текст сообщения:")
+    if await get_template_by_name(name):
+        await message.reply("Шаблон с таким названием уже существует. Пожалуйста, выберите другое название.")
+        logger.warning(f"Попытка добавить шаблон с существующим названием: '{name}'.")
+        return
+    await state.update_data(name=name)
+    await message.reply("Введите текст сообщения (подстановки вроде {date} и {count} — см. /vars):")
     await TemplateStates.waiting_for_text.set()
     logger.info(f"Название шаблона получено: '{name}'.")
 
 async def template_text_received(message: types.Message, state: FSMContext):
     """Получение текста сообщения."""
+    if not await check_placeholders(message, message.text):
+        return
     await state.update_data(text=message.text)
     await message.reply("Отправьте изображение (или напишите 'нет'):")
     await TemplateStates.waiting_for_image.set()
@@ -69,13 +92,11 @@ async def template_image_received(message: types.Message, state: FSMContext):
     if message.text and message.text.lower() == 'нет':
         image_path = None
     elif message.photo:
-        # Создание папки images, если не существует
-        os.makedirs('images', exist_ok=True)
         # Получение наибольшего размера фото
         photo = message.photo[-1]
-        image_path = f"images/{photo.file_unique_id}.jpg"
-        await photo.download(destination_file=image_path)
-        logger.info(f"Изображение шаблона сохранено по пути: {image_path}.")
+        image_path = await store_photo(photo)
+        # file_id фото от администратора пригоден для повторной отправки без загрузки
+        await save_file_id(image_path, photo.file_id)
     else:
         await message.reply("Пожалуйста, отправьте изображение или напишите 'нет'.")
         logger.warning("Некорректный ввод при запросе изображения.")
@@ -99,17 +120,15 @@ async def template_button_text_received(message: types.Message, state: FSMContex
     
     # Сохранение шаблона без кнопки
     data = await state.get_data()
-    new_template = Template(
+    new_template = await create_template(
         name=data['name'],
         text=data['text'],
         image_path=data['image_path'],
         button_text=button_text,
         button_url=button_url
     )
-    with SessionLocal() as session:
-        session.add(new_template)
-        session.commit()
-        logger.info(f"Новый шаблон '{new_template.name}' сохранён без кнопки.")
+    search_cache.clear()
+    logger.info(f"Новый шаблон '{new_template.name}' сохранён без кнопки.")
     await message.reply("Шаблон сохранён.")
     await state.finish()
 
@@ -117,17 +136,15 @@ async def template_button_url_received(message: types.Message, state: FSMContext
     """Получение URL для кнопки."""
     button_url = message.text.strip()
     data = await state.get_data()
-    new_template = Template(
+    new_template = await create_template(
         name=data['name'],
         text=data['text'],
         image_path=data['image_path'],
         button_text=data.get('button_text'),
         button_url=button_url
     )
-    with SessionLocal() as session:
-        session.add(new_template)
-        session.commit()
-        logger.info(f"Новый шаблон '{new_template.name}' сохранён с кнопкой.")
+    search_cache.clear()
+    logger.info(f"Новый шаблон '{new_template.name}' сохранён с кнопкой.")
     await message.reply("Шаблон сохранён.")
     await state.finish()
 
@@ -139,16 +156,74 @@ async def list_templates(message: types.Message):
         await message.reply("У вас нет доступа к этому боту.")
         logger.warning(f"Пользователь с ID {message.from_user.id} попытался использовать /list_templates без доступа.")
         return
-    with SessionLocal() as session:
-        templates = session.query(Template).all()
-        if not templates:
-            await message.reply("Нет сохранённых шаблонов.")
-            logger.info("Список шаблонов пуст.")
-            return
-        response = "Сохранённые шаблоны:\n" + "\n".join(f"- {template.name}" for template in templates)
-    await message.reply(response)
+    keyboard = await build_templates_keyboard("view")
+    if keyboard is None:
+        await message.reply("Нет сохранённых шаблонов.")
+        logger.info("Список шаблонов пуст.")
+        return
+    await message.reply("Сохранённые шаблоны:", reply_markup=keyboard)
     logger.info("Выведен список сохранённых шаблонов.")
 
+async def view_template(callback: types.CallbackQuery, callback_data: dict):
+    """Просмотр выбранного в списке шаблона."""
+    if callback.from_user.id != ADMIN_ID:
+        await callback.answer("У вас нет доступа к этому боту.", show_alert=True)
+        logger.warning(f"Пользователь с ID {callback.from_user.id} попытался просмотреть шаблон без доступа.")
+        return
+    template = await get_template(int(callback_data['id']))
+    if not template:
+        await callback.answer("Шаблон не найден.", show_alert=True)
+        return
+    chat_ids = await get_template_chat_ids(template.id)
+    lines = [
+        f"Шаблон '{template.name}'",
+        f"Текст: {template.text or '—'}",
+        f"Изображение: {'есть' if template.image_path else 'нет'}",
+        f"Кнопка: {f'{template.button_text} ({template.button_url})' if template.button_text else 'нет'}",
+        f"Чатов рассылки: {len(chat_ids) or 'группа по умолчанию'}",
+    ]
+    await callback.bot.send_message(callback.from_user.id, "\n".join(lines))
+    await callback.answer()
+
+async def templates_page(callback: types.CallbackQuery, callback_data: dict):
+    """Переход на соседнюю страницу списка шаблонов."""
+    if callback.from_user.id != ADMIN_ID:
+        await callback.answer("У вас нет доступа к этому боту.", show_alert=True)
+        return
+    keyboard = await build_templates_keyboard(
+        callback_data['action'], int(callback_data['cursor']), backward=callback_data['direction'] == "prev"
+    )
+    if keyboard is None:
+        await callback.message.edit_text("Нет сохранённых шаблонов.")
+    else:
+        await callback.message.edit_reply_markup(keyboard)
+    await callback.answer()
+
+async def search_templates_inline(inline_query: types.InlineQuery):
+    """Поиск шаблонов по названию и тексту в inline-режиме."""
+    if inline_query.from_user.id != ADMIN_ID:
+        await inline_query.answer([], cache_time=60, is_personal=True)
+        logger.warning(f"Пользователь с ID {inline_query.from_user.id} попытался искать шаблоны без доступа.")
+        return
+    # Выбранный результат отправляется в чат, где набран запрос, поэтому поиск работает
+    # только в личном чате с ботом ("sender")
+    if inline_query.chat_type != "sender":
+        await inline_query.answer([], cache_time=60, is_personal=True,
+                                  switch_pm_text="Поиск шаблонов — в чате с ботом", switch_pm_parameter="search")
+        return
+    templates = await search_templates(inline_query.query)
+    results = [
+        types.InlineQueryResultArticle(
+            id=str(template_id),
+            title=name,
+            description=(text or "")[:100],
+            input_message_content=types.InputTextMessageContent(f"Шаблон '{name}'"),
+            reply_markup=template_actions_keyboard(template_id),
+        )
+        for template_id, name, text in templates
+    ]
+    await inline_query.answer(results, cache_time=5, is_personal=True)
+
 # Функции для удаления шаблона
 
 async def delete_template_start(message: types.Message, state: FSMContext):
@@ -157,38 +232,34 @@ async def delete_template_start(message: types.Message, state: FSMContext):
         await message.reply("У вас нет доступа к этому боту.")
         logger.warning(f"Пользователь с ID {message.from_user.id} попытался использовать /delete_template без доступа.")
         return
-    with SessionLocal() as session:
-        templates = session.query(Template).all()
-        if not templates:
-            await message.reply("Нет шаблонов для удаления.")
-            logger.info("Нет шаблонов для удаления.")
-            return
-        keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
-        for template in templates:
-            keyboard.add(template.name)
+    await state.finish()
+    keyboard = await build_templates_keyboard("delete")
+    if keyboard is None:
+        await message.reply("Нет шаблонов для удаления.")
+        logger.info("Нет шаблонов для удаления.")
+        return
     await message.reply("Выберите шаблон для удаления:", reply_markup=keyboard)
-    await state.set_state(DeleteTemplateStates.waiting_for_template_selection)
     logger.info("Запрошено удаление шаблона. Ожидание выбора шаблона.")
 
-async def delete_template_confirm(message: types.Message, state: FSMContext):
-    """Подтверждение удаления шаблона."""
-    template_name = message.text.strip()
-    with SessionLocal() as session:
-        template = session.query(Template).filter(Template.name == template_name).first()
-        if not template:
-            await message.reply("Шаблон не найден.")
-            logger.warning(f"Шаблон '{template_name}' не найден для удаления.")
-            await state.finish()
-            return
-        session.delete(template)
-        session.commit()
-        # Удаление изображения, если оно есть
-        if template.image_path and os.path.exists(template.image_path):
-            os.remove(template.image_path)
-            logger.info(f"Изображение шаблона '{template_name}' удалено.")
-    await message.reply(f"Шаблон '{template_name}' удалён.", reply_markup=types.ReplyKeyboardRemove())
-    logger.info(f"Шаблон '{template_name}' успешно удалён.")
-    await state.finish()
+async def delete_template_confirm(callback: types.CallbackQuery, callback_data: dict):
+    """Удаление выбранного шаблона."""
+    if callback.from_user.id != ADMIN_ID:
+        await callback.answer("У вас нет доступа к этому боту.", show_alert=True)
+        logger.warning(f"Пользователь с ID {callback.from_user.id} попытался удалить шаблон без доступа.")
+        return
+    template_id = int(callback_data['id'])
+    template = await delete_template(template_id)
+    if not template:
+        await callback.answer("Шаблон не найден.", show_alert=True)
+        logger.warning(f"Шаблон ID {template_id} не найден для удаления.")
+        return
+    template_cache.invalidate(template.id)
+    search_cache.clear()
+    # Удаление изображения, если его не использует другой шаблон
+    await release_image(template.image_path)
+    await close_selection(callback, f"Шаблон '{template.name}' удалён.")
+    await callback.answer()
+    logger.info(f"Шаблон '{template.name}' успешно удалён.")
 
 # Функции для редактирования шаблона
 
@@ -198,36 +269,35 @@ async def edit_template_start(message: types.Message, state: FSMContext):
         await message.reply("У вас нет доступа к этому боту.")
         logger.warning(f"Пользователь с ID {message.from_user.id} попытался использовать /edit_template без доступа.")
         return
-    with SessionLocal() as session:
-        templates = session.query(Template).all()
-        if not templates:
-            await message.reply("Нет шаблонов для редактирования.")
-            logger.info("Нет шаблонов для редактирования.")
-            return
-        keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
-        for template in templates:
-            keyboard.add(template.name)
+    await state.finish()
+    keyboard = await build_templates_keyboard("edit")
+    if keyboard is None:
+        await message.reply("Нет шаблонов для редактирования.")
+        logger.info("Нет шаблонов для редактирования.")
+        return
     await message.reply("Выберите шаблон для редактирования:", reply_markup=keyboard)
-    await EditTemplateStates.waiting_for_template_selection.set()
     logger.info("Запрошено редактирование шаблона. Ожидание выбора шаблона.")
 
-async def edit_template_field_selection(message: types.Message, state: FSMContext):
+async def edit_template_field_selection(callback: types.CallbackQuery, callback_data: dict, state: FSMContext):
     """Обработка выбора шаблона для редактирования."""
-    template_name = message.text.strip()
-    with SessionLocal() as session:
-        template = session.query(Template).filter(Template.name == template_name).first()
-        if not template:
-            await message.reply("Шаблон не найден.")
-            logger.warning(f"Шаблон '{template_name}' не найден для редактирования.")
-            await state.finish()
-            return
-        template_id = template.id
-    await state.update_data(template_id=template_id)
+    if callback.from_user.id != ADMIN_ID:
+        await callback.answer("У вас нет доступа к этому боту.", show_alert=True)
+        logger.warning(f"Пользователь с ID {callback.from_user.id} попытался редактировать шаблон без доступа.")
+        return
+    template_id = int(callback_data['id'])
+    template = await get_template(template_id)
+    if not template:
+        await callback.answer("Шаблон не найден.", show_alert=True)
+        logger.warning(f"Шаблон ID {template_id} не найден для редактирования.")
+        return
+    await state.set_data({'template_id': template_id})
     keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
     keyboard.add("Текст", "Изображение", "Кнопка", "Отмена")
-    await message.reply("Выберите поле для редактирования:", reply_markup=keyboard)
+    await close_selection(callback, f"Редактирование шаблона '{template.name}'.")
+    await callback.bot.send_message(callback.from_user.id, "Выберите поле для редактирования:", reply_markup=keyboard)
+    await callback.answer()
     await EditTemplateStates.waiting_for_field_selection.set()
-    logger.info(f"Выбран шаблон '{template_name}' для редактирования. Ожидание выбора поля.")
+    logger.info(f"Выбран шаблон '{template.name}' для редактирования. Ожидание выбора поля.")
 
 async def edit_template_new_value(message: types.Message, state: FSMContext):
     """Обработка выбора поля для редактирования."""
@@ -248,7 +318,10 @@ async def edit_template_new_value(message: types.Message, state: FSMContext):
     elif field == "изображение":
         await message.reply("Отправьте новое изображение (или напишите 'нет'):", reply_markup=types.ReplyKeyboardRemove())
     else:  # текст
-        await message.reply("Введите новый текст сообщения:", reply_markup=types.ReplyKeyboardRemove())
+        await message.reply(
+            "Введите новый текст сообщения. Доступные подстановки:\n" + describe_placeholders(),
+            reply_markup=types.ReplyKeyboardRemove(),
+        )
     await EditTemplateStates.waiting_for_new_value.set()
     logger.info(f"Поле для редактирования выбрано: '{field}'.")
 
@@ -257,57 +330,55 @@ async def edit_template_save_new_value(message: types.Message, state: FSMContext
     data = await state.get_data()
     template_id = data['template_id']
     field = data['field']
-    with SessionLocal() as session:
-        template = session.query(Template).filter(Template.id == template_id).first()
-        if not template:
-            await message.reply("Шаблон не найден.")
-            logger.error(f"Шаблон с ID {template_id} не найден при попытке редактирования.")
-            await state.finish()
+    template = await get_template(template_id)
+    if not template:
+        await message.reply("Шаблон не найден.")
+        logger.error(f"Шаблон с ID {template_id} не найден при попытке редактирования.")
+        await state.finish()
+        return
+    if field == "текст":
+        if not await check_placeholders(message, message.text.strip()):
             return
-        if field == "текст":
-            template.text = message.text.strip()
-            await message.reply("Текст шаблона успешно обновлён.")
-            logger.info(f"Текст шаблона ID {template_id} обновлён.")
-        elif field == "изображение":
-            if message.text and message.text.lower() == 'нет':
-                # Удаление старого изображения, если оно есть
-                if template.image_path and os.path.exists(template.image_path):
-                    os.remove(template.image_path)
-                    logger.info(f"Старое изображение шаблона ID {template_id} удалено.")
-                template.image_path = None
-                await message.reply("Изображение шаблона удалено.")
-            elif message.photo:
-                # Удаление старого изображения, если оно есть
-                if template.image_path and os.path.exists(template.image_path):
-                    os.remove(template.image_path)
-                    logger.info(f"Старое изображение шаблона ID {template_id} удалено.")
-                # Сохранение нового изображения
-                os.makedirs('images', exist_ok=True)
-                photo = message.photo[-1]
-                image_path = f"images/{photo.file_unique_id}.jpg"
-                await photo.download(destination_file=image_path)
-                template.image_path = image_path
-                await message.reply("Изображение шаблона успешно обновлено.")
-                logger.info(f"Новое изображение шаблона ID {template_id} сохранено по пути: {image_path}.")
-            else:
-                await message.reply("Пожалуйста, отправьте изображение или напишите 'нет'.")
-                logger.warning("Некорректный ввод при обновлении изображения.")
-                return
-        elif field == "кнопка":
-            if message.text and message.text.lower() == 'нет':
-                template.button_text = None
-                template.button_url = None
-                await message.reply("Кнопка шаблона удалена.")
-                logger.info(f"Кнопка шаблона ID {template_id} удалена.")
-            else:
-                template.button_text = message.text.strip()
-                await state.update_data(button_text=template.button_text)
-                await message.reply("Введите новый URL для кнопки:")
-                await EditTemplateStates.waiting_for_new_button_url.set()
-                logger.info(f"Текст кнопки шаблона ID {template_id} обновлён: '{template.button_text}'.")
-                return
-        session.commit()
-        logger.info(f"Шаблон ID {template_id} обновлён.")
+        await update_template(template_id, text=message.text.strip())
+        compiled_cache.invalidate(template_id)
+        search_cache.clear()
+        await message.reply("Текст шаблона успешно обновлён.")
+        logger.info(f"Текст шаблона ID {template_id} обновлён.")
+    elif field == "изображение":
+        if message.text and message.text.lower() == 'нет':
+            await update_template(template_id, image_path=None)
+            # Удаление старого изображения, если его не использует другой шаблон
+            await release_image(template.image_path)
+            await message.reply("Изображение шаблона удалено.")
+        elif message.photo:
+            # Сохранение нового изображения
+            photo = message.photo[-1]
+            image_path = await store_photo(photo)
+            await save_file_id(image_path, photo.file_id)
+            await update_template(template_id, image_path=image_path)
+            if template.image_path != image_path:
+                await release_image(template.image_path)
+            await message.reply("Изображение шаблона успешно обновлено.")
+            logger.info(f"Новое изображение шаблона ID {template_id} сохранено по пути: {image_path}.")
+        else:
+            await message.reply("Пожалуйста, отправьте изображение или напишите 'нет'.")
+            logger.warning("Некорректный ввод при обновлении изображения.")
+            return
+    elif field == "кнопка":
+        if message.text and message.text.lower() == 'нет':
+            await update_template(template_id, button_text=None, button_url=None)
+            await message.reply("Кнопка шаблона удалена.")
+            logger.info(f"Кнопка шаблона ID {template_id} удалена.")
+        else:
+            # Текст кнопки сохраняется вместе с URL на следующем шаге
+            button_text = message.text.strip()
+            await state.update_data(button_text=button_text)
+            await message.reply("Введите новый URL для кнопки:")
+            await EditTemplateStates.waiting_for_new_button_url.set()
+            logger.info(f"Получен новый текст кнопки шаблона ID {template_id}: '{button_text}'.")
+            return
+    template_cache.invalidate(template_id)
+    logger.info(f"Шаблон ID {template_id} обновлён.")
     await state.finish()
 
 async def edit_template_save_button_url(message: types.Message, state: FSMContext):
@@ -315,19 +386,62 @@ async def edit_template_save_button_url(message: types.Message, state: FSMContex
     new_button_url = message.text.strip()
     data = await state.get_data()
     template_id = data['template_id']
-    with SessionLocal() as session:
-        template = session.query(Template).filter(Template.id == template_id).first()
-        if not template:
-            await message.reply("Шаблон не найден.")
-            logger.error(f"Шаблон с ID {template_id} не найден при попытке обновления URL кнопки.")
-            await state.finish()
-            return
-        template.button_url = new_button_url
-        session.commit()
-        logger.info(f"URL кнопки шаблона ID {template_id} обновлён: '{new_button_url}'.")
+    template = await update_template(template_id, button_text=data.get('button_text'), button_url=new_button_url)
+    if not template:
+        await message.reply("Шаблон не найден.")
+        logger.error(f"Шаблон с ID {template_id} не найден при попытке обновления URL кнопки.")
+        await state.finish()
+        return
+    template_cache.invalidate(template_id)
+    logger.info(f"URL кнопки шаблона ID {template_id} обновлён: '{new_button_url}'.")
     await message.reply("URL кнопки шаблона успешно обновлён.")
     await state.finish()
 
+# Функции для пользовательских переменных
+
+async def set_variable_command(message: types.Message):
+    """Команда /set_var название значение — создание или изменение переменной для подстановки {название}."""
+    if message.from_user.id != ADMIN_ID:
+        await message.reply("У вас нет доступа к этому боту.")
+        logger.warning(f"Пользователь с ID {message.from_user.id} попытался использовать /set_var без доступа.")
+        return
+    name, _, value = message.get_args().strip().partition(" ")
+    if not VARIABLE_NAME.fullmatch(name) or not value.strip():
+        await message.reply("Использование: /set_var название значение. Название — буквы, цифры и _, например: /set_var акция скидка 10%")
+        return
+    if name in BUILTIN_PLACEHOLDERS:
+        await message.reply(f"Название {{{name}}} занято встроенной подстановкой.")
+        return
+    await set_variable(name, value.strip())
+    await message.reply(f"Переменная {{{name}}} сохранена.")
+    logger.info(f"Переменная '{name}' сохранена.")
+
+async def delete_variable_command(message: types.Message):
+    """Команда /del_var название — удаление переменной."""
+    if message.from_user.id != ADMIN_ID:
+        await message.reply("У вас нет доступа к этому боту.")
+        logger.warning(f"Пользователь с ID {message.from_user.id} попытался использовать /del_var без доступа.")
+        return
+    name = message.get_args().strip()
+    if not name:
+        await message.reply("Использование: /del_var название")
+        return
+    if await delete_variable(name):
+        await message.reply(f"Переменная {{{name}}} удалена. В текстах шаблонов она будет выводиться как есть.")
+        logger.info(f"Переменная '{name}' удалена.")
+    else:
+        await message.reply("Переменная не найдена.")
+
+async def list_variables(message: types.Message):
+    """Команда /vars — список переменных и встроенных подстановок."""
+    if message.from_user.id != ADMIN_ID:
+        await message.reply("У вас нет доступа к этому боту.")
+        logger.warning(f"Пользователь с ID {message.from_user.id} попытался использовать /vars без доступа.")
+        return
+    variables = await get_variables()
+    lines = [f"{{{name}}} = {value}" for name, value in sorted(variables.items())] or ["Переменных пока нет."]
+    await message.reply("\n".join(lines) + "\n\nДоступные подстановки:\n" + describe_placeholders())
+
 def register_handlers_templates(dp: Dispatcher):
     """Регистрация обработчиков для управления шаблонами."""
     # Обработчики добавления шаблонов
@@ -340,14 +454,22 @@ def register_handlers_templates(dp: Dispatcher):
     
     # Обработчики просмотра шаблонов
     dp.register_message_handler(list_templates, commands=['list_templates'], state="*")
+    dp.register_callback_query_handler(view_template, template_select_cb.filter(action="view"), state="*")
+    dp.register_callback_query_handler(templates_page, template_page_cb.filter(), state="*")
+    dp.register_inline_handler(search_templates_inline, state="*")
     
     # Обработчики удаления шаблонов
     dp.register_message_handler(delete_template_start, commands=['delete_template'], state="*")
-    dp.register_message_handler(delete_template_confirm, state=DeleteTemplateStates.waiting_for_template_selection)
+    dp.register_callback_query_handler(delete_template_confirm, template_select_cb.filter(action="delete"), state="*")
     
     # Обработчики редактирования шаблонов
     dp.register_message_handler(edit_template_start, commands=['edit_template'], state="*")
-    dp.register_message_handler(edit_template_field_selection, state=EditTemplateStates.waiting_for_template_selection)
+    dp.register_callback_query_handler(edit_template_field_selection, template_select_cb.filter(action="edit"), state="*")
     dp.register_message_handler(edit_template_new_value, state=EditTemplateStates.waiting_for_field_selection)
     dp.register_message_handler(edit_template_save_new_value, state=EditTemplateStates.waiting_for_new_value)
     dp.register_message_handler(edit_template_save_button_url, state=EditTemplateStates.waiting_for_new_button_url)
+
+    # Пользовательские переменные
+    dp.register_message_handler(set_variable_command, commands=['set_var'], state="*")
+    dp.register_message_handler(delete_variable_command, commands=['del_var'], state="*")
+    dp.register_message_handler(list_variables, commands=['vars'], state="*")
@@ -1,28 +1,88 @@
 # handlers/timers.py
 
+import asyncio
 import logging
+from datetime import datetime, timedelta
 from aiogram import types, Bot
 from aiogram.dispatcher import FSMContext, Dispatcher
 from aiogram.dispatcher.filters.state import State, StatesGroup
+from apscheduler.events import EVENT_JOB_SUBMITTED
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.interval import IntervalTrigger
 from apscheduler.jobstores.base import JobLookupError
-from database import SessionLocal
-from models.models import Template
-from config import ADMIN_ID
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from tzlocal import get_localzone
+from database import engine, run_in_db
+from config import (
+    ADMIN_ID, GROUP_ID, SCHEDULER_MISFIRE_GRACE_TIME, SCHEDULER_COALESCE, SCHEDULER_ENGINE, SCHEDULER_TICK,
+    BROADCAST_REPORT_TO_ADMIN, RATE_LIMIT_GLOBAL_PER_SECOND, RATE_LIMIT_CHAT_PER_MINUTE, LEADER_LEASE_TTL,
+)
+from models.repository import get_template_chat_counts, get_shared_chats
 from utils.helpers import parse_predefined_schedule
-from utils.send_message import send_template, send_test_message
+from utils.heap_scheduler import HeapScheduler
+from utils.leader import LeaderElector
+from utils.load_shaping import ShiftedTrigger, shape_trigger, spread_offset, forecast_sends, format_forecast
+from utils.simulator import SimJob, simulate, format_simulation
+from utils.send_message import send_template, send_test_message, send_queue, SendQueue, resume_unfinished_sends
+from utils.template_cache import get_prepared_template, get_prepared_template_by_name, sync_template_cache
+from utils.keyboards import build_templates_keyboard, close_selection, template_select_cb
 
 logger = logging.getLogger(__name__)
 
 class ScheduleStates(StatesGroup):
-    waiting_for_template = State()
     waiting_for_schedule_selection = State()
 
-scheduler = AsyncIOScheduler()
+# Задачи хранятся в той же базе SQLite и переживают перезапуск бота.
+# Все задачи загружаются из хранилища одним запросом.
+if SCHEDULER_ENGINE == 'heap':
+    scheduler = HeapScheduler(
+        misfire_grace_time=SCHEDULER_MISFIRE_GRACE_TIME,
+        coalesce=SCHEDULER_COALESCE,
+        tick=SCHEDULER_TICK,
+    )
+else:
+    scheduler = AsyncIOScheduler(
+        jobstores={'default': SQLAlchemyJobStore(engine=engine)},
+        job_defaults={
+            'misfire_grace_time': SCHEDULER_MISFIRE_GRACE_TIME,
+            'coalesce': SCHEDULER_COALESCE,
+        },
+    )
 bot_instance: Bot = None
 
+def on_leader_elected():
+    """
+    Экземпляр стал ведущим: запуск задач и повтор рассылок, которые прежний
+    ведущий не успел завершить до остановки (он освобождает аренду после их записи).
+    """
+    scheduler.resume()
+    send_queue.spawn(resume_unfinished_sends(bot_instance))
+
+async def on_leader_tick():
+    """
+    После каждой попытки продления аренды: учёт изменений шаблонов и задач,
+    сделанных другими экземплярами. Кеш шаблонов сверяется с базой до пробуждения
+    планировщика, чтобы задачи отправили уже изменённые шаблоны.
+    """
+    await sync_template_cache()
+    scheduler.wakeup()
+
+# Если запущено несколько экземпляров бота, задачи запускает только ведущий:
+# планировщик стартует на паузе и возобновляется при получении аренды.
+# Продление аренды заодно будит планировщик, чтобы он увидел задачи,
+# добавленные другими экземплярами, и сбрасывает кеш изменённых шаблонов
+scheduler_leader = LeaderElector(
+    "scheduler", on_elected=on_leader_elected, on_demoted=scheduler.pause, on_tick=on_leader_tick,
+) if LEADER_LEASE_TTL else None
+
+# Плановое время запуска задач для журнала доставок. Событие о запуске
+# задачи приходит раньше, чем начинает выполняться её корутина.
+_scheduled_run_times = {}
+
+def _remember_run_time(event):
+    _scheduled_run_times[event.job_id] = event.scheduled_run_times[-1].timestamp()
+
 SCHEDULE_OPTIONS = [
     "Ежедневно в 12:00",
     "Каждые 12 часов",
@@ -31,7 +91,162 @@ SCHEDULE_OPTIONS = [
     "Отмена"
 ]
 
-async def schedule_message(message: types.Message):
+# Кнопка выбора расписания: следующий выбранный вариант не сохраняется, а показывается его прогноз нагрузки
+FORECAST_OPTION = "📊 Прогноз нагрузки"
+
+def schedule_options_keyboard() -> types.ReplyKeyboardMarkup:
+    keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
+    for option in SCHEDULE_OPTIONS[:3] + [FORECAST_OPTION] + SCHEDULE_OPTIONS[3:]:
+        keyboard.add(option)
+    return keyboard
+
+async def report_scheduled_send(template_id: int, scheduled_at: float = None):
+    """
+    Рассылка шаблона по расписанию с отчётом администратору.
+    """
+    result = await send_template(bot_instance, template_id, scheduled_at)
+    if result and result.total > 1 and BROADCAST_REPORT_TO_ADMIN:
+        try:
+            await send_queue.call(
+                ADMIN_ID,
+                lambda: bot_instance.send_message(chat_id=ADMIN_ID, text=result.summary()),
+                priority=SendQueue.PRIORITY_ADMIN,
+            )
+        except Exception as e:
+            logger.error(f"Ошибка при отправке отчёта о рассылке администратору: {e}")
+
+async def send_scheduled_template(template_id: int):
+    """
+    Задача планировщика: постановка рассылки шаблона в очередь отправки.
+    Экземпляр бота не передаётся в аргументах, так как задачи сохраняются в базе данных.
+    Задача не ждёт завершения рассылки и сразу освобождает исполнитель планировщика.
+    """
+    scheduled_at = _scheduled_run_times.pop(f"template_{template_id}", None)
+    send_queue.spawn(report_scheduled_send(template_id, scheduled_at))
+
+def format_spread(template_id: int) -> str:
+    """Пояснение к расписанию о сдвиге отправки для распределения нагрузки."""
+    offset = spread_offset(template_id)
+    if not offset:
+        return ""
+    minutes, seconds = divmod(offset, 60)
+    return f" (со сдвигом {minutes} мин {seconds} с для распределения нагрузки)"
+
+def build_schedule_trigger(option: str, template_id: int):
+    """Триггер шаблона для варианта расписания вида "Ежедневно в 12:00" или None, если вариант не распознан."""
+    schedule_type, schedule_params = parse_predefined_schedule(option)
+    try:
+        if schedule_type == 'cron':
+            return shape_trigger(CronTrigger(**schedule_params), template_id)
+        if schedule_type == 'interval':
+            return shape_trigger(IntervalTrigger(**schedule_params), template_id)
+    except ValueError:
+        pass
+    return None
+
+def describe_schedule(trigger):
+    """
+    Вариант расписания для триггера задачи (обратное к build_schedule_trigger)
+    или None, если триггер нельзя записать таким вариантом.
+    """
+    if isinstance(trigger, ShiftedTrigger):
+        trigger = trigger.trigger
+    if isinstance(trigger, CronTrigger):
+        fields = {field.name: str(field) for field in trigger.fields}
+        daily = all(fields[name] == "*" for name in ("year", "month", "day", "week", "day_of_week"))
+        if daily and fields["hour"].isdigit() and fields["minute"].isdigit() and fields["second"] == "0":
+            return f"Ежедневно в {int(fields['hour']):02d}:{int(fields['minute']):02d}"
+    elif isinstance(trigger, IntervalTrigger):
+        seconds = int(trigger.interval.total_seconds())
+        if seconds == 60:
+            return "Каждую минуту"
+        if seconds and seconds % 3600 == 0:
+            return f"Каждые {seconds // 3600} часов"
+    return None
+
+async def get_template_jobs() -> list:
+    """Задачи рассылки шаблонов (template_{id}) в виде пар (ID шаблона, триггер)."""
+    if isinstance(scheduler, HeapScheduler):
+        await scheduler.wait_loaded()
+        jobs = scheduler.get_jobs()
+    else:
+        # Хранилище задач APScheduler читает базу синхронно
+        jobs = await run_in_db(scheduler.get_jobs)
+    return [SimJob(job.args[0], job.trigger) for job in jobs if job.id.startswith("template_")]
+
+async def get_template_schedules() -> dict:
+    """Расписания всех шаблонов: ID шаблона -> вариант расписания (для экспорта)."""
+    schedules = {}
+    for template_id, trigger in await get_template_jobs():
+        option = describe_schedule(trigger)
+        if option:
+            schedules[template_id] = option
+    return schedules
+
+async def simulate_schedules(jobs: list, days: float):
+    """
+    Симуляция отправок по задачам jobs на days суток вперёд с учётом чатов рассылки
+    и лимитов Telegram. Расчёт выполняется в отдельном потоке.
+    """
+    start = datetime.now(get_localzone()).replace(second=0, microsecond=0) + timedelta(minutes=1)
+    chat_counts = await get_template_chat_counts()
+    shared_chats = await get_shared_chats(int(RATE_LIMIT_CHAT_PER_MINUTE))
+    return await asyncio.get_running_loop().run_in_executor(
+        None, simulate, jobs, chat_counts, start, start + timedelta(days=days),
+        RATE_LIMIT_GLOBAL_PER_SECOND, RATE_LIMIT_CHAT_PER_MINUTE, shared_chats, GROUP_ID,
+    )
+
+def _add_schedule_jobs(jobs: list):
+    for template_id, trigger in jobs:
+        scheduler.add_job(send_scheduled_template, trigger, args=[template_id],
+                          id=f"template_{template_id}", replace_existing=True)
+
+async def set_template_schedules(schedules: list) -> int:
+    """
+    Массовая установка расписаний (при импорте шаблонов): список пар
+    (ID шаблона, вариант расписания). Существующие расписания шаблонов заменяются.
+    Возвращает количество установленных расписаний; нераспознанные варианты пропускаются.
+    """
+    jobs = []
+    for template_id, option in schedules:
+        trigger = build_schedule_trigger(option, template_id)
+        if trigger is None:
+            logger.warning(f"Нераспознанное расписание '{option}' для шаблона ID {template_id} пропущено.")
+            continue
+        jobs.append((template_id, trigger))
+    if isinstance(scheduler, HeapScheduler):
+        _add_schedule_jobs(jobs)
+    else:
+        # Каждая задача APScheduler записывается в базу отдельным запросом
+        await run_in_db(_add_schedule_jobs, jobs)
+    return len(jobs)
+
+def _remove_job(job_id: str) -> bool:
+    try:
+        scheduler.remove_job(job_id)
+        return True
+    except JobLookupError:
+        return False
+
+async def add_template_job(template_id: int, trigger):
+    """Установка задачи рассылки шаблона (существующее расписание заменяется)."""
+    if isinstance(scheduler, HeapScheduler):
+        _add_schedule_jobs([(template_id, trigger)])
+    else:
+        # Хранилище задач APScheduler пишет в базу синхронно; add_job потокобезопасен
+        await run_in_db(_add_schedule_jobs, [(template_id, trigger)])
+
+async def remove_template_job(template_id: int) -> bool:
+    """Удаление задачи рассылки шаблона. Возвращает False, если расписание не было установлено."""
+    job_id = f"template_{template_id}"
+    if isinstance(scheduler, HeapScheduler):
+        # Запущенный на паузе планировщик загружает задачи в фоне: до окончания
+        # загрузки задача шаблона ещё не в памяти, и remove_job её бы не нашёл
+        await scheduler.wait_loaded()
+        return _remove_job(job_id)
+    return await run_in_db(_remove_job, job_id)
+
+async def schedule_message(message: types.Message, state: FSMContext):
     """
     Начало процесса настройки расписания отправки сообщения.
     """
@@ -42,55 +257,50 @@ async def schedule_message(message: types.Message):
             await message.reply("У вас нет доступа к этому боту.")
             return
 
-        with SessionLocal() as session:
-            templates = session.query(Template).all()
-            if not templates:
-                await message.reply("Нет доступных шаблонов. Сначала добавьте шаблон.")
-                logger.info("Нет доступных шаблонов для настройки расписания.")
-                return
-
-            keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
-            for template in templates:
-                keyboard.add(template.name)
+        await state.finish()
+        keyboard = await build_templates_keyboard("schedule")
+        if keyboard is None:
+            await message.reply("Нет доступных шаблонов. Сначала добавьте шаблон.")
+            logger.info("Нет доступных шаблонов для настройки расписания.")
+            return
 
         await message.reply("Выберите шаблон для отправки:", reply_markup=keyboard)
-        await ScheduleStates.waiting_for_template.set()
         logger.info("Отправлен запрос на выбор шаблона для расписания.")
     except Exception as e:
         logger.error(f"Ошибка в обработчике /schedule: {e}")
         await message.reply("Произошла ошибка при обработке команды.")
 
-async def schedule_template_selected(message: types.Message, state: FSMContext):
+async def schedule_template_selected(callback: types.CallbackQuery, callback_data: dict, state: FSMContext):
     """
     Обработка выбора шаблона для настройки расписания.
     """
-    template_name = message.text.strip()
-    logger.info(f"Выбран шаблон для расписания: '{template_name}'")
+    if callback.from_user.id != ADMIN_ID:
+        await callback.answer("У вас нет доступа к этому боту.", show_alert=True)
+        logger.warning(f"Пользователь с ID {callback.from_user.id} попытался выбрать шаблон для расписания без доступа.")
+        return
+    template_id = int(callback_data['id'])
+    logger.info(f"Выбран шаблон для расписания: ID {template_id}")
     try:
-        with SessionLocal() as session:
-            template = session.query(Template).filter(Template.name == template_name).first()
-            if not template:
-                await message.reply("Шаблон не найден.")
-                logger.warning(f"Шаблон '{template_name}' не найден.")
-                await state.finish()
-                return
-            template_id = template.id
-
-        await state.update_data(template_id=template_id)
+        template = await get_prepared_template(template_id)
+        if not template:
+            await callback.answer("Шаблон не найден.", show_alert=True)
+            logger.warning(f"Шаблон ID {template_id} не найден.")
+            return
 
-        keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
-        for option in SCHEDULE_OPTIONS:
-            keyboard.add(option)
+        await state.set_data({'template_id': template_id})
 
-        await message.reply(
+        await close_selection(callback, f"Расписание для шаблона '{template.name}'.")
+        await callback.bot.send_message(
+            callback.from_user.id,
             "Выберите расписание отправки сообщения:",
-            reply_markup=keyboard
+            reply_markup=schedule_options_keyboard()
         )
+        await callback.answer()
         await ScheduleStates.waiting_for_schedule_selection.set()
         logger.info(f"Начат процесс настройки расписания для шаблона ID {template_id}.")
     except Exception as e:
         logger.error(f"Ошибка в обработчике выбора шаблона: {e}")
-        await message.reply("Произошла ошибка при обработке выбора шаблона.")
+        await callback.bot.send_message(callback.from_user.id, "Произошла ошибка при обработке выбора шаблона.")
         await state.finish()
 
 async def schedule_selection_received(message: types.Message, state: FSMContext):
@@ -113,15 +323,27 @@ async def schedule_selection_received(message: types.Message, state: FSMContext)
             logger.info(f"Пользователь {user_id} отменил настройку.")
             return
 
+        if selected_option == FORECAST_OPTION:
+            await state.update_data(forecast=True)
+            await message.reply("Выберите вариант расписания — бот покажет прогноз нагрузки на час его ближайшего "
+                                "запуска. Расписание при этом не изменится.", reply_markup=schedule_options_keyboard())
+            return
+
+        if data.get('forecast') and selected_option in SCHEDULE_OPTIONS[:3]:
+            await state.update_data(forecast=False)
+            report = await forecast_with_schedule(template_id, selected_option)
+            await message.reply(f"{report}\n\nВыберите расписание отправки сообщения:", reply_markup=schedule_options_keyboard())
+            logger.info(f"Пользователь {user_id}: показан прогноз нагрузки для шаблона ID {template_id} с расписанием '{selected_option}'.")
+            return
+
         if selected_option == "Удалить таймер":
-            job_id = f"template_{template_id}"
             try:
-                scheduler.remove_job(job_id)
-                await message.reply(f"Таймер для шаблона ID {template_id} удален.", reply_markup=types.ReplyKeyboardRemove())
-                logger.info(f"Пользователь {user_id} удалил таймер для шаблона ID {template_id}.")
-            except JobLookupError:
-                await message.reply(f"Таймер для шаблона ID {template_id} не установлен.", reply_markup=types.ReplyKeyboardRemove())
-                logger.info(f"Пользователь {user_id} попытался удалить несуществующий таймер для шаблона ID {template_id}.")
+                if await remove_template_job(template_id):
+                    await message.reply(f"Таймер для шаблона ID {template_id} удален.", reply_markup=types.ReplyKeyboardRemove())
+                    logger.info(f"Пользователь {user_id} удалил таймер для шаблона ID {template_id}.")
+                else:
+                    await message.reply(f"Таймер для шаблона ID {template_id} не установлен.", reply_markup=types.ReplyKeyboardRemove())
+                    logger.info(f"Пользователь {user_id} попытался удалить несуществующий таймер для шаблона ID {template_id}.")
             except Exception as e: # Перехватываем ошибки при удалении таймера
                 logger.exception(f"Ошибка при удалении таймера у пользователя {user_id}: {e}")
                 await message.reply("Произошла ошибка при удалении таймера.", reply_markup=types.ReplyKeyboardRemove())
@@ -136,10 +358,10 @@ async def schedule_selection_received(message: types.Message, state: FSMContext)
 
         job_id = f"template_{template_id}"
         try:
-            scheduler.remove_job(job_id)
-            logger.info(f"Удалена существующая задача с ID {job_id} перед созданием новой.")
-        except JobLookupError:
-            logger.info(f"Задача с ID {job_id} не найдена. Создаётся новая.")
+            if await remove_template_job(template_id):
+                logger.info(f"Удалена существующая задача с ID {job_id} перед созданием новой.")
+            else:
+                logger.info(f"Задача с ID {job_id} не найдена. Создаётся новая.")
         except Exception as e: # Перехватываем ошибки при удалении существующей задачи
             logger.exception(f"Ошибка при удалении существующей задачи у пользователя {user_id}: {e}")
             await message.reply("Произошла ошибка при обработке расписания.", reply_markup=types.ReplyKeyboardRemove())
@@ -148,10 +370,10 @@ async def schedule_selection_received(message: types.Message, state: FSMContext)
 
         if schedule_type == 'cron':
             try: # Перехватываем ошибки при создании cron задачи
-                trigger = CronTrigger(**schedule_params)
-                scheduler.add_job(send_template, trigger, args=[bot_instance, template_id], id=job_id, replace_existing=True)
+                trigger = shape_trigger(CronTrigger(**schedule_params), template_id)
+                await add_template_job(template_id, trigger)
                 time_str = f"{schedule_params['hour']:02d}:{schedule_params['minute']:02d}"
-                await message.reply(f"Сообщение будет отправляться ежедневно в {time_str}.", reply_markup=types.ReplyKeyboardRemove())
+                await message.reply(f"Сообщение будет отправляться ежедневно в {time_str}{format_spread(template_id)}.", reply_markup=types.ReplyKeyboardRemove())
                 logger.info(f"Пользователь {user_id}: Добавлена задача cron для шаблона ID {template_id} с расписанием ежедневно в {time_str}.")
             except Exception as e:
                 logger.exception(f"Ошибка при создании cron задачи у пользователя {user_id}: {e}")
@@ -161,13 +383,13 @@ async def schedule_selection_received(message: types.Message, state: FSMContext)
 
         elif schedule_type == 'interval':
             try: # Перехватываем ошибки при создании interval задачи
-                trigger = IntervalTrigger(**schedule_params)
-                scheduler.add_job(send_template, trigger, args=[bot_instance, template_id], id=job_id, replace_existing=True)
+                trigger = shape_trigger(IntervalTrigger(**schedule_params), template_id)
+                await add_template_job(template_id, trigger)
                 if 'hours' in schedule_params:
-                    await message.reply(f"Сообщение будет отправляться каждые {schedule_params['hours']} часов.", reply_markup=types.ReplyKeyboardRemove())
+                    await message.reply(f"Сообщение будет отправляться каждые {schedule_params['hours']} часов{format_spread(template_id)}.", reply_markup=types.ReplyKeyboardRemove())
                     logger.info(f"Пользователь {user_id}: Добавлена задача interval для шаблона ID {template_id} с расписанием каждые {schedule_params['hours']} часов.")
                 elif 'minutes' in schedule_params:
-                    await message.reply(f"Сообщение будет отправляться каждые {schedule_params['minutes']} минут.", reply_markup=types.ReplyKeyboardRemove())
+                    await message.reply(f"Сообщение будет отправляться каждые {schedule_params['minutes']} минут{format_spread(template_id)}.", reply_markup=types.ReplyKeyboardRemove())
                     logger.info(f"Пользователь {user_id}: Добавлена задача interval для шаблона ID {template_id} с расписанием каждые {schedule_params['minutes']} минут.")
             except Exception as e:
                 logger.exception(f"Ошибка при создании interval задачи у пользователя {user_id}: {e}")
@@ -204,22 +426,124 @@ async def cancel_schedule(message: types.Message):
             return
 
         template_name = args.strip()
-        with SessionLocal() as session:
-            template = session.query(Template).filter(Template.name == template_name).first()
+        template = await get_prepared_template_by_name(template_name)
+        if not template:
+            logger.warning(f"Шаблон '{template_name}' не найден для отключения расписания.")
+            await message.reply("Шаблон не найден.")
+            return
+        if await remove_template_job(template.id):
+            logger.info(f"Расписание для шаблона ID {template.id} отключено.")
+            await message.reply(f"Расписание для шаблона '{template_name}' отключено.")
+        else:
+            logger.warning(f"Расписание для шаблона ID {template.id} не найдено.")
+            await message.reply(f"Расписание для шаблона '{template_name}' не найдено.")
+    except Exception as e:
+        logger.error(f"Ошибка в обработчике /cancel_schedule: {e}")
+        await message.reply("Произошла ошибка при обработке команды.")
+
+async def forecast_hour(jobs: list, start: datetime) -> str:
+    """
+    Гистограмма отправок по минутам на час, начинающийся в start, по задачам
+    jobs (пары ID шаблона, триггер) с учётом количества чатов рассылки.
+    """
+    chat_counts = await get_template_chat_counts()
+    per_minute = await asyncio.get_running_loop().run_in_executor(
+        None, forecast_sends, [(trigger, template_id) for template_id, trigger in jobs], chat_counts,
+        start, start + timedelta(hours=1),
+    )
+    return format_forecast(per_minute, start, int(RATE_LIMIT_GLOBAL_PER_SECOND * 60))
+
+async def forecast_with_schedule(template_id: int, option: str, hour: int = None):
+    """
+    Прогноз нагрузки, если шаблону задать расписание option (остальные расписания —
+    как сейчас): на указанный час или на час ближайшего запуска по option.
+    Возвращает None, если вариант расписания не распознан.
+    """
+    trigger = build_schedule_trigger(option, template_id)
+    if trigger is None:
+        return None
+    now = datetime.now(get_localzone())
+    if hour is None:
+        fire_time = trigger.get_next_fire_time(None, now) or now
+        start = fire_time.astimezone(now.tzinfo).replace(minute=0, second=0, microsecond=0)
+    else:
+        start = next_hour_start(now, hour)
+    jobs = [(job_template_id, job_trigger) for job_template_id, job_trigger in await get_template_jobs()
+            if job_template_id != template_id]
+    jobs.append((template_id, trigger))
+    return await forecast_hour(jobs, start)
+
+def next_hour_start(now: datetime, hour: int) -> datetime:
+    """Ближайшее наступление часа hour (текущий час — тоже целиком)."""
+    start = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+    if start + timedelta(hours=1) <= now:
+        start += timedelta(days=1)
+    return start
+
+async def load_forecast(message: types.Message):
+    """
+    Прогноз отправок по минутам на указанный час по всем расписаниям с учётом
+    количества чатов рассылки. Если указан шаблон с вариантом расписания
+    (шаблон=вариант), в прогноз добавляется это расписание шаблона — чтобы
+    оценить нагрузку до его настройки.
+    """
+    logger.info("Вызвана команда /load_forecast")
+    try:
+        if message.from_user.id != ADMIN_ID:
+            logger.warning(f"Пользователь с ID {message.from_user.id} попытался использовать /load_forecast без доступа.")
+            await message.reply("У вас нет доступа к этому боту.")
+            return
+
+        hour_arg, _, change = message.get_args().strip().partition(" ")
+        if not hour_arg.isdigit() or int(hour_arg) > 23:
+            await message.reply("Пожалуйста, укажите час от 0 до 23. Пример: /load_forecast 12 шаблон1=Каждые 12 часов")
+            return
+        hour = int(hour_arg)
+
+        if not change.strip():
+            report = await forecast_hour(await get_template_jobs(), next_hour_start(datetime.now(get_localzone()), hour))
+        else:
+            template_name, _, option = change.partition("=")
+            options = ", ".join(SCHEDULE_OPTIONS[:3])
+            if not option.strip():
+                await message.reply(f"Укажите вариант расписания шаблона: /load_forecast {hour} {template_name.strip()}=вариант. "
+                                    f"Варианты: {options}.")
+                return
+            template = await get_prepared_template_by_name(template_name.strip())
             if not template:
-                logger.warning(f"Шаблон '{template_name}' не найден для отключения расписания.")
                 await message.reply("Шаблон не найден.")
                 return
-            job_id = f"template_{template.id}"
-            try:
-                scheduler.remove_job(job_id)
-                logger.info(f"Расписание для шаблона ID {template.id} отключено.")
-                await message.reply(f"Расписание для шаблона '{template_name}' отключено.")
-            except JobLookupError:
-                logger.warning(f"Расписание для шаблона ID {template.id} не найдено.")
-                await message.reply(f"Расписание для шаблона '{template_name}' не найдено.")
+            report = await forecast_with_schedule(template.id, option.strip(), hour)
+            if report is None:
+                await message.reply(f"Нераспознанное расписание '{option.strip()}'. Варианты: {options}.")
+                return
+        await message.reply(report)
+        logger.info(f"Отправлен прогноз нагрузки на {hour:02d}:00.")
     except Exception as e:
-        logger.error(f"Ошибка в обработчике /cancel_schedule: {e}")
+        logger.error(f"Ошибка в обработчике /load_forecast: {e}")
+        await message.reply("Произошла ошибка при обработке команды.")
+
+async def simulate_command(message: types.Message):
+    """
+    Команда /simulate [дни] — симуляция всех расписаний на несколько суток вперёд
+    (по умолчанию 7): отправки по дням, пиковые минуты, очередь отправки и
+    превышения лимитов Telegram.
+    """
+    if message.from_user.id != ADMIN_ID:
+        await message.reply("У вас нет доступа к этому боту.")
+        logger.warning(f"Пользователь с ID {message.from_user.id} попытался использовать /simulate без доступа.")
+        return
+    args = message.get_args().strip()
+    if args and not (args.isdigit() and 1 <= int(args) <= 31):
+        await message.reply("Использование: /simulate [дни], от 1 до 31. Пример: /simulate 7")
+        return
+    try:
+        result = await simulate_schedules(await get_template_jobs(), int(args) if args else 7)
+        report = format_simulation(result, RATE_LIMIT_GLOBAL_PER_SECOND, RATE_LIMIT_CHAT_PER_MINUTE)
+        await message.reply(report[:4096])
+        logger.info(f"Выполнена симуляция расписаний: задач {result.jobs}, за {result.elapsed:.2f} с.")
+    except Exception as e:
+        logger.exception(f"Ошибка в обработчике /simulate: {e}")
         await message.reply("Произошла ошибка при обработке команды.")
 
 def register_handlers_timers(dp: Dispatcher, bot: Bot, scheduler_instance: AsyncIOScheduler):
@@ -231,10 +555,12 @@ def register_handlers_timers(dp: Dispatcher, bot: Bot, scheduler_instance: Async
     logger.info("Экземпляр бота сохранён в bot_instance.")
 
     dp.register_message_handler(schedule_message, commands=['schedule'], state="*")
-    dp.register_message_handler(schedule_template_selected, state=ScheduleStates.waiting_for_template)
+    dp.register_callback_query_handler(schedule_template_selected, template_select_cb.filter(action="schedule"), state="*")
     dp.register_message_handler(schedule_selection_received, state=ScheduleStates.waiting_for_schedule_selection)
     dp.register_message_handler(cancel_schedule, commands=['cancel_schedule'], state="*")
-    logger.info("Обработчики команд /schedule и /cancel_schedule зарегистрированы.")
+    dp.register_message_handler(load_forecast, commands=['load_forecast'], state="*")
+    dp.register_message_handler(simulate_command, commands=['simulate'], state="*")
+    logger.info("Обработчики команд /schedule, /cancel_schedule, /load_forecast и /simulate зарегистрированы.")
 
     # Добавление тестовой команды для отправки тестового сообщения
     async def test_schedule(message: types.Message):
@@ -252,6 +578,16 @@ def register_handlers_timers(dp: Dispatcher, bot: Bot, scheduler_instance: Async
     dp.register_message_handler(test_schedule, commands=['test_schedule'], state="*")
     logger.info("Обработчик команды /test_schedule зарегистрирован.")
 
-    # Запуск планировщика
-    scheduler_instance.start()
-    logger.info("Планировщик APScheduler запущен.")
+    scheduler_instance.add_listener(_remember_run_time, EVENT_JOB_SUBMITTED)
+
+def start_scheduler():
+    """
+    Запуск планировщика при старте бота (при выборе ведущего — на паузе до получения аренды).
+    Вызывается из on_startup, а не при регистрации обработчиков: загрузка задач
+    не задерживает подготовку диспетчера.
+    """
+    scheduler.start(paused=scheduler_leader is not None)
+    logger.info("Планировщик запущен.")
+    if scheduler_leader is None:
+        # При выборе ведущего незавершённые рассылки повторяет экземпляр, получивший аренду
+        send_queue.spawn(resume_unfinished_sends(bot_instance))
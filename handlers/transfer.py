@@ -0,0 +1,135 @@
+# handlers/transfer.py
+
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime
+from aiogram import types
+from aiogram.dispatcher import FSMContext, Dispatcher
+from aiogram.dispatcher.filters.state import State, StatesGroup
+from aiogram.utils.exceptions import MessageNotModified
+from config import ADMIN_ID
+from handlers.timers import get_template_schedules, set_template_schedules
+from utils.template_io import export_templates, import_templates
+
+logger = logging.getLogger(__name__)
+
+# Ограничения Bot API: бот может отправить файл до 50 МБ и скачать файл до 20 МБ.
+# Архивы больше переносятся через tools/template_io.py
+UPLOAD_MAX_BYTES = 50 * 1024 * 1024
+DOWNLOAD_MAX_BYTES = 20 * 1024 * 1024
+
+# Как часто обновлять сообщение о ходе импорта, в секундах
+PROGRESS_INTERVAL = 3.0
+
+class ImportStates(StatesGroup):
+    """Состояние ожидания файла для импорта шаблонов."""
+    waiting_for_file = State()
+
+async def export_templates_command(message: types.Message):
+    """
+    Команда /export_templates — архив всех шаблонов с изображениями, чатами
+    рассылки и расписаниями (для переноса на другой экземпляр бота или резервной копии).
+    """
+    if message.from_user.id != ADMIN_ID:
+        await message.reply("У вас нет доступа к этому боту.")
+        logger.warning(f"Пользователь с ID {message.from_user.id} попытался использовать /export_templates без доступа.")
+        return
+    workdir = tempfile.TemporaryDirectory(prefix="templates_")
+    path = os.path.join(workdir.name, "templates.zip")
+    try:
+        await message.reply("Экспорт шаблонов запущен.")
+        result = await export_templates(path, schedules=await get_template_schedules())
+        if os.path.getsize(path) > UPLOAD_MAX_BYTES:
+            await message.reply(
+                f"{result.summary()}\nАрхив больше 50 МБ и не может быть отправлен через Telegram. "
+                f"Выполните на сервере: python tools/template_io.py export templates.zip"
+            )
+            return
+        await message.answer_document(
+            types.InputFile(path, filename=f"templates_{datetime.now():%Y%m%d_%H%M%S}.zip"),
+            caption=result.summary()[:1024],
+        )
+        logger.info("Администратор выгрузил архив шаблонов.")
+    except Exception as e:
+        logger.exception(f"Ошибка в обработчике /export_templates: {e}")
+        await message.reply("Произошла ошибка при экспорте шаблонов.")
+    finally:
+        workdir.cleanup()
+
+async def import_templates_command(message: types.Message, state: FSMContext):
+    """
+    Команда /import_templates [расписания] — загрузка шаблонов из архива экспорта.
+    С аргументом "расписания" восстанавливаются и расписания шаблонов.
+    """
+    if message.from_user.id != ADMIN_ID:
+        await message.reply("У вас нет доступа к этому боту.")
+        logger.warning(f"Пользователь с ID {message.from_user.id} попытался использовать /import_templates без доступа.")
+        return
+    args = message.get_args().strip().lower()
+    if args and args != "расписания":
+        await message.reply("Использование: /import_templates [расписания]")
+        return
+    await state.set_data({"schedules": bool(args)})
+    await ImportStates.waiting_for_file.set()
+    await message.reply(
+        "Отправьте архив экспорта (.zip) или файл .jsonl документом (до 20 МБ). "
+        "Шаблоны с существующими названиями будут обновлены. Для отмены напишите 'отмена'."
+    )
+    logger.info("Начат процесс импорта шаблонов.")
+
+async def import_file_received(message: types.Message, state: FSMContext):
+    """Получение файла импорта и загрузка шаблонов с сообщением о ходе импорта."""
+    if not message.document:
+        if message.text and message.text.lower() == "отмена":
+            await state.finish()
+            await message.reply("Импорт отменён.")
+            return
+        await message.reply("Пожалуйста, отправьте файл документом или напишите 'отмена'.")
+        return
+    if message.document.file_size and message.document.file_size > DOWNLOAD_MAX_BYTES:
+        await message.reply(
+            "Файл больше 20 МБ и не может быть загружен через Telegram. "
+            "Выполните на сервере: python tools/template_io.py import <архив>"
+        )
+        return
+    data = await state.get_data()
+    await state.finish()
+    # Отдельный временный каталог: пути изображений из файла JSONL
+    # ищутся рядом с ним, а рядом не должно быть посторонних файлов
+    workdir = tempfile.TemporaryDirectory(prefix="templates_")
+    path = os.path.join(workdir.name, "import")
+    status = await message.reply("Импорт шаблонов запущен.")
+    last_update = time.monotonic()
+
+    async def report_progress(result):
+        nonlocal last_update
+        if time.monotonic() - last_update < PROGRESS_INTERVAL:
+            return
+        last_update = time.monotonic()
+        try:
+            await status.edit_text(f"Импорт шаблонов: {result.summary()}")
+        except MessageNotModified:
+            pass
+
+    try:
+        await message.document.download(destination_file=path)
+        result = await import_templates(
+            path, set_schedules=set_template_schedules if data.get("schedules") else None, progress=report_progress,
+        )
+        await status.edit_text(f"Импорт завершён. {result.summary()}")
+        logger.info(f"Администратор импортировал шаблоны: {result.summary()}")
+    except Exception as e:
+        logger.exception(f"Ошибка при импорте шаблонов: {e}")
+        await message.reply(f"Произошла ошибка при импорте шаблонов: {e}")
+    finally:
+        workdir.cleanup()
+
+def register_handlers_transfer(dp: Dispatcher):
+    """
+    Регистрация обработчиков импорта и экспорта шаблонов.
+    """
+    dp.register_message_handler(export_templates_command, commands=['export_templates'], state="*")
+    dp.register_message_handler(import_templates_command, commands=['import_templates'], state="*")
+    dp.register_message_handler(import_file_received, content_types=['document', 'text'], state=ImportStates.waiting_for_file)
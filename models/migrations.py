@@ -0,0 +1,80 @@
+# models/migrations.py
+
+import logging
+from sqlalchemy import text
+from database import Base, apply_migrations, has_column
+from models import models
+from models.search import create_search_index
+
+logger = logging.getLogger(__name__)
+
+def _create_tables(connection):
+    # Создаёт только отсутствующие таблицы, существующие не изменяются
+    Base.metadata.create_all(bind=connection)
+
+def _index_template_images(connection):
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_templates_image_path ON templates (image_path)"))
+
+def _share_scheduled_sends(connection):
+    # Изменения задач, сделанные другими экземплярами бота, находятся по номеру изменения
+    for column, ddl in (("revision", "INTEGER NOT NULL DEFAULT 0"), ("owner", "VARCHAR"), ("deleted_at", "FLOAT")):
+        if not has_column(connection, "scheduled_sends", column):
+            connection.execute(text(f"ALTER TABLE scheduled_sends ADD COLUMN {column} {ddl}"))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_scheduled_sends_revision ON scheduled_sends (revision)"))
+    models.LeaderLease.__table__.create(connection, checkfirst=True)
+
+def _template_placeholders(connection):
+    # Версия текста — ключ кеша скомпилированных шаблонов, счётчик рассылок — для {count}
+    for column, ddl in (("version", "INTEGER NOT NULL DEFAULT 1"), ("send_count", "INTEGER NOT NULL DEFAULT 0")):
+        if not has_column(connection, "templates", column):
+            connection.execute(text(f"ALTER TABLE templates ADD COLUMN {column} {ddl}"))
+    models.TemplateVariable.__table__.create(connection, checkfirst=True)
+
+def _unfinished_sends(connection):
+    models.UnfinishedSend.__table__.create(connection, checkfirst=True)
+
+def _clean_shutdowns(connection):
+    models.CleanShutdown.__table__.create(connection, checkfirst=True)
+
+def _template_revisions(connection):
+    # Номер изменения растёт при любой записи шаблонов и их чатов, в том числе
+    # сделанной другим экземпляром бота или импортом (счётчик рассылок не считается)
+    models.TemplateRevision.__table__.create(connection, checkfirst=True)
+    connection.execute(text("INSERT OR IGNORE INTO template_revisions (id, revision) VALUES (1, 0)"))
+    bump = "UPDATE template_revisions SET revision = revision + 1 WHERE id = 1;"
+    for name, event in (
+        ("templates_revision_ai", "AFTER INSERT ON templates"),
+        ("templates_revision_ad", "AFTER DELETE ON templates"),
+        ("templates_revision_au", "AFTER UPDATE OF name, text, image_path, button_text, button_url ON templates"),
+        ("template_chats_revision_ai", "AFTER INSERT ON template_chats"),
+        ("template_chats_revision_ad", "AFTER DELETE ON template_chats"),
+        ("template_chats_revision_au", "AFTER UPDATE ON template_chats"),
+    ):
+        connection.execute(text(f"CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {bump} END"))
+
+# Миграции схемы по возрастанию номеров. Номера не меняются и не переиспользуются.
+# Миграция 1 создаёт таблицы по текущим моделям, поэтому на новой базе последующие
+# миграции могут найти свои изменения уже применёнными: они пишутся так, чтобы
+# повторное применение ничего не ломало (IF NOT EXISTS, database.has_column).
+# Новая таблица добавляется отдельной миграцией: Model.__table__.create(connection, checkfirst=True).
+MIGRATIONS = [
+    (1, "таблицы моделей", _create_tables),
+    (2, "полнотекстовый индекс шаблонов", create_search_index),
+    (3, "индекс изображений шаблонов", _index_template_images),
+    (4, "общие задачи планировщика и аренда ведущего экземпляра", _share_scheduled_sends),
+    (5, "подстановки в тексте шаблонов: версия текста, счётчик рассылок, переменные", _template_placeholders),
+    (6, "рассылки, не завершённые при остановке бота", _unfinished_sends),
+    (7, "отметки штатной остановки бота", _clean_shutdowns),
+    (8, "номер изменения шаблонов для кеша шаблонов нескольких экземпляров", _template_revisions),
+]
+
+def migrate_database() -> int:
+    """
+    Приведение схемы базы данных к текущей версии при запуске бота.
+    Если версия схемы совпадает с последней миграцией, при запуске выполняется
+    только чтение PRAGMA user_version: схема таблиц не проверяется.
+    Возвращает номер версии схемы.
+    """
+    version = apply_migrations(MIGRATIONS)
+    logger.info(f"Схема базы данных: версия {version}.")
+    return version
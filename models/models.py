@@ -1,6 +1,6 @@
 # models/models.py
 
-from sqlalchemy import Column, Integer, String, Text
+from sqlalchemy import Column, Integer, BigInteger, Float, String, Text, LargeBinary, ForeignKey, UniqueConstraint, Index
 from database import Base
 
 class Template(Base):
@@ -12,6 +12,128 @@ class Template(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, unique=True, index=True, nullable=False)  # Название шаблона
     text = Column(Text, nullable=True)                             # Текст сообщения
-    image_path = Column(String, nullable=True)                    # Путь к изображению
+    image_path = Column(String, nullable=True, index=True)        # Путь к изображению
     button_text = Column(String, nullable=True)                   # Текст кнопки
     button_url = Column(String, nullable=True)                    # URL кнопки
+    version = Column(Integer, nullable=False, default=1)          # Версия текста (растёт при каждом изменении текста)
+    send_count = Column(Integer, nullable=False, default=0)       # Количество рассылок шаблона (для {count})
+
+class TemplateVariable(Base):
+    """
+    Пользовательская переменная для подстановки в текст шаблонов ({название}).
+    """
+    __tablename__ = "template_variables"
+
+    name = Column(String, primary_key=True)                       # Название переменной
+    value = Column(Text, nullable=False)                          # Значение
+
+class MediaFile(Base):
+    """
+    Кеш file_id Telegram для локальных изображений шаблонов.
+    """
+    __tablename__ = "media_files"
+
+    path = Column(String, primary_key=True)                       # Путь к изображению
+    file_id = Column(String, nullable=False)                      # file_id, выданный Telegram
+
+class TemplateChat(Base):
+    """
+    Чаты, в которые рассылается шаблон.
+    Если у шаблона нет чатов, он отправляется в группу GROUP_ID.
+    """
+    __tablename__ = "template_chats"
+    __table_args__ = (UniqueConstraint("template_id", "chat_id"),)
+
+    id = Column(Integer, primary_key=True)
+    template_id = Column(Integer, ForeignKey("templates.id"), index=True, nullable=False)  # ID шаблона
+    chat_id = Column(BigInteger, nullable=False)                                           # ID чата
+
+class FSMRecord(Base):
+    """
+    Состояние FSM пользователя (данные диалогов добавления и редактирования шаблонов).
+    """
+    __tablename__ = "fsm_states"
+
+    chat = Column(String, primary_key=True)                       # ID чата
+    user = Column(String, primary_key=True)                       # ID пользователя
+    state = Column(String, nullable=True)                         # Текущее состояние
+    data = Column(Text, nullable=False, default="{}")             # Данные диалога (JSON)
+    bucket = Column(Text, nullable=False, default="{}")           # Bucket aiogram (JSON)
+    updated_at = Column(Float, nullable=False, index=True)        # Время последнего изменения (Unix)
+
+class ScheduledSend(Base):
+    """
+    Задача планировщика на куче (SCHEDULER_ENGINE=heap).
+    """
+    __tablename__ = "scheduled_sends"
+
+    id = Column(String, primary_key=True)                         # ID задачи, например template_1
+    func = Column(String, nullable=False)                         # Ссылка на функцию "модуль:имя"
+    args = Column(Text, nullable=False)                           # Аргументы функции (JSON)
+    trigger = Column(LargeBinary, nullable=False)                 # Триггер APScheduler (pickle)
+    next_run_time = Column(Float, nullable=True)                  # Время следующего запуска (Unix), NULL — задача удалена
+    revision = Column(Integer, nullable=False, default=0, index=True)  # Номер изменения задачи (растёт с каждой записью)
+    owner = Column(String, nullable=True)                         # Экземпляр бота, изменивший задачу последним
+    deleted_at = Column(Float, nullable=True)                     # Время удаления задачи (Unix)
+
+class LeaderLease(Base):
+    """
+    Аренда роли ведущего экземпляра бота (см. utils/leader.py).
+    """
+    __tablename__ = "leader_leases"
+
+    name = Column(String, primary_key=True)                       # Роль, например scheduler
+    holder = Column(String, nullable=False)                       # ID экземпляра-держателя
+    expires_at = Column(Float, nullable=False)                    # Время истечения аренды (Unix)
+
+class Delivery(Base):
+    """
+    Журнал доставок: одна запись на отправку шаблона в один чат.
+    """
+    __tablename__ = "deliveries"
+    __table_args__ = (
+        Index("ix_deliveries_sent_at", "sent_at"),
+        Index("ix_deliveries_template_sent_at", "template_id", "sent_at"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    template_id = Column(Integer, nullable=False)                 # ID шаблона (запись остаётся после удаления шаблона)
+    chat_id = Column(BigInteger, nullable=False)                  # ID чата
+    scheduled_at = Column(Float, nullable=False)                  # Плановое время отправки (Unix)
+    sent_at = Column(Float, nullable=False)                       # Время завершения отправки (Unix)
+    latency = Column(Float, nullable=False)                       # Задержка от планового времени, секунды
+    message_id = Column(BigInteger, nullable=True)                # ID отправленного сообщения
+    error = Column(Text, nullable=True)                           # Текст ошибки, если отправка не удалась
+
+class UnfinishedSend(Base):
+    """
+    Рассылка, не завершённая при остановке бота; повторяется при следующем запуске.
+    """
+    __tablename__ = "unfinished_sends"
+
+    id = Column(Integer, primary_key=True)
+    template_id = Column(Integer, nullable=False)                 # ID шаблона
+    scheduled_at = Column(Float, nullable=False)                  # Плановое время отправки (Unix)
+    text = Column(Text, nullable=True)                            # Текст с подстановками, NULL — отрисовать заново
+    chat_ids = Column(Text, nullable=True)                        # Недоставленные чаты (JSON), NULL — все чаты шаблона
+    recorded_at = Column(Float, nullable=False)                   # Время остановки бота (Unix)
+
+class CleanShutdown(Base):
+    """
+    Отметка штатной остановки бота в режиме опроса: обновления, не подтверждённые
+    при остановке, обрабатываются при следующем запуске, а не пропускаются.
+    """
+    __tablename__ = "clean_shutdowns"
+
+    id = Column(Integer, primary_key=True)
+    stopped_at = Column(Float, nullable=False)                    # Время остановки бота (Unix)
+
+class TemplateRevision(Base):
+    """
+    Номер изменения шаблонов и их чатов (одна запись). Увеличивается триггерами
+    базы данных, по нему экземпляры бота узнают об изменениях, сделанных другими.
+    """
+    __tablename__ = "template_revisions"
+
+    id = Column(Integer, primary_key=True)
+    revision = Column(Integer, nullable=False, default=0)         # Номер последнего изменения
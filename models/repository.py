@@ -0,0 +1,344 @@
+# models/repository.py
+
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from database import SessionLocal, run_in_db
+from models.models import Template, TemplateChat, TemplateVariable, UnfinishedSend, CleanShutdown, TemplateRevision
+
+# Массовый импорт: шаблон с существующим названием обновляется, чат рассылки
+# добавляется, только если его ещё нет
+_TEMPLATE_FIELDS = ("text", "image_path", "button_text", "button_url")
+_template_upsert = sqlite_insert(Template.__table__)
+_template_upsert = _template_upsert.on_conflict_do_update(
+    index_elements=[Template.__table__.c.name],
+    set_={
+        **{name: _template_upsert.excluded[name] for name in _TEMPLATE_FIELDS},
+        "version": Template.__table__.c.version + 1,
+    },
+)
+_chat_insert = sqlite_insert(TemplateChat.__table__).on_conflict_do_nothing()
+
+# Синхронные функции выполняются в пуле потоков БД через run_in_db.
+# Возвращаемые объекты отсоединены от сессии, все поля уже загружены.
+
+def _get_template(template_id: int):
+    with SessionLocal() as session:
+        return session.query(Template).filter(Template.id == template_id).first()
+
+def _get_template_by_name(name: str):
+    with SessionLocal() as session:
+        return session.query(Template).filter(Template.name == name).first()
+
+def _get_all_templates():
+    with SessionLocal() as session:
+        return session.query(Template).all()
+
+def _create_template(fields: dict):
+    with SessionLocal(expire_on_commit=False) as session:
+        template = Template(**fields)
+        session.add(template)
+        session.commit()
+        return template
+
+def _update_template(template_id: int, fields: dict):
+    with SessionLocal(expire_on_commit=False) as session:
+        template = session.query(Template).filter(Template.id == template_id).first()
+        if not template:
+            return None
+        # Новая версия текста — скомпилированный текст в кеше больше не используется
+        if "text" in fields and fields["text"] != template.text:
+            template.version += 1
+        for key, value in fields.items():
+            setattr(template, key, value)
+        session.commit()
+        return template
+
+def _delete_template_where(condition):
+    with SessionLocal(expire_on_commit=False) as session:
+        template = session.query(Template).filter(condition).first()
+        if not template:
+            return None
+        session.query(TemplateChat).filter(TemplateChat.template_id == template.id).delete()
+        session.delete(template)
+        session.commit()
+        return template
+
+def _delete_template(template_id: int):
+    return _delete_template_where(Template.id == template_id)
+
+def _delete_template_by_name(name: str):
+    return _delete_template_where(Template.name == name)
+
+def _get_templates_page(cursor_id: int, backward: bool, limit: int):
+    with SessionLocal() as session:
+        query = session.query(Template.id, Template.name)
+        cursor_name = session.query(Template.name).filter(Template.id == cursor_id).scalar() if cursor_id else None
+        rows = []
+        if cursor_name is not None and not backward:
+            rows = query.filter(Template.name > cursor_name).order_by(Template.name).limit(limit + 1).all()
+            has_prev, has_next = True, len(rows) > limit
+            rows = rows[:limit]
+        elif cursor_name is not None:
+            rows = query.filter(Template.name < cursor_name).order_by(Template.name.desc()).limit(limit + 1).all()
+            has_prev, has_next = len(rows) > limit, True
+            rows = rows[:limit][::-1]
+        if not rows:
+            # Первая страница, а также случай, когда шаблон-курсор удалён
+            rows = query.order_by(Template.name).limit(limit + 1).all()
+            has_prev, has_next = False, len(rows) > limit
+            rows = rows[:limit]
+        return [(template_id, name) for template_id, name in rows], has_prev, has_next
+
+def _get_template_chat_ids(template_id: int):
+    with SessionLocal() as session:
+        rows = session.query(TemplateChat.chat_id).filter(TemplateChat.template_id == template_id).order_by(TemplateChat.id)
+        return [chat_id for chat_id, in rows]
+
+def _get_template_chat_counts():
+    with SessionLocal() as session:
+        rows = session.query(TemplateChat.template_id, func.count(TemplateChat.id)).group_by(TemplateChat.template_id)
+        return {template_id: count for template_id, count in rows}
+
+def _get_shared_chats(min_templates: int):
+    with SessionLocal() as session:
+        shared = session.query(TemplateChat.chat_id).group_by(TemplateChat.chat_id).having(
+            func.count(TemplateChat.id) > min_templates
+        )
+        rows = session.query(TemplateChat.chat_id, TemplateChat.template_id).filter(TemplateChat.chat_id.in_(shared))
+        chats = {}
+        for chat_id, template_id in rows:
+            chats.setdefault(chat_id, []).append(template_id)
+        return chats
+
+def _add_template_chats(template_id: int, chat_ids: list):
+    with SessionLocal() as session:
+        existing = {chat_id for chat_id, in session.query(TemplateChat.chat_id).filter(TemplateChat.template_id == template_id)}
+        new_ids = [chat_id for chat_id in dict.fromkeys(chat_ids) if chat_id not in existing]
+        session.add_all(TemplateChat(template_id=template_id, chat_id=chat_id) for chat_id in new_ids)
+        session.commit()
+        return len(new_ids)
+
+def _remove_template_chat(template_id: int, chat_id: int):
+    with SessionLocal() as session:
+        deleted = session.query(TemplateChat).filter(
+            TemplateChat.template_id == template_id, TemplateChat.chat_id == chat_id
+        ).delete()
+        session.commit()
+        return deleted > 0
+
+def _count_image_references(image_path: str):
+    with SessionLocal() as session:
+        return session.query(Template).filter(Template.image_path == image_path).count()
+
+def _get_used_image_paths():
+    with SessionLocal() as session:
+        rows = session.query(Template.image_path).filter(Template.image_path.isnot(None)).distinct()
+        return {image_path for image_path, in rows}
+
+def _get_templates_after(after_id: int, limit: int):
+    with SessionLocal() as session:
+        templates = session.query(Template).filter(Template.id > after_id).order_by(Template.id).limit(limit).all()
+        chat_ids = {template.id: [] for template in templates}
+        if templates:
+            rows = session.query(TemplateChat.template_id, TemplateChat.chat_id).filter(
+                TemplateChat.template_id.in_(chat_ids)
+            ).order_by(TemplateChat.id)
+            for template_id, chat_id in rows:
+                chat_ids[template_id].append(chat_id)
+        return [(template, chat_ids[template.id]) for template in templates]
+
+def _upsert_templates(records: list):
+    names = list(dict.fromkeys(record["name"] for record in records))
+    with SessionLocal() as session:
+        existing = {name for name, in session.query(Template.name).filter(Template.name.in_(names))}
+        session.execute(_template_upsert, [
+            {"name": record["name"], **{field: record.get(field) for field in _TEMPLATE_FIELDS}} for record in records
+        ])
+        ids = dict(session.query(Template.name, Template.id).filter(Template.name.in_(names)))
+        chats = [
+            {"template_id": ids[record["name"]], "chat_id": chat_id}
+            for record in records for chat_id in record.get("chats") or ()
+        ]
+        if chats:
+            session.execute(_chat_insert, chats)
+        session.commit()
+        return ids, existing
+
+def _increment_send_count(template_id: int):
+    with SessionLocal() as session:
+        session.query(Template).filter(Template.id == template_id).update(
+            {Template.send_count: Template.send_count + 1}, synchronize_session=False
+        )
+        count = session.query(Template.send_count).filter(Template.id == template_id).scalar()
+        session.commit()
+        return count
+
+def _get_variables():
+    with SessionLocal() as session:
+        return dict(session.query(TemplateVariable.name, TemplateVariable.value))
+
+def _set_variable(name: str, value: str):
+    with SessionLocal() as session:
+        session.merge(TemplateVariable(name=name, value=value))
+        session.commit()
+
+def _delete_variable(name: str):
+    with SessionLocal() as session:
+        deleted = session.query(TemplateVariable).filter(TemplateVariable.name == name).delete()
+        session.commit()
+        return deleted > 0
+
+def _add_unfinished_sends(rows: list):
+    with SessionLocal() as session:
+        session.execute(UnfinishedSend.__table__.insert(), rows)
+        session.commit()
+
+def _take_unfinished_sends():
+    with SessionLocal() as session:
+        rows = session.query(
+            UnfinishedSend.id, UnfinishedSend.template_id, UnfinishedSend.scheduled_at,
+            UnfinishedSend.text, UnfinishedSend.chat_ids, UnfinishedSend.recorded_at,
+        ).order_by(UnfinishedSend.id).all()
+        # Запись удаляется по одной: если записи одновременно забирают два экземпляра,
+        # каждую получит только тот, чьё удаление прошло
+        taken = [
+            row for row in rows
+            if session.query(UnfinishedSend).filter(UnfinishedSend.id == row.id).delete(synchronize_session=False)
+        ]
+        session.commit()
+        return taken
+
+def _record_clean_shutdown(stopped_at: float):
+    with SessionLocal() as session:
+        session.add(CleanShutdown(stopped_at=stopped_at))
+        session.commit()
+
+def _take_clean_shutdown():
+    with SessionLocal() as session:
+        stopped_at = session.query(func.max(CleanShutdown.stopped_at)).scalar()
+        session.query(CleanShutdown).delete(synchronize_session=False)
+        session.commit()
+        return stopped_at
+
+def _get_template_revision():
+    with SessionLocal() as session:
+        return session.query(TemplateRevision.revision).filter(TemplateRevision.id == 1).scalar() or 0
+
+async def get_template(template_id: int):
+    """Получение шаблона по ID. Возвращает None, если шаблон не найден."""
+    return await run_in_db(_get_template, template_id)
+
+async def get_template_by_name(name: str):
+    """Получение шаблона по названию. Возвращает None, если шаблон не найден."""
+    return await run_in_db(_get_template_by_name, name)
+
+async def get_all_templates():
+    """Получение списка всех шаблонов."""
+    return await run_in_db(_get_all_templates)
+
+async def create_template(**fields):
+    """Создание нового шаблона."""
+    return await run_in_db(_create_template, fields)
+
+async def update_template(template_id: int, **fields):
+    """Обновление полей шаблона. Возвращает None, если шаблон не найден."""
+    return await run_in_db(_update_template, template_id, fields)
+
+async def delete_template(template_id: int):
+    """Удаление шаблона по ID. Возвращает удалённый шаблон или None."""
+    return await run_in_db(_delete_template, template_id)
+
+async def delete_template_by_name(name: str):
+    """Удаление шаблона по названию. Возвращает удалённый шаблон или None."""
+    return await run_in_db(_delete_template_by_name, name)
+
+async def get_template_chat_ids(template_id: int):
+    """Получение списка чатов, в которые рассылается шаблон."""
+    return await run_in_db(_get_template_chat_ids, template_id)
+
+async def get_template_chat_counts():
+    """Количество чатов рассылки по ID шаблона (шаблоны без своих чатов не включаются)."""
+    return await run_in_db(_get_template_chat_counts)
+
+async def get_shared_chats(min_templates: int):
+    """Чаты, в которые рассылается больше min_templates шаблонов: ID чата -> список ID шаблонов."""
+    return await run_in_db(_get_shared_chats, min_templates)
+
+async def add_template_chats(template_id: int, chat_ids: list):
+    """Добавление чатов рассылки шаблона. Возвращает количество новых чатов."""
+    return await run_in_db(_add_template_chats, template_id, chat_ids)
+
+async def remove_template_chat(template_id: int, chat_id: int):
+    """Удаление чата из рассылки шаблона. Возвращает False, если чата не было."""
+    return await run_in_db(_remove_template_chat, template_id, chat_id)
+
+async def count_image_references(image_path: str):
+    """Количество шаблонов, использующих изображение."""
+    return await run_in_db(_count_image_references, image_path)
+
+async def get_used_image_paths():
+    """Множество путей изображений, на которые ссылаются шаблоны."""
+    return await run_in_db(_get_used_image_paths)
+
+async def get_templates_page(cursor_id: int = 0, backward: bool = False, limit: int = 10):
+    """
+    Страница шаблонов в порядке названий после шаблона cursor_id (или перед ним, если backward).
+    Возвращает список пар (id, название) и признаки наличия предыдущей и следующей страниц.
+    """
+    return await run_in_db(_get_templates_page, cursor_id, backward, limit)
+
+async def get_templates_after(after_id: int = 0, limit: int = 500):
+    """
+    Следующие limit шаблонов в порядке ID после after_id вместе со списками их чатов:
+    список пар (шаблон, [ID чатов]). Для обхода всех шаблонов без загрузки их в память.
+    """
+    return await run_in_db(_get_templates_after, after_id, limit)
+
+async def upsert_templates(records: list):
+    """
+    Создание или обновление шаблонов по названию одной транзакцией.
+    records — словари с полями name, text, image_path, button_text, button_url
+    и списком chats (чаты добавляются к уже настроенным).
+    Возвращает словарь название -> ID и множество названий, которые уже были в базе.
+    """
+    return await run_in_db(_upsert_templates, records)
+
+async def increment_send_count(template_id: int):
+    """Увеличение счётчика рассылок шаблона. Возвращает номер текущей рассылки (None, если шаблона нет)."""
+    return await run_in_db(_increment_send_count, template_id)
+
+async def get_variables():
+    """Все пользовательские переменные шаблонов: название -> значение."""
+    return await run_in_db(_get_variables)
+
+async def set_variable(name: str, value: str):
+    """Создание или изменение пользовательской переменной."""
+    return await run_in_db(_set_variable, name, value)
+
+async def delete_variable(name: str):
+    """Удаление пользовательской переменной. Возвращает False, если её не было."""
+    return await run_in_db(_delete_variable, name)
+
+async def add_unfinished_sends(rows: list):
+    """
+    Запись рассылок, не завершённых при остановке бота: словари с полями template_id,
+    scheduled_at, text, chat_ids (JSON) и recorded_at.
+    """
+    if rows:
+        await run_in_db(_add_unfinished_sends, rows)
+
+async def take_unfinished_sends():
+    """Незавершённые рассылки с удалением их из базы (каждую получает один экземпляр бота)."""
+    return await run_in_db(_take_unfinished_sends)
+
+async def record_clean_shutdown(stopped_at: float):
+    """Отметка штатной остановки бота."""
+    await run_in_db(_record_clean_shutdown, stopped_at)
+
+async def take_clean_shutdown():
+    """Время последней штатной остановки (Unix) или None, если её не было; отметки удаляются."""
+    return await run_in_db(_take_clean_shutdown)
+
+async def get_template_revision():
+    """Номер последнего изменения шаблонов и их чатов (растёт при любой записи, в том числе другими экземплярами)."""
+    return await run_in_db(_get_template_revision)
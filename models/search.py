@@ -0,0 +1,154 @@
+# models/search.py
+
+import logging
+import re
+import time
+from collections import OrderedDict
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from config import SEARCH_CACHE_TTL, SEARCH_RESULTS_LIMIT
+from database import SessionLocal, run_in_db
+from models.models import Template
+
+logger = logging.getLogger(__name__)
+
+# Полнотекстовый индекс FTS5 по названию и тексту шаблонов. Таблица хранит
+# только индекс (content='templates'), синхронизация с templates — триггерами.
+_SEARCH_SCHEMA = [
+    """
+    CREATE VIRTUAL TABLE templates_fts USING fts5(
+        name, text, content='templates', content_rowid='id', tokenize='unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER templates_fts_ai AFTER INSERT ON templates BEGIN
+        INSERT INTO templates_fts(rowid, name, text) VALUES (new.id, new.name, new.text);
+    END
+    """,
+    """
+    CREATE TRIGGER templates_fts_ad AFTER DELETE ON templates BEGIN
+        INSERT INTO templates_fts(templates_fts, rowid, name, text) VALUES ('delete', old.id, old.name, old.text);
+    END
+    """,
+    """
+    CREATE TRIGGER templates_fts_au AFTER UPDATE OF name, text ON templates BEGIN
+        INSERT INTO templates_fts(templates_fts, rowid, name, text) VALUES ('delete', old.id, old.name, old.text);
+        INSERT INTO templates_fts(rowid, name, text) VALUES (new.id, new.name, new.text);
+    END
+    """,
+    # Заполнение индекса шаблонами, созданными до появления поиска
+    "INSERT INTO templates_fts(templates_fts) VALUES ('rebuild')",
+]
+
+# Совпадение в названии весит больше, чем в тексте
+_SEARCH_QUERY = text("""
+    SELECT templates.id, templates.name, templates.text
+    FROM templates_fts JOIN templates ON templates.id = templates_fts.rowid
+    WHERE templates_fts MATCH :query
+    ORDER BY bm25(templates_fts, 10.0, 1.0)
+    LIMIT :limit
+""")
+
+# None — наличие индекса ещё не проверялось (проверяется при первом поиске)
+_fts_available = None
+
+def _search_index_exists(connection) -> bool:
+    return connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'templates_fts'")
+    ).first() is not None
+
+def create_search_index(connection):
+    """
+    Миграция: создание полнотекстового индекса шаблонов, если его ещё нет.
+    Если SQLite собран без FTS5, поиск выполняется по подстроке в названии.
+    """
+    global _fts_available
+    if _search_index_exists(connection):
+        return
+    try:
+        for statement in _SEARCH_SCHEMA:
+            connection.execute(text(statement))
+    except OperationalError as e:
+        if "fts5" not in str(e):
+            raise
+        _fts_available = False
+        logger.warning(f"Полнотекстовый поиск недоступен, используется поиск по названию: {e}")
+        return
+    logger.info("Создан полнотекстовый индекс шаблонов.")
+
+def _detect_search_index(connection) -> bool:
+    """Выбор способа поиска по наличию полнотекстового индекса в базе (один раз, при первом поиске)."""
+    global _fts_available
+    if _fts_available is None:
+        _fts_available = _search_index_exists(connection)
+        if not _fts_available:
+            logger.warning("Полнотекстовый индекс шаблонов отсутствует, используется поиск по названию.")
+    return _fts_available
+
+def build_match_query(query: str):
+    """
+    Преобразование введённой строки в запрос FTS5: каждое слово ищется по префиксу.
+    Возвращает None, если в строке нет слов.
+    """
+    words = re.findall(r"\w+", query.lower())
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+def _search_templates(query: str, limit: int):
+    with SessionLocal() as session:
+        match = build_match_query(query)
+        if match is None:
+            rows = session.query(Template.id, Template.name, Template.text).order_by(Template.name).limit(limit)
+        elif _detect_search_index(session.connection()):
+            rows = session.execute(_SEARCH_QUERY, {"query": match, "limit": limit})
+        else:
+            pattern = query.strip().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            rows = session.query(Template.id, Template.name, Template.text).filter(
+                Template.name.ilike(f"%{pattern}%", escape="\\")
+            ).order_by(Template.name).limit(limit)
+        return [(template_id, name, template_text) for template_id, name, template_text in rows]
+
+class SearchCache:
+    """
+    Кеш результатов поиска по строке запроса на ttl секунд: пока администратор
+    набирает запрос, повторяющиеся строки не обращаются к базе данных.
+    """
+
+    def __init__(self, ttl: float, max_size: int = 256):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._items = OrderedDict()  # Запрос -> (время истечения, результаты)
+
+    def get(self, query: str):
+        item = self._items.get(query)
+        if item is None:
+            return None
+        expires, results = item
+        if expires < time.monotonic():
+            del self._items[query]
+            return None
+        return results
+
+    def put(self, query: str, results: list):
+        self._items[query] = (time.monotonic() + self.ttl, results)
+        self._items.move_to_end(query)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def clear(self):
+        self._items.clear()
+
+search_cache = SearchCache(SEARCH_CACHE_TTL)
+
+async def search_templates(query: str, limit: int = SEARCH_RESULTS_LIMIT):
+    """
+    Поиск шаблонов по названию и тексту, лучшие совпадения первыми.
+    Возвращает список кортежей (id, название, текст).
+    """
+    key = query.strip().lower()
+    results = search_cache.get(key)
+    if results is None:
+        results = await run_in_db(_search_templates, key, limit)
+        search_cache.put(key, results)
+    return results
@@ -0,0 +1,165 @@
+# tools/leader_failover.py
+"""
+Локальная проверка выбора ведущего экземпляра планировщика.
+
+Запускает несколько процессов с планировщиком бота и общей базой SQLite во
+временном каталоге. Задача срабатывает каждую секунду и записывает, какой
+процесс её запустил. Проверяется, что задачу запускает только один процесс.
+Затем ведущий процесс убивается (SIGKILL — аренда истекает сама), а следующий
+ведущий завершается штатно (SIGTERM — аренда освобождается). Для каждого
+случая измеряется, через сколько секунд задачу начинает запускать резервный
+процесс.
+
+Запуск из корня проекта:
+    python tools/leader_failover.py [--instances 3] [--engine heap] [--ttl 3] [--renew 1]
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIRES_LOG = "fires.log"
+
+async def record_fire():
+    """Задача планировщика: запись PID запустившего процесса и времени запуска."""
+    with open(FIRES_LOG, "a") as log:
+        log.write(f"{os.getpid()} {time.time():.3f}\n")
+
+def prepare_child():
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault("BOT_TOKEN", "123456:FAILOVER-TOKEN")
+    os.environ.setdefault("GROUP_ID", "-1")
+    os.environ.setdefault("ADMIN_ID", "1")
+    import logging
+    logging.basicConfig(level=logging.WARNING, format="%(process)d %(name)s: %(message)s")
+
+async def setup_jobs():
+    """Создание схемы и задачи, срабатывающей каждую секунду."""
+    from apscheduler.triggers.interval import IntervalTrigger
+    from models.migrations import migrate_database
+    migrate_database()
+    import handlers.timers as timers
+    timers.scheduler.start(paused=True)
+    timers.scheduler.add_job(record_fire, IntervalTrigger(seconds=1), id="failover_tick", replace_existing=True)
+    await asyncio.sleep(0.1)
+    timers.scheduler.shutdown(wait=False)
+
+async def run_instance():
+    """Экземпляр бота без Telegram: планировщик и продление аренды до SIGTERM."""
+    import handlers.timers as timers
+    timers.scheduler.start(paused=True)
+    await timers.scheduler_leader.start()
+    stop = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+    await stop.wait()
+    await timers.scheduler_leader.stop()
+    timers.scheduler.shutdown(wait=False)
+
+def read_fires():
+    if not os.path.exists(FIRES_LOG):
+        return []
+    with open(FIRES_LOG) as log:
+        return [(int(pid), float(at)) for pid, at in (line.split() for line in log if line.strip())]
+
+def wait_for_fire(after: float, exclude: set, timeout: float):
+    """Первый запуск задачи после after процессом не из exclude: (PID, время) или None."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        for pid, at in read_fires():
+            if at > after and pid not in exclude:
+                return pid, at
+        time.sleep(0.05)
+    return None
+
+def count_duplicates(fires) -> int:
+    """Количество секунд расписания, в которые задачу запустили разные процессы."""
+    if not fires:
+        return 0
+    first = fires[0][1]
+    slots = {}
+    for pid, at in fires:
+        slots.setdefault(round(at - first), set()).add(pid)
+    return sum(1 for pids in slots.values() if len(pids) > 1)
+
+def main(args) -> int:
+    workdir = tempfile.mkdtemp(prefix="bot_failover_")
+    env = dict(os.environ, SCHEDULER_ENGINE=args.engine, LEADER_LEASE_TTL=str(args.ttl),
+               LEADER_RENEW_INTERVAL=str(args.renew))
+    command = [sys.executable, os.path.abspath(__file__), "--child"]
+    print(f"Рабочий каталог: {workdir}, движок: {args.engine}, аренда {args.ttl} с, продление {args.renew} с")
+    subprocess.run(command + ["setup"], cwd=workdir, env=env, check=True)
+    os.chdir(workdir)
+
+    processes = {}
+    for _ in range(args.instances):
+        process = subprocess.Popen(command + ["run"], cwd=workdir, env=env)
+        processes[process.pid] = process
+    failures = []
+    alive = set(processes)
+    try:
+        first = wait_for_fire(0, set(), args.ttl + 10)
+        if first is None:
+            failures.append("задача не запустилась ни в одном процессе")
+        else:
+            time.sleep(args.observe)
+            leader = first[0]
+            firing = {pid for pid, at in read_fires()}
+            print(f"Процессов: {args.instances}, запускают задачу: {sorted(firing)}")
+            if firing != {leader}:
+                failures.append(f"задачу запускают несколько процессов: {sorted(firing)}")
+
+        for how, sig, limit in (("SIGKILL", signal.SIGKILL, args.ttl + 2 * args.renew + 1),
+                                ("SIGTERM", signal.SIGTERM, 2 * args.renew + 1)):
+            if first is None or len(alive) < 2:
+                break
+            stopped_at = time.time()
+            os.kill(leader, sig)
+            processes[leader].wait()
+            alive.discard(leader)
+            takeover = wait_for_fire(stopped_at, {leader}, limit + 10)
+            if takeover is None:
+                failures.append(f"после {how} задачу никто не запускает")
+                break
+            gap = takeover[1] - stopped_at
+            print(f"{how} ведущего {leader}: задачу через {gap:.2f} с запускает {takeover[0]} (допустимо до {limit:.0f} с)")
+            if gap > limit:
+                failures.append(f"после {how} перерыв {gap:.2f} с больше допустимых {limit:.0f} с")
+            leader = takeover[0]
+            time.sleep(args.observe)
+    finally:
+        for pid in alive:
+            processes[pid].send_signal(signal.SIGTERM)
+        for pid in alive:
+            processes[pid].wait()
+
+    fires = read_fires()
+    duplicates = count_duplicates(fires)
+    print(f"Запусков задачи: {len(fires)}, из них повторных в одну секунду: {duplicates}")
+    if duplicates:
+        failures.append(f"повторные запуски задачи в одну секунду: {duplicates}")
+    for failure in failures:
+        print(f"ОШИБКА: {failure}")
+    print("OK" if not failures else "FAILED")
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--instances", type=int, default=3, help="количество процессов")
+    parser.add_argument("--engine", default="apscheduler", choices=("apscheduler", "heap"), help="движок планировщика")
+    parser.add_argument("--ttl", type=float, default=3.0, help="срок аренды, с")
+    parser.add_argument("--renew", type=float, default=1.0, help="период продления аренды, с")
+    parser.add_argument("--observe", type=float, default=4.0, help="сколько секунд наблюдать после каждого шага")
+    parser.add_argument("--child", choices=("setup", "run"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        prepare_child()
+        loop = asyncio.get_event_loop()
+        loop.run_until_complete(setup_jobs() if args.child == "setup" else run_instance())
+    else:
+        sys.exit(main(args))
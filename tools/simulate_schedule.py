@@ -0,0 +1,84 @@
+# tools/simulate_schedule.py
+"""
+Симуляция расписаний в виртуальном времени — проверка изменения расписаний
+до того, как оно попадёт в бота.
+
+Загружает все задачи template_{id} из базы бота, применяет предполагаемые
+изменения и рассчитывает отправки на горизонт (по умолчанию неделя) без
+ожидания: отправки по дням и минутам, пиковые минуты и секунды, очередь
+отправки при лимите RATE_LIMIT_GLOBAL_PER_SECOND и превышения лимита
+RATE_LIMIT_CHAT_PER_MINUTE на один чат. Сами расписания не меняются.
+
+Запуск из корня проекта с тем же .env, что и бот:
+    python tools/simulate_schedule.py [--days 7] [--csv minutes.csv]
+    python tools/simulate_schedule.py --set "шаблон1=Ежедневно в 12:00" --unset шаблон2
+    python tools/simulate_schedule.py --spread 600
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=float, default=7, help="горизонт симуляции в сутках")
+    parser.add_argument("--set", action="append", default=[], metavar="ШАБЛОН=РАСПИСАНИЕ",
+                        help='задать расписание шаблону, например "шаблон1=Каждые 12 часов"')
+    parser.add_argument("--unset", action="append", default=[], metavar="ШАБЛОН", help="убрать расписание шаблона")
+    parser.add_argument("--spread", type=int, help="пересчитать сдвиги всех задач, как при SCHEDULE_SPREAD_SECONDS")
+    parser.add_argument("--top", type=int, default=10, help="сколько пиковых минут и чатов показывать")
+    parser.add_argument("--csv", help="сохранить отправки по минутам в CSV-файл")
+    return parser.parse_args()
+
+async def apply_changes(jobs: list, args) -> list:
+    """Предполагаемые изменения расписаний поверх задач из базы."""
+    from handlers.timers import build_schedule_trigger
+    from models.repository import get_template_by_name
+    from utils.simulator import SimJob, respread
+    by_template = {job.template_id: job for job in jobs}
+    for name in args.unset:
+        template = await get_template_by_name(name)
+        if not template:
+            raise SystemExit(f"Шаблон '{name}' не найден.")
+        by_template.pop(template.id, None)
+    for change in args.set:
+        name, _, option = change.partition("=")
+        template = await get_template_by_name(name.strip())
+        if not template:
+            raise SystemExit(f"Шаблон '{name.strip()}' не найден.")
+        trigger = build_schedule_trigger(option.strip(), template.id)
+        if trigger is None:
+            raise SystemExit(f"Нераспознанное расписание '{option.strip()}'.")
+        by_template[template.id] = SimJob(template.id, trigger)
+    jobs = list(by_template.values())
+    if args.spread is not None:
+        jobs = respread(jobs, args.spread)
+    return jobs
+
+async def run(args):
+    from config import RATE_LIMIT_GLOBAL_PER_SECOND, RATE_LIMIT_CHAT_PER_MINUTE
+    from models.migrations import migrate_database
+    from utils.simulator import format_simulation, per_minute_csv
+    migrate_database()
+    import handlers.timers as timers
+    # Планировщик на паузе: задачи только читаются
+    timers.scheduler.start(paused=True)
+    try:
+        jobs = await apply_changes(await timers.get_template_jobs(), args)
+        result = await timers.simulate_schedules(jobs, args.days)
+    finally:
+        timers.scheduler.shutdown(wait=False)
+    print(format_simulation(result, RATE_LIMIT_GLOBAL_PER_SECOND, RATE_LIMIT_CHAT_PER_MINUTE, top=args.top))
+    if args.csv:
+        with open(args.csv, "w", encoding="utf-8") as f:
+            f.writelines(per_minute_csv(result))
+        print(f"\nОтправки по минутам сохранены в {args.csv}.")
+
+if __name__ == '__main__':
+    args = parse_args()
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(name)s: %(message)s")
+    asyncio.get_event_loop().run_until_complete(run(args))
@@ -0,0 +1,67 @@
+# tools/template_io.py
+"""
+Экспорт и импорт шаблонов из командной строки — для архивов больше
+ограничений Telegram (50 МБ на отправку, 20 МБ на загрузку файла ботом).
+
+Работает с базой данных и каталогом images/ текущего каталога, поэтому
+запускается из корня проекта с тем же .env, что и бот:
+    python tools/template_io.py export templates.zip
+    python tools/template_io.py import templates.zip [--schedules]
+
+Изменения расписаний другими процессами бот видит при продлении аренды
+ведущего (LEADER_LEASE_TTL > 0); без выбора ведущего перезапустите бота
+после импорта с --schedules.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="выгрузить все шаблоны в zip-архив")
+    export.add_argument("path", help="путь к создаваемому архиву")
+    load = commands.add_parser("import", help="загрузить шаблоны из архива экспорта или файла JSONL")
+    load.add_argument("path", help="путь к архиву или файлу JSONL")
+    load.add_argument("--schedules", action="store_true", help="восстановить расписания шаблонов")
+    return parser.parse_args()
+
+class ProgressPrinter:
+    """Вывод хода операции не чаще раза в секунду."""
+
+    def __init__(self):
+        self.last = 0.0
+
+    async def __call__(self, result):
+        if time.monotonic() - self.last >= 1:
+            self.last = time.monotonic()
+            print(result.summary(), flush=True)
+
+async def run(args):
+    from models.migrations import migrate_database
+    from utils.template_io import export_templates, import_templates
+    migrate_database()
+    import handlers.timers as timers
+    # Планировщик на паузе: задачи можно читать и менять, но не запускать
+    timers.scheduler.start(paused=True)
+    try:
+        if args.command == "export":
+            result = await export_templates(args.path, schedules=await timers.get_template_schedules(),
+                                            progress=ProgressPrinter())
+        else:
+            set_schedules = timers.set_template_schedules if args.schedules else None
+            result = await import_templates(args.path, set_schedules=set_schedules, progress=ProgressPrinter())
+    finally:
+        timers.scheduler.shutdown(wait=False)
+    print(result.summary())
+
+if __name__ == '__main__':
+    args = parse_args()
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(name)s: %(message)s")
+    asyncio.get_event_loop().run_until_complete(run(args))
@@ -0,0 +1,95 @@
+# tools/webhook_harness.py
+"""
+Локальная проверка режима вебхука без доступа к сети.
+
+Поднимает сервер aiohttp с обработчиком вебхука бота на 127.0.0.1, отправляет
+в него JSON обновлений (с верным и неверным секретным токеном) и проверяет,
+что обновления доходят до диспетчера.
+
+Запуск из корня проекта:
+    python tools/webhook_harness.py [--updates 200]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "123456:HARNESS-TOKEN")
+os.environ.setdefault("GROUP_ID", "-1")
+os.environ.setdefault("ADMIN_ID", "1")
+
+import aiohttp
+from aiohttp import web
+from aiogram import Bot, Dispatcher, types
+from utils.webhook import configure_webhook_app, SECRET_TOKEN_HEADER
+
+SECRET = "harness-secret"
+PATH = "/webhook"
+
+def make_update(update_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": 1, "type": "private"},
+            "from": {"id": 1, "is_bot": False, "first_name": "harness"},
+            "text": f"ping {update_id}",
+        },
+    }
+
+async def main(updates: int) -> int:
+    bot = Bot(token=os.environ["BOT_TOKEN"])
+    dp = Dispatcher(bot)
+    received = []
+
+    async def record(message: types.Message):
+        received.append(message.message_id)
+
+    dp.register_message_handler(record)
+
+    runner = web.AppRunner(configure_webhook_app(dp, web.Application(), path=PATH, secret=SECRET))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    url = f"http://127.0.0.1:{port}{PATH}"
+
+    failures = []
+    latencies = []
+    async with aiohttp.ClientSession() as session:
+        async with session.post(url, json=make_update(0), headers={SECRET_TOKEN_HEADER: "wrong"}) as response:
+            if response.status != 401:
+                failures.append(f"запрос с неверным токеном вернул {response.status}, ожидался 401")
+        async with session.post(url, json=make_update(0)) as response:
+            if response.status != 401:
+                failures.append(f"запрос без токена вернул {response.status}, ожидался 401")
+        for update_id in range(1, updates + 1):
+            started = time.perf_counter()
+            async with session.post(url, json=make_update(update_id), headers={SECRET_TOKEN_HEADER: SECRET}) as response:
+                latencies.append(time.perf_counter() - started)
+                if response.status != 200:
+                    failures.append(f"обновление {update_id}: статус {response.status}")
+
+    await runner.cleanup()
+    await (await bot.get_session()).close()
+
+    if sorted(received) != list(range(1, updates + 1)):
+        failures.append(f"обработано {len(received)} обновлений из {updates}")
+    latencies.sort()
+    print(f"Обновлений: {updates}, обработано: {len(received)}")
+    print(f"Задержка ответа вебхука: p50 {latencies[len(latencies) // 2] * 1000:.2f} мс, "
+          f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.2f} мс")
+    for failure in failures:
+        print(f"ОШИБКА: {failure}")
+    print("OK" if not failures else "FAILED")
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=200, help="количество отправляемых обновлений")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.updates)))
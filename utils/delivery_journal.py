@@ -0,0 +1,154 @@
+# utils/delivery_journal.py
+
+import asyncio
+import logging
+import math
+import time
+import typing
+from sqlalchemy import func, case
+from config import DELIVERY_FLUSH_INTERVAL, DELIVERY_FLUSH_BATCH, DELIVERY_RETENTION_DAYS
+from database import SessionLocal, run_in_db
+from models.models import Delivery, Template
+
+logger = logging.getLogger(__name__)
+
+_insert = Delivery.__table__.insert()
+
+def _write_deliveries(rows: list, purge_before: typing.Optional[float]):
+    """Запись пакета доставок одним executemany и удаление устаревших записей."""
+    with SessionLocal() as session:
+        if rows:
+            session.execute(_insert, rows)
+        if purge_before is not None:
+            session.query(Delivery).filter(Delivery.sent_at < purge_before).delete()
+        session.commit()
+
+class DeliveryJournal:
+    """
+    Буфер журнала доставок с отложенной записью.
+
+    Отправка только добавляет запись в список в памяти; записи попадают
+    в базу пакетами раз в flush_interval секунд или сразу, если накопилось
+    flush_batch записей. Если база недоступна, записи остаются в буфере,
+    но не больше max_buffered — самые старые отбрасываются.
+    """
+
+    def __init__(self, flush_interval: float = DELIVERY_FLUSH_INTERVAL, flush_batch: int = DELIVERY_FLUSH_BATCH,
+                 retention_days: int = DELIVERY_RETENTION_DAYS):
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self.retention = retention_days * 86400
+        self.max_buffered = flush_batch * 100
+        self._buffer = []
+        self._last_purge = 0.0
+        self._flush_task = None
+        self._flush_event = None
+
+    def _ensure_started(self):
+        if self._flush_task is None:
+            self._flush_event = asyncio.Event()
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    def record(self, template_id: int, chat_id: int, scheduled_at: float, sent_at: float,
+               message_id: typing.Optional[int] = None, error: typing.Optional[str] = None):
+        """Добавление записи о доставке в буфер (без обращения к базе данных)."""
+        self._ensure_started()
+        self._buffer.append({
+            "template_id": template_id,
+            "chat_id": chat_id,
+            "scheduled_at": scheduled_at,
+            "sent_at": sent_at,
+            "latency": max(0.0, sent_at - scheduled_at),
+            "message_id": message_id,
+            "error": error,
+        })
+        if len(self._buffer) >= self.flush_batch:
+            self._flush_event.set()
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_event.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_event.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка при записи журнала доставок в базу данных: {e}")
+
+    async def flush(self):
+        """
+        Запись накопленных доставок в базу данных.
+        """
+        now = time.time()
+        purge_before = None
+        if self.retention and now - self._last_purge >= 3600:
+            purge_before = now - self.retention
+            self._last_purge = now
+        if not self._buffer and purge_before is None:
+            return
+        rows, self._buffer = self._buffer, []
+        try:
+            await run_in_db(_write_deliveries, rows, purge_before)
+        except Exception:
+            self._buffer[:0] = rows
+            overflow = len(self._buffer) - self.max_buffered
+            if overflow > 0:
+                del self._buffer[:overflow]
+                logger.warning(f"Буфер журнала доставок переполнен, отброшено записей: {overflow}.")
+            raise
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+            self._flush_task = None
+        await self.flush()
+
+delivery_journal = DeliveryJournal()
+
+class DeliveryStats(typing.NamedTuple):
+    total: int
+    failed: int
+    avg_latency: float
+    p95_latency: float
+    max_latency: float
+    by_template: list    # (ID шаблона, название, доставок, ошибок, средняя задержка)
+    recent_errors: list  # (ID шаблона, название, ID чата, время отправки, ошибка)
+
+def _get_delivery_stats(since: float, template_id: typing.Optional[int], top: int):
+    with SessionLocal() as session:
+        scope = [Delivery.sent_at >= since]
+        if template_id is not None:
+            scope.append(Delivery.template_id == template_id)
+        failed = func.sum(case((Delivery.error.isnot(None), 1), else_=0))
+        total, failed_count, avg_latency, max_latency = session.query(
+            func.count(Delivery.id), failed, func.avg(Delivery.latency), func.max(Delivery.latency)
+        ).filter(*scope).one()
+        p95_latency = 0.0
+        if total:
+            p95_latency = session.query(Delivery.latency).filter(*scope).order_by(
+                Delivery.latency).offset(math.ceil(total * 0.95) - 1).limit(1).scalar()
+        by_template = session.query(
+            Delivery.template_id, Template.name, func.count(Delivery.id), failed, func.avg(Delivery.latency)
+        ).outerjoin(Template, Template.id == Delivery.template_id).filter(*scope).group_by(
+            Delivery.template_id).order_by(func.count(Delivery.id).desc()).limit(top).all()
+        recent_errors = session.query(
+            Delivery.template_id, Template.name, Delivery.chat_id, Delivery.sent_at, Delivery.error
+        ).outerjoin(Template, Template.id == Delivery.template_id).filter(
+            *scope, Delivery.error.isnot(None)
+        ).order_by(Delivery.sent_at.desc()).limit(top).all()
+        return DeliveryStats(
+            total, failed_count or 0, avg_latency or 0.0, p95_latency or 0.0, max_latency or 0.0,
+            [tuple(row) for row in by_template], [tuple(row) for row in recent_errors],
+        )
+
+async def get_delivery_stats(since: float, template_id: typing.Optional[int] = None, top: int = 5) -> DeliveryStats:
+    """
+    Сводка по доставкам, отправленным после since (Unix): количество, ошибки,
+    задержка, самые активные шаблоны и последние ошибки. Перед запросом
+    буфер журнала записывается в базу. Название удалённого шаблона — None.
+    """
+    await delivery_journal.flush()
+    return await run_in_db(_get_delivery_stats, since, template_id, top)
@@ -0,0 +1,272 @@
+# utils/fsm_storage.py
+
+import asyncio
+import copy
+import logging
+import time
+import typing
+from collections import OrderedDict
+from aiogram.dispatcher.storage import BaseStorage
+from aiogram.utils import json
+from sqlalchemy import and_, bindparam, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from config import FSM_CACHE_SIZE, FSM_STATE_TTL, FSM_FLUSH_INTERVAL, FSM_FLUSH_BATCH
+from database import SessionLocal, run_in_db
+from models.models import FSMRecord
+
+logger = logging.getLogger(__name__)
+
+_table = FSMRecord.__table__
+_upsert = sqlite_insert(_table)
+_upsert = _upsert.on_conflict_do_update(
+    index_elements=[_table.c.chat, _table.c.user],
+    set_={name: _upsert.excluded[name] for name in ("state", "data", "bucket", "updated_at")},
+)
+_delete = _table.delete().where(and_(_table.c.chat == bindparam("b_chat"), _table.c.user == bindparam("b_user")))
+
+def _empty_record():
+    return {"state": None, "data": {}, "bucket": {}, "updated_at": 0.0}
+
+def _is_empty(record: dict) -> bool:
+    return record["state"] is None and not record["data"] and not record["bucket"]
+
+def _load_record(chat: str, user: str):
+    with SessionLocal() as session:
+        row = session.get(FSMRecord, (chat, user))
+        if row is None:
+            return None
+        return {
+            "state": row.state,
+            "data": json.loads(row.data),
+            "bucket": json.loads(row.bucket),
+            "updated_at": row.updated_at,
+        }
+
+def _write_records(records: dict, purge_before: typing.Optional[float], active_since: float):
+    """
+    Запись накопленных изменений одной транзакцией (None — удаление записи),
+    удаление просроченных состояний и подсчёт пользователей по состояниям.
+    """
+    upserts, deletes = [], []
+    for (chat, user), record in records.items():
+        if record is None:
+            deletes.append({"b_chat": chat, "b_user": user})
+        else:
+            upserts.append({
+                "chat": chat,
+                "user": user,
+                "state": record["state"],
+                "data": json.dumps(record["data"]),
+                "bucket": json.dumps(record["bucket"]),
+                "updated_at": record["updated_at"],
+            })
+    with SessionLocal() as session:
+        if upserts:
+            session.execute(_upsert, upserts)
+        if deletes:
+            session.execute(_delete, deletes)
+        if purge_before is not None:
+            session.query(FSMRecord).filter(FSMRecord.updated_at < purge_before).delete()
+        session.commit()
+        rows = session.query(FSMRecord.state, func.count()).filter(
+            FSMRecord.state.isnot(None), FSMRecord.updated_at >= active_since
+        ).group_by(FSMRecord.state)
+        return {(state,): count for state, count in rows}
+
+class SQLiteStorage(BaseStorage):
+    """
+    Хранилище состояний FSM в базе данных SQLite.
+
+    Последние использованные состояния держатся в LRU-кеше, изменения
+    записываются в базу пакетами раз в flush_interval секунд (или раньше,
+    если накопилось flush_batch изменений). Состояния, не менявшиеся
+    дольше ttl секунд, считаются сброшенными и удаляются из базы.
+    При cache_size <= 0 кеш отключён: состояния читаются из базы
+    и записываются в неё при каждом изменении.
+    """
+
+    def __init__(self, cache_size: int = FSM_CACHE_SIZE, ttl: float = FSM_STATE_TTL,
+                 flush_interval: float = FSM_FLUSH_INTERVAL, flush_batch: int = FSM_FLUSH_BATCH):
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self._cache = OrderedDict()  # (chat, user) -> запись
+        self._pending = {}           # (chat, user) -> копия записи для базы или None для удаления
+        self._counts = {}
+        self._last_purge = 0.0
+        self._flush_task = None
+        self._flush_event = None
+        self._flush_lock = asyncio.Lock()
+
+    def _ensure_started(self):
+        if self._flush_task is None:
+            self._flush_event = asyncio.Event()
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    def _expired(self, record: dict) -> bool:
+        return bool(self.ttl) and record["updated_at"] < time.time() - self.ttl
+
+    async def _get_record(self, chat, user):
+        key = tuple(map(str, self.check_address(chat=chat, user=user)))
+        self._ensure_started()
+        if self.cache_size <= 0:
+            # Кеш отключён: запись читается из ещё не записанных изменений или из базы
+            if key in self._pending:
+                record = copy.deepcopy(self._pending[key])
+            else:
+                record = await run_in_db(_load_record, *key)
+            if record is None:
+                record = _empty_record()
+            elif self._expired(record) and not _is_empty(record):
+                record = _empty_record()
+                self._pending[key] = None
+            return key, record
+        record = self._cache.get(key)
+        if record is None:
+            if key in self._pending:
+                record = copy.deepcopy(self._pending[key])
+            else:
+                record = await run_in_db(_load_record, *key)
+            # Пока шла загрузка, запись мог создать другой обработчик
+            if key in self._cache:
+                record = self._cache[key]
+            else:
+                if record is None:
+                    record = _empty_record()
+                self._cache[key] = record
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        if self._expired(record) and not _is_empty(record):
+            record = self._cache[key] = _empty_record()
+            self._pending[key] = None
+        self._cache.move_to_end(key)
+        return key, record
+
+    async def _changed(self, key, record: dict):
+        record["updated_at"] = time.time()
+        self._pending[key] = None if _is_empty(record) else copy.deepcopy(record)
+        if self.cache_size <= 0:
+            # Без кеша состояние сразу записывается в базу: его могут читать другие экземпляры бота
+            await self.flush()
+        elif len(self._pending) >= self.flush_batch:
+            self._flush_event.set()
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_event.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_event.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка при записи состояний FSM в базу данных: {e}")
+
+    async def flush(self):
+        """
+        Запись накопленных изменений в базу данных.
+        Записи выполняются по очереди, чтобы более старое изменение не легло поверх нового.
+        """
+        async with self._flush_lock:
+            await self._flush()
+
+    async def _flush(self):
+        now = time.time()
+        purge_before = None
+        if self.ttl and now - self._last_purge >= min(self.ttl, 3600):
+            purge_before = now - self.ttl
+            self._last_purge = now
+        if not self._pending and purge_before is None:
+            return
+        pending, self._pending = self._pending, {}
+        active_since = now - self.ttl if self.ttl else 0.0
+        try:
+            self._counts = await run_in_db(_write_records, pending, purge_before, active_since)
+        except Exception:
+            # Более свежие изменения, сделанные во время записи, не затираются
+            for key, record in pending.items():
+                self._pending.setdefault(key, record)
+            raise
+
+    def state_counts(self) -> dict:
+        """Количество пользователей в каждом состоянии (по данным последней записи в базу)."""
+        return dict(self._counts)
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+            self._flush_task = None
+        await self.flush()
+        self._cache.clear()
+
+    async def wait_closed(self):
+        pass
+
+    async def get_state(self, *,
+                        chat: typing.Union[str, int, None] = None,
+                        user: typing.Union[str, int, None] = None,
+                        default: typing.Optional[str] = None) -> typing.Optional[str]:
+        key, record = await self._get_record(chat, user)
+        if record["state"] is None:
+            return self.resolve_state(default)
+        return record["state"]
+
+    async def get_data(self, *,
+                       chat: typing.Union[str, int, None] = None,
+                       user: typing.Union[str, int, None] = None,
+                       default: typing.Optional[dict] = None) -> typing.Dict:
+        key, record = await self._get_record(chat, user)
+        return copy.deepcopy(record["data"])
+
+    async def set_state(self, *,
+                        chat: typing.Union[str, int, None] = None,
+                        user: typing.Union[str, int, None] = None,
+                        state: typing.AnyStr = None):
+        key, record = await self._get_record(chat, user)
+        record["state"] = self.resolve_state(state)
+        await self._changed(key, record)
+
+    async def set_data(self, *,
+                       chat: typing.Union[str, int, None] = None,
+                       user: typing.Union[str, int, None] = None,
+                       data: typing.Dict = None):
+        key, record = await self._get_record(chat, user)
+        record["data"] = copy.deepcopy(data) if data else {}
+        await self._changed(key, record)
+
+    async def update_data(self, *,
+                          chat: typing.Union[str, int, None] = None,
+                          user: typing.Union[str, int, None] = None,
+                          data: typing.Dict = None, **kwargs):
+        key, record = await self._get_record(chat, user)
+        record["data"].update(copy.deepcopy(data or {}), **kwargs)
+        await self._changed(key, record)
+
+    def has_bucket(self):
+        return True
+
+    async def get_bucket(self, *,
+                         chat: typing.Union[str, int, None] = None,
+                         user: typing.Union[str, int, None] = None,
+                         default: typing.Optional[dict] = None) -> typing.Dict:
+        key, record = await self._get_record(chat, user)
+        return copy.deepcopy(record["bucket"])
+
+    async def set_bucket(self, *,
+                         chat: typing.Union[str, int, None] = None,
+                         user: typing.Union[str, int, None] = None,
+                         bucket: typing.Dict = None):
+        key, record = await self._get_record(chat, user)
+        record["bucket"] = copy.deepcopy(bucket) if bucket else {}
+        await self._changed(key, record)
+
+    async def update_bucket(self, *,
+                            chat: typing.Union[str, int, None] = None,
+                            user: typing.Union[str, int, None] = None,
+                            bucket: typing.Dict = None, **kwargs):
+        key, record = await self._get_record(chat, user)
+        record["bucket"].update(copy.deepcopy(bucket or {}), **kwargs)
+        await self._changed(key, record)
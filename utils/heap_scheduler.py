@@ -0,0 +1,466 @@
+# utils/heap_scheduler.py
+
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import math
+import pickle
+import time
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+from apscheduler.events import (
+    EVENT_JOB_SUBMITTED, EVENT_JOB_MISSED, EVENT_JOB_REMOVED,
+    JobEvent, JobSubmissionEvent, JobExecutionEvent,
+)
+from apscheduler.jobstores.base import JobLookupError, ConflictingIdError
+from apscheduler.util import obj_to_ref, ref_to_obj
+from sqlalchemy import bindparam, func, or_, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from database import SessionLocal, run_in_db
+from models.models import ScheduledSend
+
+logger = logging.getLogger(__name__)
+
+# Имя хранилища в событиях: слушатели APScheduler ожидают его в каждом событии
+JOBSTORE = "default"
+
+_table = ScheduledSend.__table__
+# Номер изменения вычисляется в той же команде, что и запись: записи в SQLite
+# выполняются по одной, поэтому номера растут в порядке фиксации транзакций
+_next_revision = select(func.coalesce(func.max(_table.c.revision), 0) + 1).scalar_subquery()
+_upsert = sqlite_insert(_table).values(revision=_next_revision, deleted_at=None)
+_upsert = _upsert.on_conflict_do_update(
+    index_elements=[_table.c.id],
+    set_={name: _upsert.excluded[name] for name in ("func", "args", "trigger", "next_run_time", "revision", "owner", "deleted_at")},
+)
+# Удалённая задача остаётся в таблице без времени запуска, чтобы другие
+# экземпляры бота узнали об удалении; такие записи удаляются через час
+_delete = _table.update().where(_table.c.id == bindparam("b_id")).values(
+    next_run_time=None, revision=_next_revision, owner=bindparam("b_owner"), deleted_at=bindparam("b_deleted"),
+)
+# Сдвиг времени следующего запуска после срабатывания не считается изменением задачи.
+# Он не применяется к удалённой задаче и к задаче, которую другой экземпляр
+# изменил после последнего чтения изменений (b_known)
+_move = _table.update().where(
+    _table.c.id == bindparam("b_id"),
+    _table.c.next_run_time.isnot(None),
+    or_(_table.c.revision <= bindparam("b_known"), _table.c.owner == bindparam("b_owner")),
+).values(next_run_time=bindparam("b_next"))
+_columns = (_table.c.id, _table.c.func, _table.c.args, _table.c.trigger, _table.c.next_run_time, _table.c.revision, _table.c.owner)
+
+class HeapJob:
+    """
+    Задача планировщика. Повторяет поля задачи APScheduler, которые использует бот.
+    """
+    __slots__ = ("id", "func", "args", "trigger", "next_run_time")
+
+    def __init__(self, id, func, args, trigger, next_run_time):
+        self.id = id
+        self.func = func
+        self.args = args
+        self.trigger = trigger
+        self.next_run_time = next_run_time
+
+    def __repr__(self):
+        return f"<HeapJob id={self.id} next_run_time={self.next_run_time}>"
+
+def _load_jobs():
+    """Все действующие задачи и номер последнего изменения."""
+    with SessionLocal() as session:
+        revision = session.execute(select(func.coalesce(func.max(_table.c.revision), 0))).scalar()
+        rows = session.execute(select(*_columns).where(_table.c.next_run_time.isnot(None))).all()
+        return rows, revision
+
+def _load_changes(since: int):
+    """Задачи, изменённые после изменения since (включая удалённые)."""
+    with SessionLocal() as session:
+        return session.execute(select(*_columns).where(_table.c.revision > since).order_by(_table.c.revision)).all()
+
+def _write_jobs(added: list, removed: list, moved: dict, owner: str, known_revision: int = 0, purge_before: float = None):
+    """Запись изменений задач одной транзакцией (триггеры сериализуются здесь, вне цикла событий)."""
+    with SessionLocal() as session:
+        if added:
+            session.execute(_upsert, [{
+                "id": job.id,
+                "func": obj_to_ref(job.func),
+                "args": json.dumps(job.args),
+                "trigger": pickle.dumps(job.trigger, pickle.HIGHEST_PROTOCOL),
+                "next_run_time": job.next_run_time.timestamp() if job.next_run_time else None,
+                "owner": owner,
+            } for job in added])
+        if removed:
+            now = time.time()
+            session.execute(_delete, [{"b_id": job_id, "b_owner": owner, "b_deleted": now} for job_id in removed])
+        if moved:
+            session.execute(_move, [{"b_id": job_id, "b_next": next_ts, "b_known": known_revision, "b_owner": owner}
+                                    for job_id, next_ts in moved.items()])
+        if purge_before is not None:
+            session.execute(_table.delete().where(_table.c.next_run_time.is_(None), _table.c.deleted_at < purge_before))
+        session.commit()
+
+class HeapScheduler:
+    """
+    Планировщик для большого числа расписаний: все задачи лежат в одной
+    куче по времени следующего запуска, а единственная задача-таймер
+    просыпается раз в тик и запускает всё, чей срок наступил.
+
+    Поддерживает часть интерфейса AsyncIOScheduler, которой пользуется бот:
+    add_job, remove_job, get_job, get_jobs, add_listener, remove_listener,
+    start, shutdown, pause, resume, wakeup.
+    Триггеры — обычные триггеры APScheduler. Куча меняется только в потоке
+    цикла событий, поэтому блокировки не нужны; изменения записываются
+    в таблицу scheduled_sends пакетами на следующем тике.
+
+    Несколько экземпляров бота могут работать с одной таблицей: задачи
+    запускает только экземпляр, который не на паузе, а изменения, сделанные
+    другими экземплярами, подхватываются при вызове wakeup().
+    """
+
+    # Сколько задач обрабатывается подряд, прежде чем отдать управление циклу событий
+    CHUNK_SIZE = 1000
+
+    def __init__(self, misfire_grace_time: int = 60, coalesce: bool = True, tick: float = 0.5):
+        self.misfire_grace_time = misfire_grace_time
+        self.coalesce = coalesce
+        self.tick = tick
+        self.running = False
+        self._jobs = {}                # ID -> HeapJob
+        self._heap = []                # (время запуска, порядковый номер, HeapJob)
+        self._seq = itertools.count()
+        self._listeners = []
+        self._added = {}               # Задачи, которые нужно записать в базу целиком
+        self._removed = set()          # ID задач, которые нужно удалить из базы
+        self._moved = {}               # ID -> новое время следующего запуска
+        self._running_tasks = set()
+        self._wakeup = None
+        self._loaded = None
+        self._task = None
+        self.instance_id = uuid4().hex  # Автор изменений в таблице задач
+        self._revision = 0              # Номер последнего прочитанного изменения
+        self._paused = False
+        self._reload_pending = False
+        self._sync_pending = False
+        self._last_purge = 0.0
+
+    # Интерфейс APScheduler
+
+    def add_listener(self, callback, mask):
+        self._listeners.append((callback, mask))
+
+    def remove_listener(self, callback):
+        self._listeners = [(listener, mask) for listener, mask in self._listeners if listener is not callback]
+
+    def add_job(self, func, trigger, args=None, id=None, replace_existing=False, **kwargs):
+        job_id = id or uuid4().hex
+        if job_id in self._jobs and not replace_existing:
+            raise ConflictingIdError(job_id)
+        next_run_time = kwargs.get("next_run_time") or trigger.get_next_fire_time(None, datetime.now(timezone.utc))
+        job = HeapJob(job_id, func, list(args or ()), trigger, next_run_time)
+        self._jobs[job_id] = job
+        self._push(job)
+        self._added[job_id] = job
+        self._removed.discard(job_id)
+        self._moved.pop(job_id, None)
+        self._wake()
+        return job
+
+    def remove_job(self, job_id, jobstore=None):
+        if self._jobs.pop(job_id, None) is None:
+            raise JobLookupError(job_id)
+        self._forget(job_id)
+        self._wake()
+        self._dispatch(JobEvent(EVENT_JOB_REMOVED, job_id, JOBSTORE))
+
+    def get_job(self, job_id, jobstore=None):
+        return self._jobs.get(job_id)
+
+    def get_jobs(self, jobstore=None):
+        return list(self._jobs.values())
+
+    def start(self, paused: bool = False):
+        """
+        Загрузка задач из базы данных и запуск таймера.
+        На паузе задачи можно добавлять и удалять, но они не запускаются.
+        На паузе задачи читаются из базы в фоне, уже после запуска: запуск бота
+        не ждёт чтения всех задач, а запускать их до возобновления всё равно нельзя.
+        """
+        self._loaded = asyncio.Event()
+        if paused:
+            self._reload_pending = True
+        else:
+            self._load(*_load_jobs())
+        self._paused = paused
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.get_event_loop().create_task(self._run())
+        self.running = True
+        if paused:
+            logger.info("Планировщик на куче запущен на паузе, задачи загружаются в фоне.")
+        else:
+            logger.info(f"Планировщик на куче запущен, задач: {len(self._jobs)}.")
+
+    async def wait_loaded(self):
+        """Ожидание первой загрузки задач из базы (при запуске на паузе она идёт в фоне)."""
+        await self._loaded.wait()
+
+    def pause(self):
+        self._paused = True
+        logger.info("Планировщик на куче приостановлен.")
+
+    def resume(self):
+        """Возобновление запуска задач. Задачи перечитываются из базы: их могли менять другие экземпляры."""
+        self._paused = False
+        self._reload_pending = True
+        self._wake()
+        logger.info("Планировщик на куче возобновлён.")
+
+    def wakeup(self):
+        """Чтение изменений задач, сделанных другими экземплярами бота."""
+        self._sync_pending = True
+        self._wake()
+
+    def shutdown(self, wait: bool = True):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        # Несохранённые изменения записываются сразу
+        if self._added or self._removed or self._moved:
+            _write_jobs(*self._take_changes(), self.instance_id, self._revision)
+        self.running = False
+
+    # Внутренняя логика
+
+    def _make_job(self, row, funcs: dict):
+        job_id, func_ref, args, trigger, next_ts = row[:5]
+        try:
+            if func_ref not in funcs:
+                funcs[func_ref] = ref_to_obj(func_ref)
+            return HeapJob(job_id, funcs[func_ref], json.loads(args), pickle.loads(trigger),
+                           datetime.fromtimestamp(next_ts, timezone.utc))
+        except Exception as e:
+            logger.error(f"Не удалось загрузить задачу {job_id}: {e}")
+            return None
+
+    def _load(self, rows, revision: int):
+        funcs = {}
+        self._jobs, self._heap = {}, []
+        for row in rows:
+            job = self._make_job(row, funcs)
+            if job is not None:
+                self._jobs[job.id] = job
+                self._heap.append((job.next_run_time.timestamp(), next(self._seq), job))
+        heapq.heapify(self._heap)
+        self._revision = revision
+        if self._loaded is not None:
+            self._loaded.set()
+
+    async def _reload_jobs(self):
+        self._reload_pending = self._sync_pending = False
+        await self._flush()
+        rows, revision = await run_in_db(_load_jobs)
+        self._load(rows, revision)
+        # Изменения, сделанные во время чтения, новее прочитанных
+        for job_id, job in self._added.items():
+            self._jobs[job_id] = job
+            self._push(job)
+        for job_id in self._removed:
+            self._jobs.pop(job_id, None)
+        logger.info(f"Задачи планировщика перечитаны из базы, задач: {len(self._jobs)}.")
+
+    async def _sync_jobs(self):
+        self._sync_pending = False
+        funcs = {}
+        for row in await run_in_db(_load_changes, self._revision):
+            job_id, next_ts, revision, owner = row.id, row.next_run_time, row.revision, row.owner
+            self._revision = max(self._revision, revision)
+            # Свои изменения уже в памяти, а несохранённые локальные изменения новее
+            if owner == self.instance_id or job_id in self._added or job_id in self._removed:
+                continue
+            self._moved.pop(job_id, None)
+            if next_ts is None:
+                if self._jobs.pop(job_id, None) is not None:
+                    self._dispatch(JobEvent(EVENT_JOB_REMOVED, job_id, JOBSTORE))
+                continue
+            job = self._make_job(row, funcs)
+            if job is not None:
+                self._jobs[job_id] = job
+                self._push(job)
+
+    def _push(self, job: HeapJob):
+        if job.next_run_time is not None:
+            heapq.heappush(self._heap, (job.next_run_time.timestamp(), next(self._seq), job))
+
+    def _forget(self, job_id):
+        self._added.pop(job_id, None)
+        self._moved.pop(job_id, None)
+        self._removed.add(job_id)
+        # Записи удалённых задач остаются в куче и пропускаются при извлечении;
+        # если их накопилось слишком много, куча перестраивается
+        if len(self._heap) > 2 * len(self._jobs) + 1024:
+            self._heap = [entry for entry in self._heap if self._jobs.get(entry[2].id) is entry[2]]
+            heapq.heapify(self._heap)
+
+    def _wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _dispatch(self, event):
+        for callback, mask in self._listeners:
+            if event.code & mask:
+                try:
+                    callback(event)
+                except Exception:
+                    logger.exception("Ошибка в слушателе событий планировщика")
+
+    def _delay(self):
+        """Секунды до ближайшего тика, на котором есть работа; None — ждать пробуждения."""
+        if self._reload_pending or self._sync_pending:
+            return 0.0
+        delay = None
+        if self._heap and not self._paused:
+            due = math.ceil(self._heap[0][0] / self.tick) * self.tick
+            delay = max(0.0, due - time.time())
+        if self._added or self._removed or self._moved:
+            delay = self.tick if delay is None else min(delay, self.tick)
+        return delay
+
+    async def _run(self):
+        while True:
+            delay = self._delay()
+            if delay is None or delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+            self._wakeup.clear()
+            try:
+                if self._reload_pending:
+                    await self._reload_jobs()
+                elif self._sync_pending:
+                    await self._sync_jobs()
+                if not self._paused:
+                    await self._process_due()
+                if self._added or self._removed or self._moved:
+                    await self._flush()
+            except Exception:
+                logger.exception("Ошибка в таймере планировщика")
+
+    def _run_times(self, job: HeapJob, now: datetime):
+        """
+        Плановые времена запуска задачи, наступившие к now, и следующее время запуска.
+        При объединении запусков (coalesce) пропущенные запуски не перебираются по одному.
+        """
+        run_time = job.next_run_time
+        following = job.trigger.get_next_fire_time(run_time, now)
+        if following is None or following > now:
+            return [run_time], following
+        if self.coalesce:
+            recent = job.trigger.get_next_fire_time(None, now - timedelta(seconds=self.misfire_grace_time))
+            if recent is None or recent > now:
+                recent = run_time
+            following = job.trigger.get_next_fire_time(None, now)
+            if following is not None and following <= recent:
+                following = job.trigger.get_next_fire_time(recent, now)
+            return [recent], following
+        run_times = [run_time]
+        while following is not None and following <= now:
+            run_times.append(following)
+            following = job.trigger.get_next_fire_time(following, now)
+        return run_times, following
+
+    async def _process_due(self):
+        """
+        Запуск всех задач, срок которых наступил. Корутины задач одного тика
+        выполняются по очереди в одной задаче asyncio, поэтому функции задач
+        должны быстро возвращать управление (send_scheduled_template только
+        ставит рассылку в очередь). Каждые CHUNK_SIZE задач цикл событий
+        получает управление, чтобы большой тик не блокировал обработку обновлений.
+        """
+        now_ts = time.time()
+        now = datetime.fromtimestamp(now_ts, timezone.utc)
+        batch = []
+        processed = 0
+        while self._heap and self._heap[0][0] <= now_ts:
+            _, _, job = heapq.heappop(self._heap)
+            if self._jobs.get(job.id) is not job:
+                continue
+            processed += 1
+            if processed % self.CHUNK_SIZE == 0:
+                self._run_batch(batch)
+                batch = []
+                await asyncio.sleep(0)
+            run_times, following = self._run_times(job, now)
+            submitted = []
+            for run_time in run_times:
+                if (now - run_time).total_seconds() > self.misfire_grace_time:
+                    self._dispatch(JobExecutionEvent(EVENT_JOB_MISSED, job.id, JOBSTORE, run_time))
+                    logger.warning(f"Запуск задачи {job.id} в {run_time} пропущен: опоздание больше допустимого.")
+                else:
+                    submitted.append(run_time)
+            for _ in submitted:
+                self._submit(job, batch)
+            if submitted:
+                self._dispatch(JobSubmissionEvent(EVENT_JOB_SUBMITTED, job.id, JOBSTORE, submitted))
+
+            job.next_run_time = following
+            if following is None:
+                del self._jobs[job.id]
+                self._forget(job.id)
+                self._dispatch(JobEvent(EVENT_JOB_REMOVED, job.id, JOBSTORE))
+            else:
+                self._push(job)
+                if job.id not in self._added:
+                    self._moved[job.id] = following.timestamp()
+        self._run_batch(batch)
+
+    def _submit(self, job: HeapJob, batch: list):
+        try:
+            result = job.func(*job.args)
+        except Exception:
+            logger.exception(f"Ошибка при запуске задачи {job.id}")
+            return
+        if asyncio.iscoroutine(result):
+            batch.append((job.id, result))
+
+    def _run_batch(self, batch: list):
+        if batch:
+            task = asyncio.create_task(self._execute_batch(batch))
+            self._running_tasks.add(task)
+            task.add_done_callback(self._running_tasks.discard)
+
+    async def _execute_batch(self, batch: list):
+        for job_id, coroutine in batch:
+            try:
+                await coroutine
+            except Exception:
+                logger.exception(f"Ошибка при выполнении задачи {job_id}")
+
+    def _take_changes(self):
+        added, removed, moved = list(self._added.values()), list(self._removed), self._moved
+        self._added, self._removed, self._moved = {}, set(), {}
+        return added, removed, moved
+
+    async def _flush(self):
+        now = time.time()
+        purge_before = None
+        if not self._paused and now - self._last_purge >= 3600:
+            purge_before = now - 3600
+            self._last_purge = now
+        added, removed, moved = self._take_changes()
+        if not (added or removed or moved or purge_before):
+            return
+        try:
+            await run_in_db(_write_jobs, added, removed, moved, self.instance_id, self._revision, purge_before)
+        except Exception:
+            # Изменения, сделанные во время записи, новее возвращаемых
+            for job in added:
+                if self._jobs.get(job.id) is job:
+                    self._added.setdefault(job.id, job)
+            for job_id in removed:
+                if job_id not in self._jobs:
+                    self._removed.add(job_id)
+            for job_id, next_ts in moved.items():
+                if job_id in self._jobs and job_id not in self._added:
+                    self._moved.setdefault(job_id, next_ts)
+            raise
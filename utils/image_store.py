@@ -0,0 +1,215 @@
+# utils/image_store.py
+
+import asyncio
+import hashlib
+import importlib.util
+import io
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from aiogram import types
+from config import IMAGE_RECOMPRESS, IMAGE_MAX_SIDE, IMAGE_JPEG_QUALITY, IMAGE_WORKERS, IMAGE_GC_INTERVAL
+from models.repository import count_image_references, get_used_image_paths
+from utils.media_cache import forget_file_id
+
+# Pillow импортируется только в процессах перекодирования: в основном процессе
+# его импорт лишь замедлял бы запуск. Без Pillow изображения сохраняются как есть
+PILLOW_AVAILABLE = importlib.util.find_spec("PIL") is not None
+
+logger = logging.getLogger(__name__)
+
+IMAGES_DIR = "images"
+
+# Ограничения Telegram для sendPhoto
+PHOTO_MAX_BYTES = 10 * 1024 * 1024
+PHOTO_MAX_DIMENSIONS_SUM = 10000
+
+# Размер блока при потоковом копировании изображений (импорт шаблонов)
+COPY_CHUNK_SIZE = 64 * 1024
+
+# Файлы моложе этого возраста сборщик не трогает: шаблон, для которого
+# изображение уже сохранено, может ещё находиться в процессе создания
+ORPHAN_GRACE_SECONDS = 3600
+
+_process_pool = None
+_gc_task = None
+
+# Проверка существования файла при сохранении и проверка возраста при удалении
+# выполняются под одной блокировкой: иначе изображение, только что сохранённое
+# для другого шаблона, могло бы быть удалено между проверкой и удалением
+_files_lock = threading.Lock()
+
+def _prepare_photo(data: bytes, max_side: int, quality: int) -> bytes:
+    """
+    Уменьшение и перекодирование изображения в JPEG (выполняется в отдельном процессе).
+    Исходные данные возвращаются, если результат не меньше, а исходник укладывается в ограничения Telegram.
+    """
+    from PIL import Image, ImageOps
+    with Image.open(io.BytesIO(data)) as source:
+        fits_limits = len(data) <= PHOTO_MAX_BYTES and sum(source.size) <= PHOTO_MAX_DIMENSIONS_SUM
+        image = ImageOps.exif_transpose(source)
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        image.thumbnail((max_side, max_side))
+        output = io.BytesIO()
+        image.save(output, "JPEG", quality=quality, optimize=True, progressive=True)
+    result = output.getvalue()
+    if fits_limits and len(result) >= len(data):
+        return data
+    return result
+
+def _get_process_pool():
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+    return _process_pool
+
+def _write_image(data: bytes) -> str:
+    """Сохранение изображения под именем, равным SHA-256 содержимого."""
+    image_path = f"{IMAGES_DIR}/{hashlib.sha256(data).hexdigest()}.jpg"
+    with _files_lock:
+        if os.path.exists(image_path):
+            # Такое изображение уже есть; обновляем время, чтобы сборщик его не удалил
+            os.utime(image_path)
+            return image_path
+    os.makedirs(IMAGES_DIR, exist_ok=True)
+    tmp_path = f"{image_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    with _files_lock:
+        os.replace(tmp_path, image_path)
+    return image_path
+
+def write_image_stream(stream) -> str:
+    """
+    Сохранение изображения из файлового объекта по частям, не читая его в память
+    целиком (выполняется в потоке). Имя файла — SHA-256 содержимого, как у _write_image.
+    """
+    os.makedirs(IMAGES_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    tmp_path = f"{IMAGES_DIR}/stream.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        for chunk in iter(lambda: stream.read(COPY_CHUNK_SIZE), b""):
+            digest.update(chunk)
+            f.write(chunk)
+    image_path = f"{IMAGES_DIR}/{digest.hexdigest()}.jpg"
+    with _files_lock:
+        if os.path.exists(image_path):
+            os.remove(tmp_path)
+            os.utime(image_path)
+        else:
+            os.replace(tmp_path, image_path)
+    return image_path
+
+def _remove_stale_file(image_path: str, grace: float):
+    """
+    Удаление файла, если он не сохранялся последние grace секунд.
+    Возвращает размер удалённого файла или None, если файл не удалён.
+    """
+    with _files_lock:
+        try:
+            stat = os.stat(image_path)
+            if stat.st_mtime > time.time() - grace:
+                return None
+            os.remove(image_path)
+            return stat.st_size
+        except FileNotFoundError:
+            return None
+
+def _remove_orphans(used_paths: set, grace: float):
+    """Удаление файлов каталога images/, на которые не ссылается ни один шаблон."""
+    used = {os.path.normpath(path) for path in used_paths}
+    removed, freed = [], 0
+    if not os.path.isdir(IMAGES_DIR):
+        return removed, freed
+    with os.scandir(IMAGES_DIR) as entries:
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            image_path = f"{IMAGES_DIR}/{entry.name}"
+            if os.path.normpath(image_path) in used:
+                continue
+            size = _remove_stale_file(image_path, grace)
+            if size is not None:
+                removed.append(image_path)
+                freed += size
+    return removed, freed
+
+async def store_image(data: bytes) -> str:
+    """
+    Сохранение изображения в хранилище. Возвращает путь к файлу.
+    Одинаковые изображения хранятся в одном файле.
+    """
+    loop = asyncio.get_running_loop()
+    if IMAGE_RECOMPRESS and PILLOW_AVAILABLE:
+        try:
+            data = await loop.run_in_executor(_get_process_pool(), _prepare_photo, data, IMAGE_MAX_SIDE, IMAGE_JPEG_QUALITY)
+        except Exception as e:
+            logger.warning(f"Не удалось перекодировать изображение, сохраняется исходный файл: {e}")
+    return await loop.run_in_executor(None, _write_image, data)
+
+async def store_photo(photo: types.PhotoSize) -> str:
+    """
+    Загрузка фото из Telegram и сохранение его в хранилище. Возвращает путь к файлу.
+    """
+    buffer = io.BytesIO()
+    await photo.download(destination_file=buffer)
+    image_path = await store_image(buffer.getvalue())
+    logger.info(f"Изображение {photo.file_unique_id} сохранено по пути: {image_path}.")
+    return image_path
+
+async def release_image(image_path: str):
+    """
+    Удаление изображения, если на него больше не ссылается ни один шаблон.
+    Вызывается после того, как ссылка на изображение удалена из базы данных.
+    Изображение, сохранённое за последние ORPHAN_GRACE_SECONDS секунд, не удаляется:
+    его может использовать шаблон, который ещё не записан в базу. Такой файл
+    удалит сборщик, если ссылка на него так и не появится.
+    """
+    if not image_path or await count_image_references(image_path):
+        return
+    size = await asyncio.get_running_loop().run_in_executor(None, _remove_stale_file, image_path, ORPHAN_GRACE_SECONDS)
+    if size is not None:
+        await forget_file_id(image_path)
+        logger.info(f"Изображение '{image_path}' больше не используется и удалено.")
+
+async def collect_garbage(grace: float = ORPHAN_GRACE_SECONDS) -> int:
+    """
+    Сверка каталога images/ с шаблонами в базе данных и удаление
+    неиспользуемых файлов. Возвращает количество удалённых файлов.
+    """
+    used_paths = await get_used_image_paths()
+    removed, freed = await asyncio.get_running_loop().run_in_executor(None, _remove_orphans, used_paths, grace)
+    for image_path in removed:
+        await forget_file_id(image_path)
+    if removed:
+        logger.info(f"Сборщик изображений удалил {len(removed)} файлов ({freed / 1024:.0f} КБ).")
+    return len(removed)
+
+async def _gc_loop(interval: float):
+    # Первая сборка через interval после запуска, а не во время него:
+    # обход каталога изображений не должен задерживать первые обновления
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await collect_garbage()
+        except Exception as e:
+            logger.error(f"Ошибка при сборке неиспользуемых изображений: {e}")
+
+def start_image_gc():
+    """Запуск периодической сборки неиспользуемых изображений (если задан IMAGE_GC_INTERVAL)."""
+    global _gc_task
+    if IMAGE_GC_INTERVAL and _gc_task is None:
+        _gc_task = asyncio.create_task(_gc_loop(IMAGE_GC_INTERVAL))
+
+async def stop_image_gc():
+    global _gc_task, _process_pool
+    if _gc_task is not None:
+        _gc_task.cancel()
+        await asyncio.gather(_gc_task, return_exceptions=True)
+        _gc_task = None
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False)
+        _process_pool = None
@@ -0,0 +1,172 @@
+# utils/instrumentation.py
+
+import asyncio
+import logging
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from aiogram.dispatcher import Dispatcher
+from aiogram.dispatcher.handler import current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from apscheduler.events import EVENT_JOB_SUBMITTED, EVENT_JOB_MISSED
+from sqlalchemy import event
+from config import METRICS_HOST, METRICS_PORT, LOOP_LAG_INTERVAL, STALL_THRESHOLD, PROFILE_SAMPLE_INTERVAL
+from database import engine
+from utils.metrics import registry, start_metrics_server, LoopLagMonitor
+from utils.profiling import StallWatchdog, LoopProfiler, log_stall, running_handlers
+from utils.transport import TransportBot
+
+logger = logging.getLogger(__name__)
+
+# Имя обработчика, в контексте которого выполняется код (для метрик запросов к БД)
+current_handler_name: ContextVar[str] = ContextVar("current_handler_name", default="background")
+
+BOT_API_REQUESTS = registry.counter(
+    "bot_api_requests_total", "Запросы к Bot API по методам и результату.", ("method", "result"))
+BOT_API_DURATION = registry.histogram(
+    "bot_api_request_duration_seconds", "Длительность запросов к Bot API.", ("method",))
+HANDLER_DURATION = registry.histogram(
+    "handler_duration_seconds", "Длительность обработчиков обновлений.", ("handler",))
+DB_QUERY_DURATION = registry.histogram(
+    "db_query_duration_seconds", "Длительность запросов к базе данных по обработчикам.", ("handler",))
+SCHEDULER_LAG = registry.histogram(
+    "scheduler_lag_seconds", "Опоздание запуска задач планировщика относительно плановой даты.")
+SCHEDULER_MISSED = registry.counter(
+    "scheduler_missed_jobs_total", "Запуски задач, пропущенные из-за превышения misfire_grace_time.")
+LOOP_LAG = registry.histogram(
+    "event_loop_lag_seconds", "Задержка цикла событий asyncio.")
+LOOP_LAG_LAST = registry.gauge(
+    "event_loop_lag_last_seconds", "Последнее измерение задержки цикла событий.")
+LOOP_STALLS = registry.counter(
+    "event_loop_stalls_total", "Блокировки цикла событий дольше STALL_THRESHOLD.")
+
+class InstrumentedBot(TransportBot):
+    """
+    Бот, учитывающий количество и длительность запросов к Bot API.
+    """
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        started = time.perf_counter()
+        result = "ok"
+        try:
+            return await super().request(method, data, files, **kwargs)
+        except Exception as e:
+            result = type(e).__name__
+            raise
+        finally:
+            BOT_API_DURATION.observe(method, value=time.perf_counter() - started)
+            BOT_API_REQUESTS.inc(method, result)
+
+class MetricsMiddleware(BaseMiddleware):
+    """
+    Измерение длительности обработчиков без изменения самих обработчиков.
+    """
+
+    async def _start(self, data: dict):
+        name = getattr(current_handler.get(None), "__name__", "unknown")
+        data["_metrics"] = (name, time.perf_counter())
+        current_handler_name.set(name)
+        running_handlers[asyncio.current_task()] = name
+
+    async def _finish(self, data: dict):
+        entry = data.pop("_metrics", None)
+        running_handlers.pop(asyncio.current_task(), None)
+        if entry is not None:
+            name, started = entry
+            HANDLER_DURATION.observe(name, value=time.perf_counter() - started)
+
+    async def on_process_message(self, message, data: dict):
+        await self._start(data)
+
+    async def on_post_process_message(self, message, results, data: dict):
+        await self._finish(data)
+
+    async def on_process_callback_query(self, callback_query, data: dict):
+        await self._start(data)
+
+    async def on_post_process_callback_query(self, callback_query, results, data: dict):
+        await self._finish(data)
+
+    async def on_process_inline_query(self, inline_query, data: dict):
+        await self._start(data)
+
+    async def on_post_process_inline_query(self, inline_query, results, data: dict):
+        await self._finish(data)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_started = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_metrics_started", None)
+    if started is not None:
+        DB_QUERY_DURATION.observe(current_handler_name.get(), value=time.perf_counter() - started)
+
+def _on_job_submitted(job_event):
+    # Без метки задачи: при десятках тысяч задач метка на задачу дала бы столько же рядов
+    lag = (datetime.now(timezone.utc) - job_event.scheduled_run_times[-1]).total_seconds()
+    SCHEDULER_LAG.observe(value=lag)
+
+def _on_job_missed(job_event):
+    SCHEDULER_MISSED.inc()
+
+def _on_loop_lag(lag: float):
+    LOOP_LAG.observe(value=lag)
+    LOOP_LAG_LAST.set(value=lag)
+
+def _on_stall(report):
+    LOOP_STALLS.inc()
+    log_stall(report)
+
+def fsm_state_counts(storage) -> dict:
+    """Количество пользователей в каждом состоянии FSM."""
+    if hasattr(storage, "state_counts"):
+        return storage.state_counts()
+    counts = {}
+    for users in getattr(storage, "data", {}).values():
+        for record in users.values():
+            state = record.get("state")
+            if state:
+                counts[(state,)] = counts.get((state,), 0) + 1
+    return counts
+
+loop_lag_monitor = LoopLagMonitor(LOOP_LAG_INTERVAL, _on_loop_lag)
+stall_watchdog = StallWatchdog(STALL_THRESHOLD, _on_stall)
+loop_profiler = LoopProfiler(PROFILE_SAMPLE_INTERVAL)
+_metrics_runner = None
+
+def setup_instrumentation(dp: Dispatcher, scheduler):
+    """
+    Подключение сбора метрик: middleware aiogram, слушатели APScheduler и SQLAlchemy.
+    """
+    from utils.send_message import send_queue
+
+    dp.middleware.setup(MetricsMiddleware())
+    scheduler.add_listener(_on_job_submitted, EVENT_JOB_SUBMITTED)
+    scheduler.add_listener(_on_job_missed, EVENT_JOB_MISSED)
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+    registry.gauge("send_queue_depth", "Количество запросов в очереди отправки.", callback=send_queue.qsize)
+    registry.gauge("send_background_broadcasts", "Рассылки по расписанию, выполняющиеся в фоне.",
+                   callback=lambda: len(send_queue.background_tasks))
+    registry.gauge("fsm_states", "Количество пользователей в состояниях FSM.", ("state",),
+                   callback=lambda: fsm_state_counts(dp.storage))
+
+async def start_monitoring():
+    """
+    Запуск измерения задержки цикла событий, сторожа блокировок (если задан STALL_THRESHOLD)
+    и HTTP-сервера метрик (если задан METRICS_PORT).
+    """
+    global _metrics_runner
+    loop_lag_monitor.start()
+    stall_watchdog.start()
+    if METRICS_PORT and _metrics_runner is None:
+        _metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+
+async def stop_monitoring():
+    global _metrics_runner
+    await loop_lag_monitor.stop()
+    await stall_watchdog.stop()
+    if _metrics_runner is not None:
+        await _metrics_runner.cleanup()
+        _metrics_runner = None
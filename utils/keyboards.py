@@ -0,0 +1,54 @@
+# utils/keyboards.py
+
+from aiogram import types
+from aiogram.utils.callback_data import CallbackData
+from config import TEMPLATES_PAGE_SIZE
+from models.repository import get_templates_page
+
+# Действие определяет, что произойдёт при выборе шаблона:
+# "view" — просмотр, "edit" — редактирование, "delete" — удаление, "schedule" — расписание
+template_select_cb = CallbackData("tpl", "action", "id")
+template_page_cb = CallbackData("tpl_page", "action", "direction", "cursor")
+
+async def build_templates_keyboard(action: str, cursor: int = 0, backward: bool = False):
+    """
+    Постраничная inline-клавиатура выбора шаблона.
+    Страницы выбираются по названию шаблона-курсора, а не по смещению,
+    поэтому запрос к базе не зависит от номера страницы.
+    Возвращает None, если шаблонов нет.
+    """
+    rows, has_prev, has_next = await get_templates_page(cursor, backward, TEMPLATES_PAGE_SIZE)
+    if not rows:
+        return None
+    keyboard = types.InlineKeyboardMarkup()
+    for template_id, name in rows:
+        keyboard.add(types.InlineKeyboardButton(name, callback_data=template_select_cb.new(action=action, id=template_id)))
+    navigation = []
+    if has_prev:
+        navigation.append(types.InlineKeyboardButton(
+            "◀️ Назад", callback_data=template_page_cb.new(action=action, direction="prev", cursor=rows[0][0])))
+    if has_next:
+        navigation.append(types.InlineKeyboardButton(
+            "Вперёд ▶️", callback_data=template_page_cb.new(action=action, direction="next", cursor=rows[-1][0])))
+    if navigation:
+        keyboard.row(*navigation)
+    return keyboard
+
+def template_actions_keyboard(template_id: int):
+    """Кнопки перехода к редактированию и расписанию шаблона (для результатов поиска)."""
+    keyboard = types.InlineKeyboardMarkup()
+    keyboard.row(
+        types.InlineKeyboardButton("✏️ Редактировать", callback_data=template_select_cb.new(action="edit", id=template_id)),
+        types.InlineKeyboardButton("⏰ Расписание", callback_data=template_select_cb.new(action="schedule", id=template_id)),
+    )
+    return keyboard
+
+async def close_selection(callback: types.CallbackQuery, text: str):
+    """
+    Замена сообщения с кнопками выбора на текст. Сообщения, отправленные
+    через inline-режим, приходят без message и редактируются по inline_message_id.
+    """
+    if callback.message:
+        await callback.message.edit_text(text)
+    else:
+        await callback.bot.edit_message_text(text, inline_message_id=callback.inline_message_id)
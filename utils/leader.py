@@ -0,0 +1,143 @@
+# utils/leader.py
+
+import asyncio
+import logging
+import os
+import socket
+import time
+from uuid import uuid4
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from config import LEADER_LEASE_TTL, LEADER_RENEW_INTERVAL
+from database import SessionLocal, run_in_db
+from models.models import LeaderLease
+
+logger = logging.getLogger(__name__)
+
+_table = LeaderLease.__table__
+
+def _try_acquire(name: str, holder: str, ttl: float):
+    """
+    Захват или продление аренды одной командой: запись обновляется, только
+    если аренда уже принадлежит holder или истекла. Возвращает время истечения
+    аренды, если она принадлежит holder, иначе None.
+    """
+    now = time.time()
+    statement = sqlite_insert(_table).values(name=name, holder=holder, expires_at=now + ttl)
+    statement = statement.on_conflict_do_update(
+        index_elements=[_table.c.name],
+        set_={"holder": statement.excluded.holder, "expires_at": statement.excluded.expires_at},
+        where=(_table.c.holder == holder) | (_table.c.expires_at < now),
+    )
+    with SessionLocal() as session:
+        session.execute(statement)
+        session.commit()
+        row = session.execute(select(_table.c.holder, _table.c.expires_at).where(_table.c.name == name)).first()
+    return row.expires_at if row and row.holder == holder else None
+
+def _release(name: str, holder: str):
+    with SessionLocal() as session:
+        session.execute(_table.update().where(_table.c.name == name, _table.c.holder == holder).values(expires_at=0.0))
+        session.commit()
+
+class LeaderElector:
+    """
+    Выбор ведущего экземпляра через аренду в общей базе данных.
+
+    Каждый экземпляр раз в renew_interval секунд пытается захватить или продлить
+    аренду роли name. Получив её, экземпляр вызывает on_elected, потеряв —
+    on_demoted. Если продлить аренду не удаётся (например, база занята), ведущий
+    слагает роль сам, не дожидаясь, пока аренду заберёт другой экземпляр.
+    Корутина on_tick выполняется после каждой попытки на всех экземплярах.
+    """
+
+    def __init__(self, name: str, on_elected, on_demoted, on_tick=None,
+                 ttl: float = LEADER_LEASE_TTL, renew_interval: float = LEADER_RENEW_INTERVAL):
+        self.name = name
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.on_tick = on_tick
+        self.ttl = ttl
+        self.renew_interval = renew_interval
+        self.instance_id = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+        self.is_leader = False
+        self._expires_at = 0.0
+        self._task = None
+
+    async def start(self):
+        """Первая попытка захвата аренды сразу, затем продление в фоне."""
+        await self._attempt()
+        self._task = asyncio.create_task(self._loop())
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.renew_interval)
+            await self._attempt()
+
+    async def _attempt(self):
+        try:
+            expires_at = await run_in_db(_try_acquire, self.name, self.instance_id, self.ttl)
+        except Exception as e:
+            logger.error(f"Ошибка при продлении аренды '{self.name}': {e}")
+            # Роль слагается заранее, чтобы не совпасть по времени с новым ведущим
+            if self.is_leader and time.time() + self.renew_interval >= self._expires_at:
+                self._set_leader(False)
+        else:
+            if expires_at is not None:
+                self._expires_at = expires_at
+            self._set_leader(expires_at is not None)
+        if self.on_tick is not None:
+            await self.on_tick()
+
+    async def _renew_held(self):
+        """Продление уже полученной аренды без вызова обработчиков (см. hold)."""
+        while True:
+            await asyncio.sleep(self.renew_interval)
+            try:
+                expires_at = await run_in_db(_try_acquire, self.name, self.instance_id, self.ttl)
+            except Exception as e:
+                logger.error(f"Ошибка при продлении аренды '{self.name}': {e}")
+                continue
+            if expires_at is None:
+                logger.warning(f"Экземпляр {self.instance_id} потерял аренду '{self.name}' во время остановки.")
+                self.is_leader = False
+                return
+            self._expires_at = expires_at
+
+    def _set_leader(self, leader: bool, log_level: int = logging.WARNING):
+        if leader == self.is_leader:
+            return
+        self.is_leader = leader
+        if leader:
+            logger.info(f"Экземпляр {self.instance_id} стал ведущим ('{self.name}').")
+            self.on_elected()
+        else:
+            logger.log(log_level, f"Экземпляр {self.instance_id} больше не ведущий ('{self.name}').")
+            self.on_demoted()
+
+    async def _cancel_task(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def hold(self):
+        """
+        Начало остановки: роль больше не меняется и обработчики не вызываются, поэтому
+        ничто не возобновит приостановленные задачи. Полученная аренда продлевается
+        до stop(), чтобы резервный экземпляр не стал ведущим раньше времени.
+        """
+        await self._cancel_task()
+        if self.is_leader:
+            self._task = asyncio.create_task(self._renew_held())
+
+    async def stop(self):
+        """Остановка продления и освобождение аренды, чтобы резервный экземпляр не ждал её истечения."""
+        await self._cancel_task()
+        if self.is_leader:
+            self._set_leader(False, logging.INFO)
+        # Аренду могла захватить попытка, прерванная остановкой: освобождается только своя
+        try:
+            await run_in_db(_release, self.name, self.instance_id)
+        except Exception as e:
+            logger.error(f"Ошибка при освобождении аренды '{self.name}': {e}")
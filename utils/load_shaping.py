@@ -0,0 +1,75 @@
+# utils/load_shaping.py
+
+import zlib
+from collections import Counter
+from datetime import datetime, timedelta
+from apscheduler.triggers.base import BaseTrigger
+from config import SCHEDULE_SPREAD_SECONDS
+
+class ShiftedTrigger(BaseTrigger):
+    """
+    Триггер APScheduler, срабатывающий на offset секунд позже исходного.
+    Сериализуется вместе с задачей, поэтому сдвиг сохраняется после перезапуска.
+    """
+
+    def __init__(self, trigger: BaseTrigger, offset: int):
+        self.trigger = trigger
+        self.offset = offset
+
+    def get_next_fire_time(self, previous_fire_time, now):
+        shift = timedelta(seconds=self.offset)
+        previous = previous_fire_time - shift if previous_fire_time else None
+        next_fire_time = self.trigger.get_next_fire_time(previous, now - shift)
+        return next_fire_time + shift if next_fire_time else None
+
+    def __str__(self):
+        return f"{self.trigger} +{self.offset}s"
+
+    def __repr__(self):
+        return f"<ShiftedTrigger ({self.trigger!r}, offset={self.offset})>"
+
+def spread_offset(template_id: int, spread: int = SCHEDULE_SPREAD_SECONDS) -> int:
+    """
+    Сдвиг отправки шаблона внутри окна распределения нагрузки, в секундах.
+    Зависит только от ID шаблона: при повторной настройке расписания сдвиг тот же.
+    """
+    if spread <= 0:
+        return 0
+    return zlib.crc32(f"template_{template_id}".encode()) % spread
+
+def shape_trigger(trigger: BaseTrigger, template_id: int) -> BaseTrigger:
+    """Сдвиг триггера шаблона, чтобы одинаковые расписания не срабатывали в одну секунду."""
+    offset = spread_offset(template_id)
+    return ShiftedTrigger(trigger, offset) if offset else trigger
+
+def forecast_sends(jobs, chat_counts: dict, start: datetime, end: datetime) -> Counter:
+    """
+    Прогноз количества отправок по минутам на интервале [start, end).
+    jobs — пары (триггер, ID шаблона), chat_counts — количество чатов рассылки шаблонов.
+    """
+    per_minute = Counter()
+    for trigger, template_id in jobs:
+        sends = chat_counts.get(template_id) or 1
+        fire_time = trigger.get_next_fire_time(None, start)
+        # Ограничение на случай триггеров чаще раза в секунду
+        for _ in range(3600):
+            if fire_time is None or fire_time >= end:
+                break
+            per_minute[fire_time.astimezone(start.tzinfo).replace(second=0, microsecond=0)] += sends
+            fire_time = trigger.get_next_fire_time(fire_time, fire_time)
+    return per_minute
+
+def format_forecast(per_minute: Counter, start: datetime, capacity_per_minute: int) -> str:
+    """Гистограмма отправок по минутам часа, начинающегося в start."""
+    if not per_minute:
+        return f"С {start:%H:%M} до {start + timedelta(hours=1):%H:%M} отправок не запланировано."
+    peak = max(per_minute.values())
+    lines = [f"Прогноз отправок с {start:%H:%M} до {start + timedelta(hours=1):%H:%M} (всего {sum(per_minute.values())}):"]
+    for minute in sorted(per_minute):
+        count = per_minute[minute]
+        bar = "▇" * max(1, round(count / peak * 20))
+        warning = " ⚠️" if count > capacity_per_minute else ""
+        lines.append(f"{minute:%H:%M} {bar} {count}{warning}")
+    if peak > capacity_per_minute:
+        lines.append(f"⚠️ — больше, чем бот успевает отправить за минуту ({capacity_per_minute}).")
+    return "\n".join(lines)
@@ -0,0 +1,42 @@
+# utils/media_cache.py
+
+import logging
+from database import SessionLocal, run_in_db
+from models.models import MediaFile
+
+logger = logging.getLogger(__name__)
+
+def _get_cached_file_id(image_path: str):
+    with SessionLocal() as session:
+        media = session.query(MediaFile).filter(MediaFile.path == image_path).first()
+        return media.file_id if media else None
+
+def _save_file_id(image_path: str, file_id: str):
+    with SessionLocal() as session:
+        session.merge(MediaFile(path=image_path, file_id=file_id))
+        session.commit()
+
+def _forget_file_id(image_path: str):
+    with SessionLocal() as session:
+        session.query(MediaFile).filter(MediaFile.path == image_path).delete()
+        session.commit()
+
+async def get_cached_file_id(image_path: str):
+    """
+    Получение сохранённого file_id для локального изображения.
+    Возвращает None, если изображение ещё не загружалось в Telegram.
+    """
+    return await run_in_db(_get_cached_file_id, image_path)
+
+async def save_file_id(image_path: str, file_id: str):
+    """
+    Сохранение file_id, выданного Telegram для изображения.
+    """
+    await run_in_db(_save_file_id, image_path, file_id)
+    logger.info(f"file_id для изображения '{image_path}' сохранён.")
+
+async def forget_file_id(image_path: str):
+    """
+    Удаление file_id изображения из кеша (например, при удалении файла).
+    """
+    await run_in_db(_forget_file_id, image_path)
@@ -0,0 +1,110 @@
+# utils/placeholders.py
+
+import re
+from collections import OrderedDict
+from datetime import datetime
+from config import TEMPLATE_CACHE_SIZE
+
+# Подстановки в тексте шаблона: встроенные значения и пользовательские переменные
+# {название} (команда /set_var). Двойные скобки {{ и }} выводятся как одна скобка;
+# фигурные скобки, не образующие подстановку, остаются в тексте как есть
+BUILTIN_PLACEHOLDERS = {
+    "date": "дата отправки, например 31.12.2024",
+    "time": "время отправки, например 12:00",
+    "weekday": "день недели, например понедельник",
+    "count": "номер рассылки шаблона: 1, 2, 3...",
+}
+
+WEEKDAYS = ("понедельник", "вторник", "среда", "четверг", "пятница", "суббота", "воскресенье")
+
+_TOKEN = re.compile(r"\{\{|\}\}|\{(\w+)\}")
+
+# Допустимое название пользовательской переменной
+VARIABLE_NAME = re.compile(r"\w{1,64}")
+
+def _escape(literal: str) -> str:
+    return literal.replace("{", "{{").replace("}", "}}")
+
+class CompiledText:
+    """
+    Текст шаблона, разобранный один раз при подготовке шаблона. Литералы
+    и подстановки собраны в строку формата с позиционными полями, поэтому
+    отрисовка — один вызов str.format без разбора текста.
+    """
+    __slots__ = ("keys", "variables", "uses_count", "_format", "_text")
+
+    def __init__(self, text: str):
+        parts, keys = [], []
+        position = 0
+        for match in _TOKEN.finditer(text):
+            parts.append(_escape(text[position:match.start()]))
+            if match.group(1) is None:
+                parts.append(match.group(0))  # {{ и }} уже записаны так, как их ждёт str.format
+            else:
+                parts.append("{}")
+                keys.append(match.group(1))
+            position = match.end()
+        parts.append(_escape(text[position:]))
+        self.keys = tuple(keys)
+        self.variables = frozenset(key for key in keys if key not in BUILTIN_PLACEHOLDERS)
+        self.uses_count = "count" in keys
+        # Текст без подстановок и экранирования отдаётся как есть
+        self._format = "".join(parts) if position else None
+        self._text = text
+
+    def render(self, values: dict) -> str:
+        """Текст с подстановками. Подстановка без значения выводится как есть: {название}."""
+        if self._format is None:
+            return self._text
+        return self._format.format(*[values[key] if key in values else f"{{{key}}}" for key in self.keys])
+
+def unknown_placeholders(text: str, variable_names) -> list:
+    """Подстановки текста, которые не являются встроенными и не заданы как переменные."""
+    keys = CompiledText(text).keys
+    return [key for key in dict.fromkeys(keys) if key not in BUILTIN_PLACEHOLDERS and key not in variable_names]
+
+def builtin_values(moment: datetime) -> dict:
+    """Значения встроенных подстановок, кроме {count}, на момент отправки."""
+    return {
+        "date": moment.strftime("%d.%m.%Y"),
+        "time": moment.strftime("%H:%M"),
+        "weekday": WEEKDAYS[moment.weekday()],
+    }
+
+def describe_placeholders() -> str:
+    """Справка по подстановкам для ответов администратору."""
+    lines = [f"{{{name}}} — {description}" for name, description in BUILTIN_PLACEHOLDERS.items()]
+    lines.append("{название} — пользовательская переменная (/set_var, /vars)")
+    lines.append("{{ и }} — фигурные скобки")
+    return "\n".join(lines)
+
+class CompiledCache:
+    """
+    LRU-кеш разобранных текстов по ID шаблона и версии текста.
+    Версия растёт при каждом изменении текста, поэтому устаревший разбор
+    не используется, даже если кеш не был сброшен.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries = OrderedDict()  # ID шаблона -> (версия, CompiledText)
+
+    def get(self, template_id: int, version: int, text: str) -> CompiledText:
+        entry = self._entries.get(template_id)
+        if entry is not None and entry[0] == version:
+            self._entries.move_to_end(template_id)
+            return entry[1]
+        compiled = CompiledText(text)
+        self._entries[template_id] = (version, compiled)
+        self._entries.move_to_end(template_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return compiled
+
+    def invalidate(self, template_id: int):
+        self._entries.pop(template_id, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+compiled_cache = CompiledCache(TEMPLATE_CACHE_SIZE)
@@ -0,0 +1,205 @@
+# utils/profiling.py
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from typing import NamedTuple
+
+logger = logging.getLogger(__name__)
+
+# Обработчики обновлений, выполняющиеся сейчас: задача asyncio -> имя обработчика
+# (заполняется middleware метрик, читается из потока сторожа)
+running_handlers = {}
+
+# Кадр, из которого цикл событий вызывает шаг задачи или обратный вызов:
+# кадры до него (bot.py, run_forever, _run_once) одинаковы во всех стеках
+_HANDLE_RUN_FILE = os.path.join("asyncio", "events.py")
+
+def _loop_stack(thread_id: int, limit: int = 30):
+    """Стек потока цикла событий начиная с выполняемой задачи, не более limit последних кадров."""
+    frame = sys._current_frames().get(thread_id)
+    if frame is None:
+        return []
+    stack = traceback.extract_stack(frame)
+    for index, entry in enumerate(stack):
+        if entry.name == "_run" and entry.filename.endswith(_HANDLE_RUN_FILE):
+            stack = stack[index + 1:]
+            break
+    return stack[-limit:]
+
+def describe_task(task) -> str:
+    """Имя обработчика или корутины задачи asyncio."""
+    if task is None:
+        return "вне задачи (обратный вызов цикла событий)"
+    handler = running_handlers.get(task)
+    if handler:
+        return f"обработчик {handler}"
+    coro = task.get_coro()
+    return f"задача {getattr(coro, '__qualname__', repr(coro))}"
+
+class StallReport(NamedTuple):
+    duration: float   # Сколько секунд цикл событий не отвечал к моменту снимка стека
+    task: str         # Выполнявшийся обработчик или задача
+    stack: str        # Стек потока цикла событий
+
+class StallWatchdog:
+    """
+    Сторож цикла событий. Задача в цикле событий каждые threshold/4 секунд
+    отмечает, что цикл отвечает; отдельный поток проверяет отметку и, если её
+    нет дольше threshold секунд, снимает стек потока цикла событий — то есть
+    код, который его блокирует, — и передаёт отчёт в on_stall (из своего потока).
+    Об одной блокировке сообщается один раз.
+    """
+
+    def __init__(self, threshold: float, on_stall):
+        self.threshold = threshold
+        self.on_stall = on_stall
+        self.stalls = 0
+        self._beat = 0.0
+        self._reported_beat = None
+        self._loop = None
+        self._thread_id = None
+        self._task = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self._task is not None or not self.threshold:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stop.set()
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        await asyncio.get_running_loop().run_in_executor(None, self._thread.join)
+        self._thread = None
+
+    async def _heartbeat(self):
+        interval = self.threshold / 4
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            if self._reported_beat == self._beat:
+                logger.warning(f"Цикл событий снова отвечает, блокировка длилась {now - self._beat:.2f} с.")
+            self._beat = now
+
+    def _watch(self):
+        while not self._stop.wait(self.threshold / 4):
+            beat = self._beat
+            stalled = time.monotonic() - beat
+            if stalled < self.threshold or beat == self._reported_beat:
+                continue
+            stack = "".join(traceback.format_list(_loop_stack(self._thread_id)))
+            task = asyncio.current_task(self._loop)
+            self._reported_beat = beat
+            self.stalls += 1
+            try:
+                self.on_stall(StallReport(stalled, describe_task(task), stack))
+            except Exception:
+                logger.exception("Ошибка при обработке отчёта о блокировке цикла событий")
+
+def log_stall(report: StallReport):
+    logger.warning(
+        f"Цикл событий не отвечает {report.duration:.2f} с, выполняется {report.task}. "
+        f"Стек потока цикла событий:\n{report.stack}"
+    )
+
+class ProfileResult(NamedTuple):
+    seconds: float
+    samples: int
+    idle: int          # Снимки, в которых цикл событий ждал событий (select)
+    own: Counter       # Функция -> снимки, в которых она выполнялась сама
+    total: Counter     # Функция -> снимки, в которых она была в стеке
+    stacks: Counter    # Свёрнутый стек ("a;b;c") -> снимки
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep
+
+def _short_path(filename: str) -> str:
+    """Путь относительно проекта или каталога установленных пакетов."""
+    if filename.startswith(_ROOT):
+        return filename[len(_ROOT):]
+    _, found, rest = filename.rpartition(f"site-packages{os.sep}")
+    return rest if found else filename
+
+def _frame_name(frame, line: bool = True) -> str:
+    location = _short_path(frame.filename) + (f":{frame.lineno}" if line else "")
+    return f"{frame.name} ({location})"
+
+def _is_idle(stack) -> bool:
+    return bool(stack) and stack[-1].name in ("select", "poll", "epoll") and "selectors" in stack[-1].filename
+
+def sample_loop(thread_id: int, seconds: float, interval: float) -> ProfileResult:
+    """
+    Статистический профилировщик: каждые interval секунд в течение seconds
+    секунд снимает стек потока thread_id. Выполняется в отдельном потоке.
+    """
+    own, total, stacks = Counter(), Counter(), Counter()
+    samples = idle = 0
+    started = time.perf_counter()
+    deadline = started + seconds
+    while time.perf_counter() < deadline:
+        stack = _loop_stack(thread_id, limit=60)
+        samples += 1
+        if _is_idle(stack):
+            idle += 1
+        elif stack:
+            # Собственное время — с точностью до строки, время с вложенными вызовами — по функциям
+            own[_frame_name(stack[-1])] += 1
+            for name in {_frame_name(frame, line=False) for frame in stack}:
+                total[name] += 1
+            stacks[";".join(frame.name for frame in stack)] += 1
+        time.sleep(interval)
+    return ProfileResult(time.perf_counter() - started, samples, idle, own, total, stacks)
+
+def format_profile(result: ProfileResult, top: int = 30) -> str:
+    """Текстовый отчёт профилировщика: самые затратные функции и свёрнутые стеки (для flamegraph)."""
+    busy = result.samples - result.idle
+    lines = [
+        f"Профиль цикла событий за {result.seconds:.1f} с: снимков {result.samples}, "
+        f"занят {busy} ({busy / max(result.samples, 1):.1%}), ожидал событий {result.idle}.",
+        "Доли считаются от всех снимков. Запросы к базе данных в пуле потоков БД сюда не попадают:",
+        "в профиле виден только код, выполнявшийся в потоке цикла событий.",
+        "",
+        f"== Собственное время (топ {top}) ==",
+    ]
+    for name, count in result.own.most_common(top):
+        lines.append(f"{count / max(result.samples, 1):7.2%} {count:7d}  {name}")
+    lines += ["", f"== Время с вложенными вызовами (топ {top}) =="]
+    for name, count in result.total.most_common(top):
+        lines.append(f"{count / max(result.samples, 1):7.2%} {count:7d}  {name}")
+    lines += ["", "== Свёрнутые стеки (формат flamegraph.pl / speedscope) =="]
+    for stack, count in result.stacks.most_common():
+        lines.append(f"{stack} {count}")
+    return "\n".join(lines) + "\n"
+
+class LoopProfiler:
+    """Запуск профилировщика цикла событий по команде; одновременно выполняется один профиль."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.running = False
+
+    async def profile(self, seconds: float) -> ProfileResult:
+        if self.running:
+            raise RuntimeError("Профилирование уже выполняется.")
+        self.running = True
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, sample_loop, threading.get_ident(), seconds, self.interval)
+        finally:
+            self.running = False
@@ -0,0 +1,87 @@
+# utils/rate_limit.py
+
+import asyncio
+import time
+
+class TokenBucket:
+    """
+    Ведро токенов с резервированием.
+    Каждый вызов acquire занимает следующий свободный токен и ждёт ровно до
+    момента его появления, поэтому ожидающие отправки не будят друг друга.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate                # Токенов в секунду
+        self.capacity = capacity        # Максимальный размер всплеска
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reserve(self) -> float:
+        """Резервирование токена. Возвращает задержку в секундах до его появления."""
+        self._refill()
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+    def delay(self) -> float:
+        """Через сколько секунд появится свободный токен (без резервирования)."""
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    def try_take(self) -> float:
+        """
+        Взятие токена, если он уже есть: возвращает 0. Иначе токен не резервируется,
+        а возвращается задержка до его появления.
+        """
+        delay = self.delay()
+        if not delay:
+            self.tokens -= 1
+        return delay
+
+    def block(self, seconds: float):
+        """Токены не выдаются ближайшие seconds секунд (ответ 429 с retry_after)."""
+        self._refill()
+        self.tokens = min(self.tokens, 1) - seconds * self.rate
+
+    async def acquire(self):
+        delay = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+class RateLimiter:
+    """
+    Ограничитель частоты запросов к Bot API: общее ведро на бота
+    и отдельное ведро на каждый чат.
+    """
+
+    def __init__(self, global_per_second: float, chat_per_minute: float):
+        # Вёдра без запаса на всплеск: отправки равномерно распределяются во времени
+        self.global_bucket = TokenBucket(global_per_second, 1)
+        self.chat_per_minute = chat_per_minute
+        self.chat_buckets = {}
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_per_minute / 60, 1)
+        return bucket
+
+    def try_acquire_chat(self, chat_id: int) -> float:
+        """Слот чата, если он свободен (0), иначе задержка до его появления без резервирования."""
+        return self._chat_bucket(chat_id).try_take()
+
+    def chat_delay(self, chat_id: int) -> float:
+        return self._chat_bucket(chat_id).delay()
+
+    def block_chat(self, chat_id: int, seconds: float):
+        """Пауза отправок в чат после ответа 429 Too Many Requests."""
+        self._chat_bucket(chat_id).block(seconds)
+
+    async def acquire_global(self):
+        await self.global_bucket.acquire()
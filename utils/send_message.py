@@ -1,50 +1,513 @@
 # utils/send_message.py
 
+import asyncio
+import functools
+import heapq
+import itertools
+import json
 import logging
+import random
+import time
+from datetime import datetime
 from aiogram import Bot
-from aiogram.types import InputFile, InlineKeyboardMarkup, InlineKeyboardButton
-from database import SessionLocal
-from models.models import Template
-from config import GROUP_ID
+from aiogram.utils.exceptions import (
+    WrongFileIdentifier, WrongRemoteFileIdSpecified, TypeOfFileMismatch,
+    RetryAfter, NetworkError, RestartingTelegram,
+)
+from config import (
+    GROUP_ID, RATE_LIMIT_GLOBAL_PER_SECOND, RATE_LIMIT_CHAT_PER_MINUTE,
+    SEND_QUEUE_WORKERS, SEND_QUEUE_MAX_SIZE, SEND_MAX_RETRIES, UNFINISHED_SEND_MAX_AGE,
+)
+from models.repository import increment_send_count, get_variables, add_unfinished_sends, take_unfinished_sends
+from utils.delivery_journal import delivery_journal
+from utils.media_cache import save_file_id
+from utils.placeholders import builtin_values
+from utils.rate_limit import RateLimiter
+from utils.template_cache import PreparedTemplate, get_prepared_template
+from utils.transport import upload_source
 
 logger = logging.getLogger(__name__)
 
-async def send_template(bot: Bot, template_id: int):
+rate_limiter = RateLimiter(RATE_LIMIT_GLOBAL_PER_SECOND, RATE_LIMIT_CHAT_PER_MINUTE)
+
+# Ошибки Telegram, означающие, что сохранённый file_id больше не действителен
+STALE_FILE_ID_ERRORS = (WrongFileIdentifier, WrongRemoteFileIdSpecified, TypeOfFileMismatch)
+
+class BroadcastResult:
     """
-    Отправка сообщения в группу на основе шаблона.
+    Итоги рассылки шаблона: количество доставок, ошибок и длительность.
     """
-    with SessionLocal() as session:
-        template = session.query(Template).filter(Template.id == template_id).first()
-        if not template:
-            logger.error(f"Шаблон с ID {template_id} не найден.")
+
+    def __init__(self, template_name: str, total: int):
+        self.template_name = template_name
+        self.total = total
+        self.sent = 0
+        self.failed = 0
+        self.started_at = time.monotonic()
+        self.finished_at = None
+
+    def finish(self):
+        self.finished_at = time.monotonic()
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    @property
+    def rate(self) -> float:
+        """Пропускная способность рассылки, сообщений в секунду."""
+        return self.sent / self.elapsed if self.elapsed > 0 else float(self.sent)
+
+    def summary(self) -> str:
+        return (f"Рассылка шаблона '{self.template_name}': доставлено {self.sent} из {self.total}, "
+                f"ошибок {self.failed}, за {self.elapsed:.2f} с ({self.rate:.1f} сообщ./с).")
+
+async def send_photo_cached(bot: Bot, chat_id: int, prepared: PreparedTemplate, **kwargs):
+    """
+    Отправка изображения шаблона по сохранённому file_id.
+    Файл загружается в Telegram только при первой отправке или если file_id устарел.
+    """
+    if prepared.file_id:
+        try:
+            return await bot.send_photo(chat_id=chat_id, photo=prepared.file_id, **kwargs)
+        except STALE_FILE_ID_ERRORS as e:
+            logger.warning(f"Telegram отклонил file_id изображения '{prepared.image_path}': {e}. Файл будет загружен заново.")
+    message = await bot.send_photo(chat_id=chat_id, photo=upload_source(bot, prepared.image_path), **kwargs)
+    prepared.file_id = message.photo[-1].file_id
+    await save_file_id(prepared.image_path, prepared.file_id)
+    return message
+
+class _Request:
+    """Запрос в очереди отправки."""
+    __slots__ = ("chat_id", "call", "future", "attempt", "released")
+
+    def __init__(self, chat_id: int, call, future: asyncio.Future):
+        self.chat_id = chat_id
+        self.call = call
+        self.future = future
+        self.attempt = 0        # Повторы после временных ошибок и ответов 429
+        self.released = False   # Запрос вышел из очереди ожидания своего чата
+
+class SendQueue:
+    """
+    Очередь исходящих запросов к Bot API.
+
+    Запросы выполняются фиксированным числом обработчиков с учётом лимитов
+    Telegram. Сообщения администратора обгоняют массовые рассылки, а
+    ограниченный размер очереди притормаживает тех, кто ставит в неё задачи.
+
+    Обработчики ждут только общее ведро токенов. Запрос в чат, у которого слот
+    ещё не освободился, откладывается в очередь ожидания этого чата (в порядке
+    приоритета), и один таймер на чат возвращает его в общую очередь, когда
+    слот освободится. Так очередь к одному чату (например, все шаблоны без
+    чатов рассылки идут в GROUP_ID) не занимает обработчиков и не задерживает
+    отправки в другие чаты. Повторы после ошибок тоже ждут на таймере.
+    """
+    PRIORITY_ADMIN = 0
+    PRIORITY_BULK = 1
+
+    # Временные ошибки, после которых запрос повторяется с нарастающей задержкой
+    TRANSIENT_ERRORS = (NetworkError, RestartingTelegram, asyncio.TimeoutError)
+
+    def __init__(self, workers: int, max_size: int, max_retries: int, backoff_base: float = 1.0, backoff_max: float = 60.0):
+        self.workers = workers
+        self.max_size = max_size
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._queue = None
+        self._slots = None
+        self._worker_tasks = []
+        self._counter = itertools.count()  # Порядок FIFO внутри одного приоритета
+        self._unfinished = 0                # Запросы, поставленные в очередь и ещё не выполненные
+        self._waiting = {}                  # ID чата -> куча (приоритет, номер, запрос), ждущих слота чата
+        self._release_timers = {}           # ID чата -> таймер возврата следующего запроса чата
+        self._retries = {}                  # Номер запроса -> (таймер повтора, элемент очереди)
+        self.background_tasks = set()       # Рассылки, поставленные без ожидания результата
+
+    def _ensure_started(self):
+        if self._queue is None:
+            # Отложенные запросы возвращаются в очередь без ожидания, поэтому сама
+            # очередь не ограничена, а её размер ограничивает семафор в submit
+            self._queue = asyncio.PriorityQueue()
+            self._slots = asyncio.Semaphore(self.max_size)
+            self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+            logger.info(f"Очередь отправки запущена: обработчиков {self.workers}, размер до {self.max_size}.")
+
+    def qsize(self) -> int:
+        """Запросы, ожидающие отправки (в общей очереди, в очередях чатов и до повтора)."""
+        if self._queue is None:
+            return 0
+        return self._queue.qsize() + sum(len(waiting) for waiting in self._waiting.values()) + len(self._retries)
+
+    def idle(self) -> bool:
+        """Нет ни запросов в очереди и в работе, ни фоновых рассылок."""
+        return not self._unfinished and not self.background_tasks
+
+    async def submit(self, chat_id: int, call, priority: int = PRIORITY_BULK) -> asyncio.Future:
+        """
+        Постановка запроса в очередь. call — функция без аргументов, возвращающая
+        корутину запроса; она вызывается заново при каждой повторной попытке.
+        Возвращает future с результатом запроса. Ждёт, если очередь заполнена.
+        """
+        self._ensure_started()
+        await self._slots.acquire()
+        future = asyncio.get_running_loop().create_future()
+        self._unfinished += 1
+        future.add_done_callback(self._on_done)
+        self._queue.put_nowait((priority, next(self._counter), _Request(chat_id, call, future)))
+        return future
+
+    def _on_done(self, future: asyncio.Future):
+        # После stop() счётчики уже сброшены
+        if self._slots is None:
             return
+        self._unfinished -= 1
+        self._slots.release()
 
-    try:
-        if template.image_path:
-            photo = InputFile(template.image_path)
-            if template.button_text and template.button_url:
-                keyboard = InlineKeyboardMarkup()
-                button = InlineKeyboardButton(text=template.button_text, url=template.button_url)
-                keyboard.add(button)
-                await bot.send_photo(chat_id=GROUP_ID, photo=photo, caption=template.text, reply_markup=keyboard)
-            else:
-                await bot.send_photo(chat_id=GROUP_ID, photo=photo, caption=template.text)
+    async def call(self, chat_id: int, call, priority: int = PRIORITY_BULK):
+        """Выполнение запроса через очередь с ожиданием результата."""
+        return await (await self.submit(chat_id, call, priority))
+
+    def spawn(self, coro):
+        """Запуск корутины рассылки в фоне; задача хранится до завершения."""
+        task = asyncio.ensure_future(coro)
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+        return task
+
+    async def _worker(self):
+        while True:
+            item = await self._queue.get()
+            request = item[2]
+            try:
+                if request.future.done():
+                    # Отменённый запрос, вышедший из очереди чата, пропускает ход следующему
+                    if request.released:
+                        self._release_next(request.chat_id)
+                    continue
+                if not self._take_chat_slot(item):
+                    continue
+                await rate_limiter.acquire_global()
+                await self._execute(item)
+            except asyncio.CancelledError:
+                if not request.future.done():
+                    request.future.cancel()
+                raise
+            except Exception as e:
+                if not request.future.done():
+                    request.future.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+    def _take_chat_slot(self, item) -> bool:
+        """
+        Занятие слота чата для запроса. Если слот занят или к чату уже есть
+        очередь, запрос откладывается в очередь ожидания чата и возвращается False.
+        """
+        request = item[2]
+        chat_id = request.chat_id
+        waiting = self._waiting.get(chat_id)
+        if waiting is not None and not request.released:
+            heapq.heappush(waiting, item)
+            return False
+        request.released = False
+        delay = rate_limiter.try_acquire_chat(chat_id)
+        if delay:
+            if waiting is None:
+                waiting = self._waiting[chat_id] = []
+            heapq.heappush(waiting, item)
+            self._schedule_release(chat_id, delay)
+            return False
+        if waiting:
+            self._schedule_release(chat_id, rate_limiter.chat_delay(chat_id))
+        elif waiting is not None:
+            del self._waiting[chat_id]
+        return True
+
+    def _schedule_release(self, chat_id: int, delay: float):
+        timer = self._release_timers.pop(chat_id, None)
+        if timer is not None:
+            timer.cancel()
+        self._release_timers[chat_id] = asyncio.get_running_loop().call_later(delay, self._release_next, chat_id)
+
+    def _release_next(self, chat_id: int):
+        """Возврат в общую очередь первого по приоритету запроса, ждущего слота чата."""
+        timer = self._release_timers.pop(chat_id, None)
+        if timer is not None:
+            timer.cancel()
+        waiting = self._waiting.get(chat_id)
+        if not waiting:
+            self._waiting.pop(chat_id, None)
+            return
+        item = heapq.heappop(waiting)
+        item[2].released = True
+        self._queue.put_nowait(item)
+
+    def _retry_later(self, item, delay: float):
+        seq = item[1]
+
+        def retry():
+            self._retries.pop(seq, None)
+            self._queue.put_nowait(item)
+
+        self._retries[seq] = (asyncio.get_running_loop().call_later(delay, retry), item)
+
+    async def _execute(self, item):
+        request = item[2]
+        try:
+            result = await request.call()
+        except RetryAfter as e:
+            request.attempt += 1
+            if request.attempt > self.max_retries:
+                raise
+            # Ответ 429 приостанавливает отправки в чат; запрос ждёт слота чата в очереди
+            logger.warning(f"Превышен лимит Telegram для чата {request.chat_id}, повтор через {e.timeout} с.")
+            rate_limiter.block_chat(request.chat_id, e.timeout)
+            self._queue.put_nowait(item)
+            return
+        except self.TRANSIENT_ERRORS as e:
+            request.attempt += 1
+            if request.attempt > self.max_retries:
+                raise
+            # Экспоненциальная задержка со случайным разбросом
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** request.attempt))
+            logger.warning(f"Временная ошибка при отправке в чат {request.chat_id}: {e}. "
+                           f"Попытка {request.attempt} через {delay:.1f} с.")
+            self._retry_later(item, delay)
+            return
+        if not request.future.done():
+            request.future.set_result(result)
+
+    async def stop(self):
+        """
+        Остановка очереди: фоновые рассылки и обработчики прерываются, запросы,
+        оставшиеся в очереди, отменяются (их future получают отмену).
+        """
+        tasks = list(self.background_tasks) + self._worker_tasks
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        items = []
+        for timer in self._release_timers.values():
+            timer.cancel()
+        for timer, item in self._retries.values():
+            timer.cancel()
+            items.append(item)
+        for waiting in self._waiting.values():
+            items.extend(waiting)
+        if self._queue is not None:
+            while not self._queue.empty():
+                items.append(self._queue.get_nowait())
+        for item in items:
+            item[2].future.cancel()
+        self._release_timers.clear()
+        self._retries.clear()
+        self._waiting.clear()
+        self._worker_tasks = []
+        self._queue = None
+        self._slots = None
+        self._unfinished = 0
+        # Обратные вызовы отменённых запросов (запись в журнал доставок) выполняются до возврата
+        await asyncio.sleep(0)
+
+send_queue = SendQueue(SEND_QUEUE_WORKERS, SEND_QUEUE_MAX_SIZE, SEND_MAX_RETRIES)
+
+class PendingBroadcast:
+    """Рассылка шаблона, которая ещё не доставлена во все чаты."""
+    __slots__ = ("template_id", "scheduled_at", "text", "chat_ids")
+
+    def __init__(self, template_id: int, scheduled_at: float):
+        self.template_id = template_id
+        self.scheduled_at = scheduled_at
+        self.text = None      # Текст с подстановками, известен после отрисовки
+        self.chat_ids = None  # Недоставленные чаты, известны с начала рассылки; None — все чаты шаблона
+
+class PendingBroadcasts:
+    """
+    Незавершённые рассылки. Запись удаляется, когда рассылка завершена;
+    если рассылку прервала остановка бота, запись остаётся с недоставленными
+    чатами и при остановке сохраняется в базу для повтора при следующем запуске.
+    """
+
+    def __init__(self):
+        self._items = set()
+
+    def begin(self, template_id: int, scheduled_at: float) -> PendingBroadcast:
+        pending = PendingBroadcast(template_id, scheduled_at)
+        self._items.add(pending)
+        return pending
+
+    def finish(self, pending: PendingBroadcast, force: bool = False):
+        """Удаление завершённой рассылки; рассылка с отменёнными отправками остаётся, если не force."""
+        if force or not pending.chat_ids:
+            self._items.discard(pending)
+
+    def __len__(self):
+        return len(self._items)
+
+    async def save(self) -> int:
+        """Запись незавершённых рассылок в базу. Возвращает их количество."""
+        recorded_at = time.time()
+        rows = [{
+            "template_id": pending.template_id,
+            "scheduled_at": pending.scheduled_at,
+            "text": pending.text,
+            "chat_ids": json.dumps(sorted(pending.chat_ids)) if pending.chat_ids is not None else None,
+            "recorded_at": recorded_at,
+        } for pending in self._items if pending.chat_ids is None or pending.chat_ids]
+        await add_unfinished_sends(rows)
+        self._items.clear()
+        return len(rows)
+
+pending_broadcasts = PendingBroadcasts()
+
+async def send_to_chat(bot: Bot, chat_id: int, template: PreparedTemplate, text: str):
+    """
+    Отправка подготовленного шаблона с готовым текстом в один чат.
+    """
+    if template.image_path:
+        return await send_photo_cached(bot, chat_id, template, caption=text, reply_markup=template.reply_markup)
+    return await bot.send_message(chat_id=chat_id, text=text, reply_markup=template.reply_markup)
+
+async def render_text(template: PreparedTemplate, scheduled_at: float) -> str:
+    """
+    Текст рассылки с подстановками на плановое время отправки. Отрисовывается
+    один раз на всю рассылку; к базе данных обращается, только если в тексте
+    есть {count} или пользовательские переменные.
+    """
+    compiled = template.compiled
+    if compiled is None:
+        return template.text
+    if not compiled.keys:
+        return compiled.render({})  # Без подстановок, но {{ и }} всё равно выводятся как одна скобка
+    values = builtin_values(datetime.fromtimestamp(scheduled_at))
+    if compiled.uses_count:
+        values["count"] = str(await increment_send_count(template.id))
+    if compiled.variables:
+        values.update(await get_variables())
+    return compiled.render(values)
+
+async def broadcast_template(bot: Bot, template: PreparedTemplate, chat_ids, scheduled_at: float = None,
+                             text: str = None, pending_broadcast: PendingBroadcast = None) -> BroadcastResult:
+    """
+    Рассылка шаблона в несколько чатов через очередь отправки.
+    Скорость ограничивается общим ведром токенов и ведром каждого чата.
+    Каждая доставка записывается в журнал; задержка считается от scheduled_at
+    (Unix), по умолчанию — от начала рассылки. Подстановки в тексте (дата,
+    номер рассылки) отрисовываются на scheduled_at, одинаково для всех чатов,
+    если готовый текст не передан в text. В pending_broadcast отмечаются недоставленные чаты.
+    """
+    result = BroadcastResult(template.name, len(chat_ids))
+    if scheduled_at is None:
+        scheduled_at = time.time()
+    if text is None:
+        text = await render_text(template, scheduled_at)
+    if pending_broadcast is not None:
+        pending_broadcast.text, pending_broadcast.chat_ids = text, set(chat_ids)
+
+    def on_delivered(chat_id: int, future: asyncio.Future):
+        message_id = error = None
+        if future.cancelled():
+            result.failed += 1
+            error = "Отправка отменена"
+        elif future.exception():
+            result.failed += 1
+            error = f"{type(future.exception()).__name__}: {future.exception()}"
+            logger.error(f"Ошибка при отправке шаблона '{template.name}' в чат {chat_id}: {future.exception()}")
         else:
-            if template.button_text and template.button_url:
-                keyboard = InlineKeyboardMarkup()
-                button = InlineKeyboardButton(text=template.button_text, url=template.button_url)
-                keyboard.add(button)
-                await bot.send_message(chat_id=GROUP_ID, text=template.text, reply_markup=keyboard)
-            else:
-                await bot.send_message(chat_id=GROUP_ID, text=template.text)
-        logger.info(f"Сообщение по шаблону '{template.name}' успешно отправлено в группу.")
-    except Exception as e:
-        logger.error(f"Ошибка при отправке шаблона: {e}")
+            result.sent += 1
+            message_id = future.result().message_id
+        # Отменённая отправка (остановка бота) остаётся недоставленной и будет повторена
+        if pending_broadcast is not None and not future.cancelled():
+            pending_broadcast.chat_ids.discard(chat_id)
+        delivery_journal.record(template.id, chat_id, scheduled_at, time.time(), message_id, error)
+
+    async def submit(chat_id: int):
+        future = await send_queue.submit(chat_id, lambda: send_to_chat(bot, chat_id, template, text))
+        future.add_done_callback(functools.partial(on_delivered, chat_id))
+        return future
+
+    pending = list(chat_ids)
+    # Изображение без file_id загружается один раз, остальные чаты получают его по file_id
+    if template.image_path and not template.file_id and pending:
+        await asyncio.wait([await submit(pending.pop(0))])
+    futures = [await submit(chat_id) for chat_id in pending]
+    if futures:
+        await asyncio.wait(futures)
+    result.finish()
+    return result
+
+async def send_template(bot: Bot, template_id: int, scheduled_at: float = None, chat_ids=None, text: str = None):
+    """
+    Отправка сообщения на основе шаблона во все его чаты (или в группу по умолчанию).
+    scheduled_at — плановое время отправки (Unix) для журнала доставок.
+    chat_ids и text — при повторе незавершённой рассылки: недоставленные чаты
+    (из них отправляются только оставшиеся в рассылке шаблона) и уже отрисованный текст.
+    Возвращает итоги рассылки или None, если шаблон не найден.
+    """
+    if scheduled_at is None:
+        scheduled_at = time.time()
+    pending = pending_broadcasts.begin(template_id, scheduled_at)
+    try:
+        template = await get_prepared_template(template_id)
+        if not template:
+            logger.error(f"Шаблон с ID {template_id} не найден.")
+            pending_broadcasts.finish(pending, force=True)
+            return None
+        targets = template.chat_ids or (GROUP_ID,)
+        if chat_ids is not None:
+            remaining = set(chat_ids)
+            targets = [chat_id for chat_id in targets if chat_id in remaining]
+        result = await broadcast_template(bot, template, targets, scheduled_at, text, pending)
+    except asyncio.CancelledError:
+        # Рассылку прервала остановка бота: запись остаётся для повтора
+        raise
+    except Exception:
+        pending_broadcasts.finish(pending, force=True)
+        raise
+    pending_broadcasts.finish(pending)
+
+    if result.failed:
+        logger.warning(result.summary())
+    else:
+        logger.info(result.summary())
+    return result
 
 async def send_test_message(bot: Bot):
     """Отправка тестового сообщения для проверки работоспособности."""
     try:
-        await bot.send_message(chat_id=GROUP_ID, text="Тестовое сообщение: Бот работает корректно!")
+        await send_queue.call(
+            GROUP_ID,
+            lambda: bot.send_message(chat_id=GROUP_ID, text="Тестовое сообщение: Бот работает корректно!"),
+            priority=SendQueue.PRIORITY_ADMIN,
+        )
         logger.info("Тестовое сообщение успешно отправлено.")
     except Exception as e:
         logger.error(f"Ошибка при отправке тестового сообщения: {e}")
+
+async def resume_unfinished_sends(bot: Bot) -> int:
+    """
+    Повтор рассылок, не завершённых при прошлой остановке бота: в фоне,
+    через очередь отправки, только в недоставленные чаты. Рассылки, записанные
+    раньше чем UNFINISHED_SEND_MAX_AGE секунд назад, пропускаются.
+    Возвращает количество повторённых рассылок.
+    """
+    try:
+        sends = await take_unfinished_sends()
+    except Exception as e:
+        logger.error(f"Ошибка при чтении незавершённых рассылок: {e}")
+        return 0
+    resumed = 0
+    for send in sends:
+        age = time.time() - send.recorded_at
+        if UNFINISHED_SEND_MAX_AGE and age > UNFINISHED_SEND_MAX_AGE:
+            logger.warning(f"Незавершённая рассылка шаблона ID {send.template_id} пропущена: "
+                           f"бот был остановлен {age:.0f} с назад.")
+            continue
+        chat_ids = json.loads(send.chat_ids) if send.chat_ids is not None else None
+        send_queue.spawn(send_template(bot, send.template_id, send.scheduled_at, chat_ids=chat_ids, text=send.text))
+        resumed += 1
+    if resumed:
+        logger.info(f"Повторяются рассылки, не завершённые при остановке бота: {resumed}.")
+    return resumed
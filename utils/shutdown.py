@@ -0,0 +1,66 @@
+# utils/shutdown.py
+
+import asyncio
+import logging
+import signal
+import time
+from aiogram.dispatcher.handler import CancelHandler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+logger = logging.getLogger(__name__)
+
+# Как часто проверять, завершилась ли работа, при ожидании остановки
+DRAIN_POLL_INTERVAL = 0.1
+
+class UpdateGate(BaseMiddleware):
+    """
+    Учёт обрабатываемых обновлений и отказ от новых после начала остановки.
+    В режиме опроса обновления, полученные последним запросом getUpdates после
+    остановки опроса, не подтверждаются в Telegram: следующий запуск бота
+    обработает их, если он выполнен в течение UNFINISHED_SEND_MAX_AGE секунд
+    после штатной остановки, иначе пропустит вместе с остальными накопившимися.
+    В режиме вебхука такие обновления подтверждаются ответом 200 и теряются;
+    новые запросы aiohttp перестаёт принимать ещё до начала остановки.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.closed = False
+        self.active = 0
+
+    def close(self):
+        self.closed = True
+
+    async def on_pre_process_update(self, update, data: dict):
+        if self.closed:
+            logger.info(f"Обновление {update.update_id} пропущено: бот останавливается.")
+            raise CancelHandler()
+        self.active += 1
+
+    async def on_post_process_update(self, update, results, data: dict):
+        self.active -= 1
+
+async def wait_drained(is_drained, timeout: float) -> bool:
+    """
+    Ожидание, пока is_drained() не вернёт True, но не дольше timeout секунд.
+    Возвращает False, если время вышло.
+    """
+    deadline = time.monotonic() + timeout
+    while not is_drained():
+        if time.monotonic() >= deadline:
+            return False
+        await asyncio.sleep(DRAIN_POLL_INTERVAL)
+    return True
+
+def stop_loop_on_sigterm():
+    """
+    Штатная остановка по SIGTERM (docker stop, systemctl stop) в режиме опроса:
+    цикл событий останавливается, и aiogram выполняет on_shutdown, как при Ctrl+C.
+    В режиме вебхука SIGTERM обрабатывает aiohttp.
+    """
+    loop = asyncio.get_event_loop()
+    try:
+        loop.add_signal_handler(signal.SIGTERM, loop.stop)
+    except (NotImplementedError, RuntimeError):
+        # Обработчики сигналов недоступны (Windows или не главный поток)
+        pass
@@ -0,0 +1,227 @@
+# utils/simulator.py
+
+import math
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import NamedTuple
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+from utils.load_shaping import ShiftedTrigger, spread_offset
+
+# Симулятор расписаний в виртуальном времени: по триггерам задач template_{id}
+# рассчитывает все запуски на заданном горизонте (без ожидания и без запуска
+# планировщика) и оценивает нагрузку на очередь отправки.
+#
+# Задачи с одинаковым расписанием срабатывают в одни и те же секунды, поэтому
+# они объединяются в группы, и запуски рассчитываются один раз на группу:
+# 100 000 задач "Ежедневно в 12:00" — одна группа из семи запусков за неделю.
+# Запуски интервальных задач рассчитываются арифметически, без вызова триггера.
+
+class SimJob(NamedTuple):
+    template_id: int
+    trigger: object
+
+class SimulationResult:
+    """Итоги симуляции: отправки по минутам и секундам горизонта и оценки очереди."""
+
+    def __init__(self, start: datetime, end: datetime):
+        self.start = start
+        self.end = end
+        self.jobs = 0
+        self.groups = 0
+        self.total = 0
+        self.per_minute = Counter()     # Номер минуты от start -> отправок
+        self.per_second = Counter()     # Номер секунды от start -> отправок
+        self.over_capacity_minutes = 0  # Минуты, в которые отправок больше, чем бот успевает отправить
+        self.max_backlog = 0.0          # Наибольшая очередь отправки, сообщений
+        self.max_backlog_at = None      # Номер секунды, когда очередь была наибольшей
+        self.max_delay = 0.0            # Наибольшая задержка из-за очереди, секунд
+        self.chat_violations = []       # (ID чата, номер минуты, отправок) — превышения лимита на чат
+        self.elapsed = 0.0
+
+    def minute_time(self, minute: int) -> datetime:
+        return self.start + timedelta(minutes=minute)
+
+    def second_time(self, second: int) -> datetime:
+        return self.start + timedelta(seconds=second)
+
+def _interval_key(trigger, start_ts: float, end_ts: float):
+    """Группа интервальной задачи: (интервал, первый запуск на горизонте) — или None для других триггеров."""
+    base, offset = trigger, 0
+    if isinstance(base, ShiftedTrigger):
+        base, offset = base.trigger, base.offset
+    if not isinstance(base, IntervalTrigger) or base.jitter:
+        return None
+    interval = base.interval_length
+    first = base.start_date.timestamp()
+    # Сдвинутый триггер срабатывает на offset секунд позже исходного
+    now = start_ts - offset
+    if first < now:
+        first += math.ceil((now - first) / interval) * interval
+    first += offset
+    last = min(end_ts, base.end_date.timestamp() + offset) if base.end_date else end_ts
+    # Запуски учитываются с точностью до секунды, как в per_second
+    return ("interval", interval, math.floor(first), last)
+
+def _cron_key(trigger, start: datetime):
+    base, offset = trigger, 0
+    if isinstance(base, ShiftedTrigger):
+        base, offset = base.trigger, base.offset
+    if not isinstance(base, CronTrigger) or base.jitter:
+        return None
+    return ("cron", tuple(str(field) for field in base.fields), str(base.timezone), offset,
+            max(base.start_date, start) if base.start_date else None, base.end_date)
+
+def _fire_seconds(key, trigger, start: datetime, end: datetime) -> list:
+    """Секунды запусков от начала горизонта для группы задач."""
+    start_ts, end_ts = start.timestamp(), end.timestamp()
+    if key is not None and key[0] == "interval":
+        _, interval, first, last = key
+        if first >= last:
+            return []
+        return [int(ts - start_ts) for ts in _frange(first, last, interval)]
+    seconds = []
+    fire_time = trigger.get_next_fire_time(None, start)
+    # Не чаще раза в секунду: ограничение на случай необычных триггеров
+    limit = int(end_ts - start_ts) + 1
+    while fire_time is not None and fire_time < end and len(seconds) < limit:
+        seconds.append(int(fire_time.timestamp() - start_ts))
+        fire_time = trigger.get_next_fire_time(fire_time, fire_time + timedelta(microseconds=1))
+    return seconds
+
+def _frange(first: float, last: float, step: float):
+    count = math.ceil((last - first) / step)
+    return (first + index * step for index in range(count))
+
+def _queue_delays(per_second: Counter, capacity_per_second: float):
+    """
+    Очередь отправки: сообщения поступают в секунды запусков и уходят со скоростью
+    capacity_per_second. Возвращает наибольшую очередь, её секунду и наибольшую задержку.
+    """
+    backlog, previous = 0.0, None
+    max_backlog, max_at = 0.0, None
+    for second in sorted(per_second):
+        if previous is not None:
+            backlog = max(0.0, backlog - capacity_per_second * (second - previous))
+        backlog += per_second[second]
+        previous = second
+        if backlog > max_backlog:
+            max_backlog, max_at = backlog, second
+    return max_backlog, max_at, max_backlog / capacity_per_second
+
+def simulate(jobs, chat_counts: dict, start: datetime, end: datetime, capacity_per_second: float,
+             chat_limit_per_minute: float, shared_chats: dict = None, default_chat_id: int = None) -> SimulationResult:
+    """
+    Симуляция отправок задач jobs (SimJob) на интервале [start, end).
+    chat_counts — количество чатов рассылки шаблонов (шаблон без чатов — одна отправка в default_chat_id).
+    shared_chats — чаты, в которые рассылается больше chat_limit_per_minute шаблонов:
+    ID чата -> список ID шаблонов; для них проверяется лимит отправок в один чат в минуту.
+    """
+    started = time.perf_counter()
+    jobs = list(jobs)
+    result = SimulationResult(start, end)
+    start_ts, end_ts = start.timestamp(), end.timestamp()
+
+    groups = {}                 # Ключ группы -> (триггер, суммарный вес)
+    template_groups = {}        # ID шаблона -> ключ группы
+    for index, job in enumerate(jobs):
+        key = _interval_key(job.trigger, start_ts, end_ts) or _cron_key(job.trigger, start) or ("job", index)
+        trigger, weight = groups.get(key, (job.trigger, 0))
+        groups[key] = (trigger, weight + (chat_counts.get(job.template_id) or 1))
+        template_groups[job.template_id] = key
+        result.jobs += 1
+    result.groups = len(groups)
+
+    fires = {}
+    for key, (trigger, weight) in groups.items():
+        fires[key] = _fire_seconds(key, trigger, start, end)
+        for second in fires[key]:
+            result.per_second[second] += weight
+            result.per_minute[second // 60] += weight
+            result.total += weight
+
+    capacity_per_minute = capacity_per_second * 60
+    result.over_capacity_minutes = sum(1 for count in result.per_minute.values() if count > capacity_per_minute)
+    if result.per_second:
+        result.max_backlog, result.max_backlog_at, result.max_delay = _queue_delays(result.per_second, capacity_per_second)
+
+    shared_chats = dict(shared_chats or {})
+    default_chat = [job.template_id for job in jobs if not chat_counts.get(job.template_id)]
+    if default_chat_id is not None and len(default_chat) > chat_limit_per_minute:
+        shared_chats[default_chat_id] = shared_chats.get(default_chat_id, []) + default_chat
+    for chat_id, template_ids in shared_chats.items():
+        per_minute = Counter()
+        for key, count in Counter(template_groups[t] for t in template_ids if t in template_groups).items():
+            for second in fires[key]:
+                per_minute[second // 60] += count
+        result.chat_violations.extend(
+            (chat_id, minute, count) for minute, count in per_minute.items() if count > chat_limit_per_minute
+        )
+    result.chat_violations.sort(key=lambda violation: (-violation[2], violation[1]))
+    result.elapsed = time.perf_counter() - started
+    return result
+
+def respread(jobs, spread: int) -> list:
+    """Задачи с пересчитанным сдвигом распределения нагрузки (как при SCHEDULE_SPREAD_SECONDS=spread)."""
+    reshaped = []
+    for job in jobs:
+        trigger = job.trigger.trigger if isinstance(job.trigger, ShiftedTrigger) else job.trigger
+        offset = spread_offset(job.template_id, spread)
+        reshaped.append(SimJob(job.template_id, ShiftedTrigger(trigger, offset) if offset else trigger))
+    return reshaped
+
+def format_simulation(result: SimulationResult, capacity_per_second: float, chat_limit_per_minute: float, top: int = 10) -> str:
+    """Текстовый отчёт симуляции."""
+    days = (result.end - result.start).total_seconds() / 86400
+    capacity_per_minute = int(capacity_per_second * 60)
+    lines = [
+        f"Симуляция расписаний с {result.start:%d.%m %H:%M} по {result.end:%d.%m %H:%M} ({days:g} сут): "
+        f"задач {result.jobs}, групп одинаковых расписаний {result.groups}, расчёт {result.elapsed:.2f} с.",
+    ]
+    if not result.total:
+        lines.append("Отправок на этом интервале не запланировано.")
+        return "\n".join(lines)
+    minutes = max(1, round((result.end - result.start).total_seconds() / 60))
+    peak_minute, peak_minute_count = max(result.per_minute.items(), key=lambda item: (item[1], -item[0]))
+    peak_second, peak_second_count = max(result.per_second.items(), key=lambda item: (item[1], -item[0]))
+    lines += [
+        f"Отправок всего: {result.total}, в среднем {result.total / minutes:.1f} в минуту.",
+        f"Пиковая минута: {result.minute_time(peak_minute):%d.%m %H:%M} — {peak_minute_count} "
+        f"(бот успевает {capacity_per_minute} в минуту).",
+        f"Пиковая секунда: {result.second_time(peak_second):%d.%m %H:%M:%S} — {peak_second_count} "
+        f"(лимит {capacity_per_second:g} в секунду).",
+        f"Минут с превышением: {result.over_capacity_minutes}.",
+    ]
+    if result.max_delay >= 1:
+        lines.append(
+            f"Наибольшая очередь отправки: {result.max_backlog:.0f} сообщений "
+            f"({result.second_time(result.max_backlog_at):%d.%m %H:%M:%S}), последние уйдут через {result.max_delay:.0f} с."
+        )
+    else:
+        lines.append("Очередь отправки успевает разойтись в пределах секунды.")
+
+    per_day = Counter()
+    for minute, count in result.per_minute.items():
+        per_day[result.minute_time(minute).date()] += count
+    lines += ["", "По дням:"]
+    lines += [f"{day:%d.%m} — {count}" for day, count in sorted(per_day.items())]
+
+    lines += ["", f"Самые нагруженные минуты (топ {top}):"]
+    for minute, count in sorted(result.per_minute.items(), key=lambda item: (-item[1], item[0]))[:top]:
+        warning = " ⚠️" if count > capacity_per_minute else ""
+        lines.append(f"{result.minute_time(minute):%d.%m %H:%M} — {count}{warning}")
+
+    if result.chat_violations:
+        chats = {chat_id for chat_id, _, _ in result.chat_violations}
+        lines += ["", f"Превышение лимита {chat_limit_per_minute:g} сообщений в минуту на чат: "
+                      f"чатов {len(chats)}, минут {len(result.chat_violations)}. Худшие:"]
+        for chat_id, minute, count in result.chat_violations[:top]:
+            lines.append(f"чат {chat_id}: {result.minute_time(minute):%d.%m %H:%M} — {count}")
+    return "\n".join(lines)
+
+def per_minute_csv(result: SimulationResult):
+    """Строки CSV "минута,отправок" по минутам с отправками."""
+    yield "minute,sends\n"
+    for minute in sorted(result.per_minute):
+        yield f"{result.minute_time(minute):%Y-%m-%d %H:%M},{result.per_minute[minute]}\n"
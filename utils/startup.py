@@ -0,0 +1,62 @@
+# utils/startup.py
+
+import logging
+import os
+import time
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+logger = logging.getLogger(__name__)
+
+def process_age() -> float:
+    """
+    Сколько секунд прошло с запуска процесса (включая старт интерпретатора).
+    Время запуска берётся из /proc с точностью до такта ядра; если его не
+    удаётся прочитать, возвращается 0.
+    """
+    try:
+        with open(f"/proc/{os.getpid()}/stat") as stat:
+            # Поле 22 (starttime) — после имени процесса в скобках, которое может содержать пробелы
+            fields = stat.read().rsplit(")", 1)[1].split()
+        started = int(fields[19]) / os.sysconf("SC_CLK_TCK")
+        return max(time.clock_gettime(time.CLOCK_BOOTTIME) - started, 0.0)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return 0.0
+
+class StartupTimer:
+    """
+    Замер этапов запуска бота. Отсчёт ведётся от запуска процесса: первые
+    этапы — старт интерпретатора и импорт модулей (с момента imports_started).
+    """
+
+    def __init__(self, imports_started: float):
+        now = time.perf_counter()
+        self.started = min(now - process_age(), imports_started)
+        self.phases = [("запуск интерпретатора", imports_started - self.started),
+                       ("импорт модулей", now - imports_started)]
+        self.first_update = None
+        self._last = now
+
+    def mark(self, phase: str):
+        """Завершение этапа phase: его длительность отсчитывается от конца предыдущего."""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def report(self) -> str:
+        phases = ", ".join(f"{phase} {seconds * 1000:.0f} мс" for phase, seconds in self.phases)
+        return f"{phases}; всего {self.elapsed():.2f} с"
+
+class FirstUpdateMiddleware(BaseMiddleware):
+    """Запись времени от запуска процесса до первого полученного обновления."""
+
+    def __init__(self, timer: StartupTimer):
+        super().__init__()
+        self.timer = timer
+
+    async def on_pre_process_update(self, update, data: dict):
+        if self.timer.first_update is None:
+            self.timer.first_update = self.timer.elapsed()
+            logger.info(f"Первое обновление после запуска получено через {self.timer.first_update:.2f} с.")
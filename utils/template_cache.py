@@ -0,0 +1,170 @@
+# utils/template_cache.py
+
+import logging
+from collections import OrderedDict
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.utils import json
+from config import TEMPLATE_CACHE_SIZE
+from models.repository import get_template, get_template_by_name, get_template_chat_ids, get_template_revision
+from utils.media_cache import get_cached_file_id
+from utils.placeholders import compiled_cache
+
+logger = logging.getLogger(__name__)
+
+class PreparedTemplate:
+    """
+    Шаблон с заранее подготовленными аргументами отправки.
+    Клавиатура хранится уже сериализованной в JSON, поэтому при отправке
+    не создаются объекты aiogram и не повторяется сериализация.
+    Текст с подстановками разобран заранее (compiled).
+    """
+    __slots__ = ('id', 'name', 'text', 'compiled', 'image_path', 'file_id', 'reply_markup', 'chat_ids')
+
+    def __init__(self, template, file_id=None, chat_ids=()):
+        self.id = template.id
+        self.name = template.name
+        self.text = template.text
+        self.compiled = compiled_cache.get(template.id, template.version, template.text) if template.text else None
+        self.image_path = template.image_path
+        self.file_id = file_id
+        self.chat_ids = tuple(chat_ids)  # Пустой кортеж — отправка в группу по умолчанию
+        self.reply_markup = None
+        if template.button_text and template.button_url:
+            keyboard = InlineKeyboardMarkup()
+            keyboard.add(InlineKeyboardButton(text=template.button_text, url=template.button_url))
+            self.reply_markup = json.dumps(keyboard.to_python())
+
+class TemplateCache:
+    """
+    LRU-кеш подготовленных шаблонов с доступом по ID и по названию.
+
+    Шаблон загружается из базы за несколько запросов; если за это время шаблон
+    изменили и сбросили из кеша, загруженная копия уже устарела. Поэтому сбросы
+    считаются: загрузка запоминает счётчик (generation) до начала и кладёт
+    результат в кеш, только если счётчик не изменился.
+
+    Изменения, сделанные другими экземплярами бота, сюда не доходят: кеш целиком
+    очищается, когда меняется номер изменения шаблонов в базе (revalidate).
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._by_id = OrderedDict()
+        self._id_by_name = {}
+        self._generations = {}   # ID шаблона -> количество сбросов
+        self._clears = 0         # Полные очистки кеша
+        self._invalidations = 0  # Сбросы любых шаблонов (для загрузки по названию, когда ID ещё неизвестен)
+        self._revision = None    # Номер изменения шаблонов в базе при последней проверке
+
+    def get(self, template_id: int):
+        prepared = self._by_id.get(template_id)
+        if prepared is not None:
+            self._by_id.move_to_end(template_id)
+        return prepared
+
+    def get_by_name(self, name: str):
+        template_id = self._id_by_name.get(name)
+        return self.get(template_id) if template_id is not None else None
+
+    def generation(self, template_id: int = None):
+        """Счётчик сбросов шаблона template_id (без ID — сбросов любых шаблонов)."""
+        if template_id is None:
+            return self._invalidations
+        return self._clears, self._generations.get(template_id, 0)
+
+    def put(self, prepared: PreparedTemplate, generation=None, by_name: bool = False):
+        """
+        Добавление шаблона в кеш. generation — значение generation() до начала загрузки
+        (by_name — загрузка по названию, счётчик всех шаблонов): если шаблон с тех пор
+        сбрасывался, устаревшая копия в кеш не добавляется.
+        """
+        if generation is not None and generation != self.generation(None if by_name else prepared.id):
+            return
+        self._remove(prepared.id)
+        self._by_id[prepared.id] = prepared
+        self._id_by_name[prepared.name] = prepared.id
+        while len(self._by_id) > self.max_size:
+            _, evicted = self._by_id.popitem(last=False)
+            self._id_by_name.pop(evicted.name, None)
+
+    def invalidate(self, template_id: int):
+        """Удаление шаблона из кеша после его изменения или удаления."""
+        self._generations[template_id] = self._generations.get(template_id, 0) + 1
+        self._invalidations += 1
+        self._remove(template_id)
+
+    def _remove(self, template_id: int):
+        prepared = self._by_id.pop(template_id, None)
+        if prepared is not None:
+            self._id_by_name.pop(prepared.name, None)
+
+    def clear(self):
+        self._clears += 1
+        self._invalidations += 1
+        self._generations.clear()
+        self._by_id.clear()
+        self._id_by_name.clear()
+
+    def revalidate(self, revision: int) -> bool:
+        """
+        Очистка кеша, если номер изменения шаблонов в базе отличается от прошлой проверки
+        (при первой проверке — всегда). Возвращает True, если кеш очищен.
+        """
+        previous, self._revision = self._revision, revision
+        if previous == revision:
+            return False
+        self.clear()
+        return True
+
+    def __len__(self):
+        return len(self._by_id)
+
+template_cache = TemplateCache(TEMPLATE_CACHE_SIZE)
+
+async def _prepare(template, generation, by_name: bool = False):
+    file_id = await get_cached_file_id(template.image_path) if template.image_path else None
+    chat_ids = await get_template_chat_ids(template.id)
+    prepared = PreparedTemplate(template, file_id, chat_ids)
+    template_cache.put(prepared, generation, by_name)
+    return prepared
+
+async def sync_template_cache():
+    """
+    Сверка кеша шаблонов с базой: шаблоны и их чаты могли изменить другие экземпляры бота.
+    Вызывается при каждом продлении аренды ведущего.
+    """
+    try:
+        revision = await get_template_revision()
+    except Exception as e:
+        logger.error(f"Ошибка при проверке изменений шаблонов: {e}")
+        return
+    if template_cache.revalidate(revision):
+        logger.debug(f"Шаблоны изменены (изменение {revision}), кеш шаблонов очищен.")
+
+async def get_prepared_template(template_id: int):
+    """
+    Получение подготовленного шаблона по ID.
+    Обращается к базе данных только при промахе кеша.
+    """
+    prepared = template_cache.get(template_id)
+    if prepared is not None:
+        return prepared
+    generation = template_cache.generation(template_id)
+    template = await get_template(template_id)
+    if not template:
+        return None
+    return await _prepare(template, generation)
+
+async def get_prepared_template_by_name(name: str):
+    """
+    Получение подготовленного шаблона по названию.
+    Обращается к базе данных только при промахе кеша.
+    """
+    prepared = template_cache.get_by_name(name)
+    if prepared is not None:
+        return prepared
+    generation = template_cache.generation()
+    template = await get_template_by_name(name)
+    if not template:
+        return None
+    return await _prepare(template, generation, by_name=True)
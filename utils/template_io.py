@@ -0,0 +1,285 @@
+# utils/template_io.py
+
+import asyncio
+import io
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from collections import OrderedDict
+from config import TEMPLATE_IO_BATCH_SIZE
+from models.repository import get_templates_after, get_variables, upsert_templates
+from models.search import search_cache
+from utils.image_store import write_image_stream
+from utils.placeholders import unknown_placeholders
+from utils.template_cache import template_cache
+
+logger = logging.getLogger(__name__)
+
+# Формат архива: templates.jsonl — по одному шаблону на строку:
+# {"name", "text", "button_text", "button_url", "image", "chats", "schedule"},
+# где image — путь к файлу внутри архива (images/<sha256>.jpg) или null,
+# chats — список ID чатов рассылки, schedule — вариант расписания
+# ("Ежедневно в 12:00", "Каждые 12 часов", "Каждую минуту") или null
+TEMPLATES_MEMBER = "templates.jsonl"
+ARCHIVE_IMAGES_DIR = "images"
+
+# Сколько соответствий "файл в архиве -> файл в хранилище" помнить при импорте:
+# шаблоны с одним изображением обычно идут рядом, а память не растёт с архивом
+IMAGE_MEMO_SIZE = 1024
+
+_STRING_FIELDS = ("text", "button_text", "button_url", "image", "schedule")
+
+class ExportResult:
+    """Итоги экспорта шаблонов."""
+
+    def __init__(self):
+        self.templates = 0
+        self.images = 0
+        self.missing_images = 0
+        self.schedules = 0
+        self.started_at = time.monotonic()
+
+    def summary(self) -> str:
+        text = (f"Экспортировано шаблонов: {self.templates}, изображений: {self.images}, "
+                f"расписаний: {self.schedules} за {time.monotonic() - self.started_at:.1f} с.")
+        if self.missing_images:
+            text += f" Не найдено файлов изображений: {self.missing_images}."
+        return text
+
+class ImportResult:
+    """Итоги импорта шаблонов."""
+
+    def __init__(self):
+        self.lines = 0
+        self.created = 0
+        self.updated = 0
+        self.skipped = 0
+        self.images = 0
+        self.missing_images = 0
+        self.schedules = 0
+        self.started_at = time.monotonic()
+
+    def summary(self) -> str:
+        text = (f"Обработано строк: {self.lines}. Создано шаблонов: {self.created}, обновлено: {self.updated}, "
+                f"пропущено с ошибками: {self.skipped}. Изображений: {self.images}, "
+                f"расписаний: {self.schedules}. Время: {time.monotonic() - self.started_at:.1f} с.")
+        if self.missing_images:
+            text += f" Не найдено файлов изображений: {self.missing_images}."
+        return text
+
+# Экспорт
+
+def _add_image(archive: zipfile.ZipFile, image_path: str, added: set, result: ExportResult):
+    """Добавление файла изображения в архив (один раз на файл). Возвращает путь внутри архива."""
+    name = f"{ARCHIVE_IMAGES_DIR}/{os.path.basename(image_path)}"
+    if name in added:
+        return name
+    if not os.path.isfile(image_path):
+        result.missing_images += 1
+        logger.warning(f"Файл изображения '{image_path}' не найден, шаблон экспортируется без изображения.")
+        return None
+    # JPEG не сжимается, поэтому изображения хранятся в архиве как есть
+    archive.write(image_path, name, compress_type=zipfile.ZIP_STORED)
+    added.add(name)
+    result.images += 1
+    return name
+
+def _write_export_batch(archive: zipfile.ZipFile, jsonl, batch: list, schedules: dict, added: set, result: ExportResult):
+    for template, chat_ids in batch:
+        schedule = schedules.get(template.id)
+        record = {
+            "name": template.name,
+            "text": template.text,
+            "button_text": template.button_text,
+            "button_url": template.button_url,
+            "image": _add_image(archive, template.image_path, added, result) if template.image_path else None,
+            "chats": chat_ids,
+            "schedule": schedule,
+        }
+        jsonl.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+        result.templates += 1
+        result.schedules += schedule is not None
+
+def _finish_export(archive: zipfile.ZipFile, jsonl):
+    jsonl.seek(0)
+    with archive.open(TEMPLATES_MEMBER, "w") as member:
+        shutil.copyfileobj(jsonl, member)
+
+async def export_templates(path: str, schedules: dict = None, progress=None) -> ExportResult:
+    """
+    Экспорт всех шаблонов в zip-архив path: templates.jsonl и файлы изображений.
+    Шаблоны читаются из базы пакетами по TEMPLATE_IO_BATCH_SIZE, изображения
+    копируются в архив с диска, поэтому память не зависит от размера архива.
+    schedules — расписания шаблонов (ID -> вариант расписания).
+    progress — корутина, вызываемая с ExportResult после каждого пакета.
+    """
+    loop = asyncio.get_running_loop()
+    schedules = schedules or {}
+    result = ExportResult()
+    added = set()
+    # Строки JSONL копятся во временном файле: пока в архив пишутся изображения,
+    # открыть в нём второй файл на запись нельзя
+    jsonl = tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(path)))
+    archive = zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED)
+    try:
+        after_id = 0
+        while True:
+            batch = await get_templates_after(after_id, TEMPLATE_IO_BATCH_SIZE)
+            if not batch:
+                break
+            after_id = batch[-1][0].id
+            await loop.run_in_executor(None, _write_export_batch, archive, jsonl, batch, schedules, added, result)
+            if progress is not None:
+                await progress(result)
+        await loop.run_in_executor(None, _finish_export, archive, jsonl)
+    finally:
+        jsonl.close()
+        archive.close()
+    logger.info(f"Экспорт шаблонов в '{path}' завершён. {result.summary()}")
+    return result
+
+# Импорт
+
+class _ImportSource:
+    """
+    Источник импорта: архив экспорта или отдельный файл JSONL
+    (тогда пути изображений считаются от каталога этого файла).
+    Строки читаются по одной, изображения — по частям.
+    """
+
+    def __init__(self, path: str):
+        if zipfile.is_zipfile(path):
+            self.archive = zipfile.ZipFile(path)
+            try:
+                member = self.archive.open(TEMPLATES_MEMBER)
+            except KeyError:
+                self.archive.close()
+                raise ValueError(f"в архиве нет файла {TEMPLATES_MEMBER}")
+            self.lines = io.TextIOWrapper(member, encoding="utf-8")
+            self.base_dir = None
+        else:
+            self.archive = None
+            self.lines = open(path, encoding="utf-8")
+            self.base_dir = os.path.dirname(os.path.abspath(path))
+
+    def open_image(self, name: str):
+        if self.archive is not None:
+            return self.archive.open(name)
+        image_path = os.path.abspath(os.path.join(self.base_dir, name))
+        if not image_path.startswith(self.base_dir + os.sep):
+            raise KeyError(name)
+        return open(image_path, "rb")
+
+    def close(self):
+        self.lines.close()
+        if self.archive is not None:
+            self.archive.close()
+
+def _parse_record(data, variable_names) -> dict:
+    """
+    Проверка строки импорта. Возвращает шаблон в виде словаря или выбрасывает ValueError.
+    Подстановки в тексте проверяются так же, как при сохранении шаблона администратором.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("ожидается объект JSON")
+    name = data.get("name")
+    if not isinstance(name, str) or not name.strip():
+        raise ValueError("не указано название шаблона")
+    record = {"name": name.strip()}
+    for field in _STRING_FIELDS:
+        value = data.get(field)
+        if value is not None and not isinstance(value, str):
+            raise ValueError(f"поле {field} должно быть строкой")
+        record[field] = value or None
+    if record["text"]:
+        unknown = unknown_placeholders(record["text"], variable_names)
+        if unknown:
+            raise ValueError("неизвестные подстановки: " + ", ".join(f"{{{name}}}" for name in unknown))
+    chats = data.get("chats") or []
+    if not isinstance(chats, list) or not all(isinstance(chat_id, int) and not isinstance(chat_id, bool) for chat_id in chats):
+        raise ValueError("поле chats должно быть списком ID чатов")
+    record["chats"] = chats
+    return record
+
+def _import_image(source: _ImportSource, name: str, memo: OrderedDict, result: ImportResult):
+    """Копирование изображения из источника в хранилище. Возвращает путь в хранилище или None."""
+    if name in memo:
+        memo.move_to_end(name)
+        return memo[name]
+    try:
+        stream = source.open_image(name)
+    except (KeyError, OSError):
+        result.missing_images += 1
+        logger.warning(f"Изображение '{name}' не найдено в источнике импорта, шаблон импортируется без изображения.")
+        return None
+    with stream:
+        image_path = write_image_stream(stream)
+    result.images += 1
+    memo[name] = image_path
+    if len(memo) > IMAGE_MEMO_SIZE:
+        memo.popitem(last=False)
+    return image_path
+
+def _read_import_batch(source: _ImportSource, size: int, memo: OrderedDict, result: ImportResult, variable_names) -> list:
+    """Чтение следующих size корректных строк. Пустой список — источник прочитан до конца."""
+    records = []
+    for line in source.lines:
+        result.lines += 1
+        if not line.strip():
+            continue
+        try:
+            record = _parse_record(json.loads(line), variable_names)
+        except ValueError as e:
+            result.skipped += 1
+            logger.warning(f"Строка {result.lines} импорта пропущена: {e}")
+            continue
+        record["image_path"] = _import_image(source, record["image"], memo, result) if record["image"] else None
+        records.append(record)
+        if len(records) >= size:
+            break
+    return records
+
+async def import_templates(path: str, set_schedules=None, progress=None) -> ImportResult:
+    """
+    Импорт шаблонов из архива экспорта (или файла JSONL) path.
+    Строки читаются по мере обработки и записываются в базу пакетами по
+    TEMPLATE_IO_BATCH_SIZE, каждый пакет — одной транзакцией. Шаблон
+    с существующим названием обновляется, его чаты дополняются чатами из архива.
+    Строки с ошибками, в том числе с неизвестными подстановками в тексте (переменные
+    читаются перед каждым пакетом), пропускаются и учитываются в итогах.
+    set_schedules — корутина, получающая список пар (ID шаблона, вариант расписания)
+    и возвращающая количество установленных расписаний; без неё расписания не меняются.
+    progress — корутина, вызываемая с ImportResult после каждого пакета.
+    """
+    loop = asyncio.get_running_loop()
+    result = ImportResult()
+    memo = OrderedDict()
+    source = await loop.run_in_executor(None, _ImportSource, path)
+    try:
+        while True:
+            variable_names = await get_variables()
+            records = await loop.run_in_executor(
+                None, _read_import_batch, source, TEMPLATE_IO_BATCH_SIZE, memo, result, variable_names,
+            )
+            if not records:
+                break
+            ids, existing = await upsert_templates(records)
+            result.created += len(ids.keys() - existing)
+            result.updated += len(existing)
+            for template_id in ids.values():
+                template_cache.invalidate(template_id)
+            if set_schedules is not None:
+                schedules = [(ids[record["name"]], record["schedule"]) for record in records if record["schedule"]]
+                if schedules:
+                    result.schedules += await set_schedules(schedules)
+            if progress is not None:
+                await progress(result)
+    finally:
+        await loop.run_in_executor(None, source.close)
+        search_cache.clear()
+    logger.info(f"Импорт шаблонов из '{path}' завершён. {result.summary()}")
+    return result
@@ -0,0 +1,101 @@
+# utils/transport.py
+
+import asyncio
+import io
+import logging
+import os
+import pathlib
+import shutil
+import aiohttp
+from aiohttp.helpers import sentinel
+from aiogram import Bot
+from aiogram.bot.api import TelegramAPIServer, TELEGRAM_PRODUCTION
+from aiogram.types import InputFile
+from config import (
+    BOT_API_URL, BOT_API_LOCAL, BOT_API_CONNECTIONS, BOT_API_KEEPALIVE, BOT_API_DNS_TTL,
+    BOT_API_TIMEOUT, BOT_API_METHOD_TIMEOUTS,
+)
+
+logger = logging.getLogger(__name__)
+
+def api_server(base_url: str) -> TelegramAPIServer:
+    """Сервер Bot API по адресу base_url (пустой адрес — api.telegram.org)."""
+    return TelegramAPIServer.from_base(base_url) if base_url else TELEGRAM_PRODUCTION
+
+def _copy_local_file(source: str, destination, chunk_size: int, seek: bool, make_dirs: bool):
+    if isinstance(destination, io.IOBase):
+        with open(source, "rb") as f:
+            shutil.copyfileobj(f, destination, chunk_size)
+        if seek:
+            destination.seek(0)
+        return destination
+    if make_dirs and os.path.dirname(destination):
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+    shutil.copyfile(source, destination)
+    return open(destination, "rb")
+
+class TransportBot(Bot):
+    """
+    Бот с настраиваемым HTTP-транспортом Bot API.
+
+    Запросы идут через общий пул соединений с keep-alive и кешем DNS: рассылка
+    не открывает новое TLS-соединение на каждое сообщение. Методы могут иметь
+    свои таймауты (загрузка изображения дольше отправки текста). Адрес сервера
+    можно заменить на собственный telegram-bot-api; с local_files сервер
+    работает с файлами на диске, без загрузки и скачивания по HTTP.
+    """
+
+    def __init__(self, token: str, api_url: str = BOT_API_URL, local_files: bool = BOT_API_LOCAL,
+                 connections: int = BOT_API_CONNECTIONS, keepalive: float = BOT_API_KEEPALIVE,
+                 dns_ttl: int = BOT_API_DNS_TTL, timeout: float = BOT_API_TIMEOUT,
+                 method_timeouts: dict = None, **kwargs):
+        super().__init__(token=token, connections_limit=connections, timeout=timeout or None,
+                         server=api_server(api_url), **kwargs)
+        self.local_files = local_files
+        if method_timeouts is None:
+            method_timeouts = BOT_API_METHOD_TIMEOUTS
+        self.method_timeouts = {method: aiohttp.ClientTimeout(total=seconds) for method, seconds in method_timeouts.items()}
+        if keepalive:
+            self._connector_init["keepalive_timeout"] = keepalive
+        else:
+            self._connector_init["force_close"] = True
+        if dns_ttl:
+            self._connector_init["ttl_dns_cache"] = dns_ttl
+        else:
+            self._connector_init["use_dns_cache"] = False
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        timeout = self.method_timeouts.get(method)
+        # Таймаут, заданный вызывающим (например, долгим опросом getUpdates), не заменяется
+        if timeout is None or self._ctx_timeout.get(None) is not None:
+            return await super().request(method, data, files, **kwargs)
+        with self.request_timeout(timeout):
+            return await super().request(method, data, files, **kwargs)
+
+    async def download_file(self, file_path, destination=None, timeout=sentinel, chunk_size=65536,
+                            seek=True, destination_dir=None, make_dirs=True):
+        """
+        Скачивание файла. Сервер с --local вместо ссылки для скачивания возвращает
+        путь к файлу на диске — тогда файл копируется, без запроса по HTTP.
+        """
+        if not (self.local_files and os.path.isabs(file_path)):
+            return await super().download_file(file_path, destination, timeout, chunk_size, seek,
+                                               destination_dir, make_dirs)
+        if destination and destination_dir:
+            raise ValueError("Use only one of the parameters:destination or destination_dir.")
+        if destination is None and destination_dir is None:
+            destination = io.BytesIO()
+        elif destination_dir:
+            destination = os.path.join(destination_dir, os.path.basename(file_path))
+        return await asyncio.get_running_loop().run_in_executor(
+            None, _copy_local_file, file_path, destination, chunk_size, seek, make_dirs,
+        )
+
+def upload_source(bot: Bot, path: str):
+    """
+    Файл для отправки: ссылка file:// для локального сервера Bot API
+    (сервер читает файл сам, без ограничения размера загрузки), иначе загрузка файла.
+    """
+    if getattr(bot, "local_files", False):
+        return pathlib.Path(path).resolve().as_uri()
+    return InputFile(path)
@@ -0,0 +1,52 @@
+# utils/webhook.py
+
+import logging
+from aiohttp import web
+from aiogram import Dispatcher
+from aiogram.dispatcher.webhook import WebhookRequestHandler, BOT_DISPATCHER_KEY
+from aiogram.utils.executor import Executor
+from config import WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBAPP_HOST, WEBAPP_PORT
+
+logger = logging.getLogger(__name__)
+
+# Заголовок, в котором Telegram передаёт secret_token, указанный при установке вебхука
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+WEBHOOK_SECRET_KEY = "WEBHOOK_SECRET"
+
+class SecretWebhookRequestHandler(WebhookRequestHandler):
+    """
+    Обработчик вебхука, принимающий обновления только с верным секретным токеном.
+    """
+
+    async def post(self):
+        secret = self.request.app.get(WEBHOOK_SECRET_KEY)
+        if secret and self.request.headers.get(SECRET_TOKEN_HEADER) != secret:
+            logger.warning(f"Отклонён запрос к вебхуку с неверным секретным токеном от {self.request.remote}.")
+            raise web.HTTPUnauthorized()
+        return await super().post()
+
+def configure_webhook_app(dp: Dispatcher, app: web.Application, path: str = WEBHOOK_PATH, secret: str = WEBHOOK_SECRET):
+    """
+    Подключение обработчика вебхука к приложению aiohttp.
+    """
+    app.router.add_route('*', path, SecretWebhookRequestHandler, name='webhook_handler')
+    app[BOT_DISPATCHER_KEY] = dp
+    app[WEBHOOK_SECRET_KEY] = secret
+    return app
+
+def start_webhook_mode(dp: Dispatcher, on_startup, on_shutdown):
+    """
+    Запуск бота в режиме вебхука на сервере aiohttp.
+    При запуске вебхук регистрируется в Telegram, поэтому переключение
+    из режима опроса не требует ручных действий.
+    """
+    async def set_webhook(dispatcher: Dispatcher):
+        await dispatcher.bot.set_webhook(WEBHOOK_URL, secret_token=WEBHOOK_SECRET, drop_pending_updates=True)
+        logger.info(f"Вебхук установлен: {WEBHOOK_URL}")
+
+    executor = Executor(dp)
+    executor.on_startup([set_webhook, on_startup])
+    executor.on_shutdown(on_shutdown)
+    executor.set_webhook(web_app=configure_webhook_app(dp, web.Application()))
+    logger.info(f"Сервер вебхука запускается на {WEBAPP_HOST}:{WEBAPP_PORT}{WEBHOOK_PATH}.")
+    executor.run_app(host=WEBAPP_HOST, port=WEBAPP_PORT)